@@ -85,3 +85,33 @@ class AffineTransformation:
         J = np.array([[v1[0] - v0[0], v2[0] - v0[0]], [v1[1] - v0[1], v2[1] - v0[1]]])
 
         return np.linalg.det(J)
+
+
+def get_batch_geometry(vertices, triangle_array):
+    """
+    Gives the jacobians, determinants and inverse jacobians of the affine transformations of many cells at once
+    :param vertices: The vertices array (2,N)
+    :param triangle_array: Array (T,3) of the vertex ids of the cells
+    :return: Arrays of the jacobians (T,2,2), their determinants (T) and their inverses (T,2,2)
+    """
+    v0 = vertices[:, triangle_array[:, 0]]
+    v1 = vertices[:, triangle_array[:, 1]]
+    v2 = vertices[:, triangle_array[:, 2]]
+
+    J = np.zeros((np.shape(triangle_array)[0], 2, 2))
+    J[:, :, 0] = (v1 - v0).T
+    J[:, :, 1] = (v2 - v0).T
+
+    # Check regularity
+    detJ = J[:, 0, 0] * J[:, 1, 1] - J[:, 0, 1] * J[:, 1, 0]
+    singular = np.where(np.isclose(detJ, 0))[0]
+    if np.shape(singular)[0] > 0:
+        raise ValueError('J is singular and can therfore not be inverted for the cells ' + str(singular))
+
+    J_inv = np.zeros_like(J)
+    J_inv[:, 0, 0] = J[:, 1, 1] / detJ
+    J_inv[:, 0, 1] = -J[:, 0, 1] / detJ
+    J_inv[:, 1, 0] = -J[:, 1, 0] / detJ
+    J_inv[:, 1, 1] = J[:, 0, 0] / detJ
+
+    return J, detJ, J_inv
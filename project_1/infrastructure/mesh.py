@@ -6,8 +6,16 @@ Generates a simplex mesh based on the input
 """
 
 import numpy as np
+import scipy.sparse as sparse
 
 from project_1.infrastructure.triangle import Triangle
+from project_1.infrastructure.affine_transformation import get_batch_geometry
+from project_1.infrastructure.sparsity_pattern import SparsityPattern
+from project_1.infrastructure.mesh_quality import get_element_quality, find_bad_elements, check_mesh_quality
+from project_1.infrastructure.partitioning import partition_mesh, get_subdomains
+from project_1.infrastructure.renumbering import get_rcm_order, get_space_filling_curve_order
+from project_1.infrastructure.topology import get_edge_data, get_triangle_neighbors, get_vertex_triangles, \
+    get_boundary_edges
 from matplotlib.patches import Polygon
 import matplotlib.pyplot as plt
 
@@ -27,6 +35,62 @@ class Mesh:
         """
         self.generate_mesh(sx, sy, h, w)
 
+    @classmethod
+    def from_arrays(cls, vertices, triangle_array, boundary_facets=None, boundary_facet_tags=None, orient=True):
+        """
+        Creates a mesh from arrays, e.g. of an imported mesh
+        :param vertices: Array (2,N) of the node coordinates
+        :param triangle_array: Array (T,3) of the vertex ids of the triangles
+        :param boundary_facets: Array (B,2) of the vertex ids of tagged boundary edges
+        :param boundary_facet_tags: Array (B) of the tags of the boundary edges
+        :param orient: Should clockwise triangles be reordered to counter clockwise
+        :return: The mesh
+        """
+        mesh = cls.__new__(cls)
+        mesh.set_arrays(vertices, triangle_array, boundary_facets, boundary_facet_tags, orient)
+        return mesh
+
+    def set_arrays(self, vertices, triangle_array, boundary_facets=None, boundary_facet_tags=None, orient=True):
+        """
+        Sets the mesh from arrays
+        :param vertices: Array (2,N) of the node coordinates
+        :param triangle_array: Array (T,3) of the vertex ids of the triangles
+        :param boundary_facets: Array (B,2) of the vertex ids of tagged boundary edges
+        :param boundary_facet_tags: Array (B) of the tags of the boundary edges
+        :param orient: Should clockwise triangles be reordered to counter clockwise
+        """
+        if orient:
+            triangle_array = np.array(triangle_array, dtype=int)
+            v0 = vertices[:, triangle_array[:, 0]]
+            e1 = vertices[:, triangle_array[:, 1]] - v0
+            e2 = vertices[:, triangle_array[:, 2]] - v0
+            clockwise = e1[0] * e2[1] - e1[1] * e2[0] < 0
+            triangle_array[clockwise] = triangle_array[clockwise][:, [0, 2, 1]]
+
+        if boundary_facets is None:
+            boundary_facets = np.zeros((0, 2), dtype=int)
+        if boundary_facet_tags is None:
+            boundary_facet_tags = np.ones(np.shape(boundary_facets)[0], dtype=int)
+
+        self.vertices = vertices
+        self.triangle_array = triangle_array
+        self.boundary_facets = boundary_facets
+        self.boundary_facet_tags = boundary_facet_tags
+        self.original_node_ids = np.arange(np.shape(vertices)[1])
+        self.original_triangle_ids = np.arange(np.shape(triangle_array)[0])
+        self._triangles = None
+        self._reset_cache()
+
+    @property
+    def triangles(self):
+        """
+        List of the triangles as Triangle objects. Built from the triangle array on first use.
+        :return: The list of triangles
+        """
+        if self._triangles is None:
+            self._triangles = [Triangle(v[0], v[1], v[2], n) for n, v in enumerate(self.triangle_array)]
+        return self._triangles
+
     def generate_mesh(self, supportsx, supportsy, height=1, width=1):
         """
         Generates a simplex mesh in 2D on a rectangle
@@ -59,10 +123,226 @@ class Mesh:
                         tri_id += 1
                 id += 1
 
-        self.triangles = trianglelist
+        # Boundary facets, counter clockwise. Tags: 1 bottom, 2 right, 3 top, 4 left
+        ids = np.arange(supportsx * supportsy).reshape(supportsy, supportsx)
+        sides = [ids[0, :], ids[:, -1], ids[-1, ::-1], ids[::-1, 0]]
+        self.boundary_facets = np.concatenate([np.column_stack((side[:-1], side[1:])) for side in sides])
+        self.boundary_facet_tags = np.concatenate([np.full(np.shape(side)[0] - 1, tag) for tag, side in
+                                                   zip(range(1, 5), sides)])
+
+        self._triangles = trianglelist
+        self.triangle_array = np.array([triangle.v for triangle in trianglelist], dtype=int).reshape(-1, 3)
         self.vertices = vertices
         self.supportsx = supportsx
         self.supportsy = supportsy
+        self.original_node_ids = np.arange(supportsx * supportsy)
+        self.original_triangle_ids = np.arange(len(trianglelist))
+        self._reset_cache()
+
+    def _reset_cache(self):
+        """
+        Drops all data derived from the vertices and the connectivity
+        """
+        self._geometry = None
+        self._sparsity_pattern = None
+        self._edge_data = None
+        self._neighbors = None
+        self._vertex_triangles = None
+        self._quality = None
+
+    def renumber(self, method='rcm', triangle_method=None):
+        """
+        Renumbers the nodes and triangles in place. The vertices, the connectivity and the boundary facets are
+        permuted consistently; original_node_ids and original_triangle_ids keep track of the original numbering.
+        :param method: Node ordering, 'rcm' (reverse Cuthill-McKee), 'hilbert' or 'morton'
+        :param triangle_method: Triangle ordering, 'hilbert' or 'morton' along the curve through the centroids.
+        If None, the triangles are sorted by their lowest new node id
+        :return: The node permutation, i.e. the old index of every new node
+        """
+        if method == 'rcm':
+            node_order = get_rcm_order(self.get_sparsity_pattern())
+        else:
+            node_order = get_space_filling_curve_order(self.vertices, method)
+
+        new_ids = np.argsort(node_order)
+        triangle_array = new_ids[self.triangle_array]
+
+        if triangle_method is None:
+            sorted_ids = np.sort(triangle_array, axis=1)
+            triangle_order = np.lexsort((sorted_ids[:, 2], sorted_ids[:, 1], sorted_ids[:, 0]))
+        else:
+            centroids = np.mean(self.vertices[:, self.triangle_array], axis=2)
+            triangle_order = get_space_filling_curve_order(centroids, triangle_method)
+
+        self.vertices = self.vertices[:, node_order]
+        self.triangle_array = triangle_array[triangle_order]
+        self.boundary_facets = new_ids[self.boundary_facets]
+        self.original_node_ids = self.original_node_ids[node_order]
+        self.original_triangle_ids = self.original_triangle_ids[triangle_order]
+        self._triangles = None
+        self._reset_cache()
+
+        return node_order
+
+    def to_original_numbering(self, u):
+        """
+        Maps nodal values from the current numbering back to the original numbering of the mesh
+        :param u: Array with the node values along the first axis
+        :return: The values in the original numbering
+        """
+        u = np.asarray(u)
+        u_original = np.zeros_like(u)
+        u_original[self.original_node_ids] = u
+        return u_original
+
+    def from_original_numbering(self, u):
+        """
+        Maps nodal values from the original numbering to the current numbering of the mesh
+        :param u: Array with the node values along the first axis
+        :return: The values in the current numbering
+        """
+        return np.asarray(u)[self.original_node_ids]
+
+    def get_element_geometry(self):
+        """
+        Gives the jacobians of the affine transformations of all triangles. Computed once and cached.
+        :return: Arrays of the jacobians (T,2,2), their determinants (T) and their inverses (T,2,2)
+        """
+        if self._geometry is None:
+            self._geometry = get_batch_geometry(self.vertices, self.triangle_array)
+        return self._geometry
+
+    def get_quality(self):
+        """
+        Gives the quality metrics of all triangles, see get_element_quality. Computed once and cached.
+        :return: Dictionary of arrays (T) of the metrics
+        """
+        if self._quality is None:
+            self._quality = get_element_quality(self.vertices, self.triangle_array)
+        return self._quality
+
+    def find_bad_elements(self, **thresholds):
+        """
+        Finds the triangles violating quality thresholds
+        :param thresholds: Keyword arguments of find_bad_elements, e.g. min_angle or max_aspect_ratio
+        :return: Sorted array of the ids of the bad triangles
+        """
+        return find_bad_elements(self.get_quality(), **thresholds)
+
+    def check_quality(self, **thresholds):
+        """
+        Raises a ValueError listing the bad triangles if any triangle is degenerate, inverted or violates the thresholds
+        :param thresholds: Keyword arguments of find_bad_elements
+        :return: The quality summary
+        """
+        return check_mesh_quality(self.get_quality(), **thresholds)
+
+    def get_sparsity_pattern(self):
+        """
+        Gives the CSR sparsity pattern of the P1 matrices on this mesh. Computed once and cached.
+        :return: The SparsityPattern
+        """
+        if self._sparsity_pattern is None:
+            self._sparsity_pattern = SparsityPattern(self.triangle_array, np.shape(self.vertices)[1])
+        return self._sparsity_pattern
+
+    def refine_uniform(self):
+        """
+        Refines every triangle into four by connecting its edge midpoints (red refinement). The midpoint of edge e
+        gets the node id N + e, the coarse nodes keep their ids and boundary facets are split keeping their tags.
+        :return: The fine mesh and the sparse prolongation matrix (N_fine, N) interpolating P1 coefficients
+        """
+        varnr = np.shape(self.vertices)[1]
+        edges = self.get_edges()
+        edge_nr = np.shape(edges)[0]
+        midpoints = (self.vertices[:, edges[:, 0]] + self.vertices[:, edges[:, 1]]) / 2
+
+        v0, v1, v2 = self.triangle_array.T
+        m0, m1, m2 = (varnr + self.get_triangle_edges()).T
+        triangle_array = np.concatenate((np.column_stack((v0, m2, m1)), np.column_stack((m2, v1, m0)),
+                                         np.column_stack((m1, m0, v2)), np.column_stack((m0, m1, m2))))
+
+        # Edge id of every facet
+        facets = self.boundary_facets
+        keys = edges[:, 0] * varnr + edges[:, 1]
+        facet_keys = np.min(facets, axis=1) * varnr + np.max(facets, axis=1)
+        m = varnr + np.searchsorted(keys, facet_keys)
+        boundary_facets = np.concatenate((np.column_stack((facets[:, 0], m)), np.column_stack((m, facets[:, 1]))))
+        boundary_facet_tags = np.tile(self.boundary_facet_tags, 2)
+
+        rows = np.concatenate((np.arange(varnr), np.repeat(varnr + np.arange(edge_nr), 2)))
+        cols = np.concatenate((np.arange(varnr), edges.ravel()))
+        data = np.concatenate((np.ones(varnr), np.full(2 * edge_nr, 0.5)))
+        P = sparse.csr_matrix((data, (rows, cols)), shape=(varnr + edge_nr, varnr))
+
+        fine = Mesh.from_arrays(np.concatenate((self.vertices, midpoints), axis=1), triangle_array, boundary_facets,
+                                boundary_facet_tags, orient=False)
+        return fine, P
+
+    def partition(self, parts, method='rcb', overlap=0):
+        """
+        Splits the mesh into subdomains with balanced triangle counts
+        :param parts: Number of subdomains
+        :param method: 'rcb', 'inertial', 'spectral' or 'greedy', see partition_mesh
+        :param overlap: Number of layers of triangles added around every subdomain
+        :return: List of the subdomains
+        """
+        return get_subdomains(self, partition_mesh(self, parts, method), overlap)
+
+    def get_edges(self):
+        """
+        Gives the unique edges of the mesh. Computed once and cached together with the edge adjacency.
+        :return: Array (E,2) of the vertex ids of the edges, ascending within every edge
+        """
+        return self._get_edge_data()[0]
+
+    def get_triangle_edges(self):
+        """
+        Gives the edges of every triangle, local edge k lies opposite vertex k
+        :return: Array (T,3) of edge ids
+        """
+        return self._get_edge_data()[1]
+
+    def get_edge_triangles(self):
+        """
+        Gives the triangles adjacent to every edge
+        :return: Array (E,2) of triangle ids, the second one is -1 on the boundary
+        """
+        return self._get_edge_data()[2]
+
+    def get_neighbors(self):
+        """
+        Gives the neighbors of every triangle. Computed once and cached.
+        :return: Array (T,3) of the triangle across the edge opposite every vertex, -1 on the boundary
+        """
+        if self._neighbors is None:
+            self._neighbors = get_triangle_neighbors(self.get_triangle_edges(), self.get_edge_triangles())
+        return self._neighbors
+
+    def get_vertex_triangles(self):
+        """
+        Gives the triangles around every vertex in CSR format. Computed once and cached.
+        :return: Arrays indptr and indices, the triangles of vertex i are indices[indptr[i]:indptr[i+1]]
+        """
+        if self._vertex_triangles is None:
+            self._vertex_triangles = get_vertex_triangles(self.triangle_array, np.shape(self.vertices)[1])
+        return self._vertex_triangles
+
+    def get_boundary_edges(self):
+        """
+        Gives the edges with only one adjacent triangle
+        :return: Array (B,2) of the vertex ids of the boundary edges, counter clockwise as in their triangle
+        """
+        return get_boundary_edges(self.triangle_array, self._get_edge_data())
+
+    def _get_edge_data(self):
+        """
+        Builds the edge tables once
+        :return: The edges, the triangle to edge map and the edge to triangle map
+        """
+        if self._edge_data is None:
+            self._edge_data = get_edge_data(self.triangle_array)
+        return self._edge_data
 
     def draw(self):
         """
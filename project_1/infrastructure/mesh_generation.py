@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements a Delaunay mesh generator for polygonal domains with holes. The boundary is sampled according to a sizing
+function h(x), the points are triangulated with scipy.spatial.Delaunay and circumcenters of too large or badly shaped
+triangles are inserted until the mesh meets the size and angle bounds (Ruppert's refinement).
+"""
+
+import numpy as np
+from matplotlib.path import Path
+from scipy.spatial import Delaunay, cKDTree
+
+from project_1.infrastructure.mesh import Mesh
+
+
+def generate_polygon_mesh(outer, holes=None, h=0.1, min_angle=20, max_iterations=50, seed=0):
+    """
+    Generates a triangular mesh of a polygon with holes. Boundary facets follow the order of the polygon corners and
+    are tagged 1 on the outer polygon and 2, 3, ... on the holes.
+    :param outer: Array (P,2) of the corners of the outer polygon
+    :param holes: List of arrays (P,2) of the corners of the holes
+    :param h: The desired edge length, either a number or a function of an array (2,N) of points
+    :param min_angle: The smallest angle in degrees the refinement aims for, at most about 20 to guarantee termination
+    :param max_iterations: Maximal number of refinement sweeps
+    :param seed: Seed for the thinning of the interior points
+    :return: The mesh
+    """
+    polygons = [np.asarray(outer, dtype=float)] + [np.asarray(hole, dtype=float) for hole in (holes or [])]
+    h_function = get_sizing_function(h)
+    paths = [Path(polygon) for polygon in polygons]
+
+    points, segments, segment_tags = sample_boundary(polygons, h_function)
+    points = np.concatenate((points, get_interior_points(polygons, paths, points, segments, h_function, seed)))
+
+    # Circumradius to shortest edge ratio of a triangle with the smallest angle min_angle
+    max_ratio = 1 / (2 * np.sin(np.radians(min_angle)))
+
+    for iteration in range(max_iterations):
+        triangle_array = triangulate_domain(points, paths)
+
+        # Split boundary segments that are not edges of the triangulation or have a vertex in their diametral
+        # circle, until the boundary is conforming and circumcenters outside the domain always encroach a segment
+        split = np.logical_or(get_missing_segments(triangle_array, segments),
+                              get_encroached_by_vertices(points, segments, triangle_array))
+        if np.any(split):
+            points, segments, segment_tags = split_segments(points, segments, segment_tags, np.where(split)[0])
+            continue
+
+        centers, radius, shortest, centroids = get_circumcircles(points, triangle_array)
+        bad = np.logical_or(radius > h_function(centroids.T) / np.sqrt(3) * 1.5, radius > max_ratio * shortest)
+        if not np.any(bad):
+            break
+
+        # Largest triangles first, circumcenters encroaching a segment split the segment instead
+        order = np.argsort(-radius[bad])
+        centers = centers[bad][order]
+        encroached = get_encroached_segments(points, segments, centers)
+        if np.any(encroached >= 0):
+            points, segments, segment_tags = split_segments(points, segments, segment_tags,
+                                                            np.unique(encroached[encroached >= 0]))
+        centers = centers[encroached < 0]
+        centers = centers[inside_domain(centers, paths)]
+        centers = select_separated_points(centers, h_function(centers.T) / 2)
+        points = np.concatenate((points, centers))
+    else:
+        print("[Info] Mesh refinement stopped after " + str(max_iterations) + " iterations")
+
+    triangle_array = triangulate_domain(points, paths)
+
+    # Remove points that are not part of any triangle
+    used = np.unique(triangle_array)
+    new_ids = np.full(np.shape(points)[0], -1, dtype=int)
+    new_ids[used] = np.arange(np.shape(used)[0])
+
+    return Mesh.from_arrays(points[used].T.copy(), new_ids[triangle_array], new_ids[segments], segment_tags)
+
+
+def get_sizing_function(h):
+    """
+    Wraps a constant edge length into a sizing function
+    :param h: Number or function of an array (2,N) of points
+    :return: The sizing function
+    """
+    if callable(h):
+        return lambda x: np.broadcast_to(np.asarray(h(x), dtype=float), np.shape(x)[1:])
+    return lambda x: np.full(np.shape(x)[1:], float(h))
+
+
+def sample_boundary(polygons, h_function):
+    """
+    Places points along the edges of the polygons with a spacing given by the sizing function
+    :param polygons: List of arrays (P,2) of the polygon corners, the first one is the outer boundary
+    :param h_function: The sizing function
+    :return: Array (N,2) of the points, array (S,2) of the boundary segments and array (S) of their tags
+    """
+    points = []
+    segments = []
+    tags = []
+    offset = 0
+    for k, polygon in enumerate(polygons):
+        polygon_points = []
+        for a, b in zip(polygon, np.roll(polygon, -1, axis=0)):
+            # Number of pieces from the mean size along the edge
+            s = np.linspace(0, 1, 11)
+            samples = a[:, np.newaxis] + (b - a)[:, np.newaxis] * s
+            pieces = max(1, int(np.ceil(np.linalg.norm(b - a) / np.mean(h_function(samples)))))
+            s = np.arange(pieces) / pieces
+            polygon_points.append(a + (b - a) * s[:, np.newaxis])
+        polygon_points = np.concatenate(polygon_points)
+
+        nr = np.shape(polygon_points)[0]
+        ids = offset + np.arange(nr)
+        points.append(polygon_points)
+        segments.append(np.column_stack((ids, np.roll(ids, -1))))
+        tags.append(np.full(nr, 1 if k == 0 else k + 1, dtype=int))
+        offset += nr
+
+    return np.concatenate(points), np.concatenate(segments), np.concatenate(tags)
+
+
+def get_interior_points(polygons, paths, boundary_points, segments, h_function, seed=0):
+    """
+    Gives initial interior points on a triangular lattice, thinned where the sizing function is larger than the
+    lattice spacing and kept away from the boundary
+    :param polygons: List of arrays (P,2) of the polygon corners
+    :param paths: The matplotlib paths of the polygons
+    :param boundary_points: Array (N,2) of the boundary points
+    :param segments: Array (S,2) of the vertex ids of the boundary segments
+    :param h_function: The sizing function
+    :param seed: Seed of the random thinning
+    :return: Array (M,2) of the points
+    """
+    lower = np.min(polygons[0], axis=0)
+    upper = np.max(polygons[0], axis=0)
+
+    # Lattice spacing from the median size over the bounding box
+    samples = np.stack(np.meshgrid(np.linspace(lower[0], upper[0], 20), np.linspace(lower[1], upper[1], 20)))
+    spacing = np.median(h_function(samples.reshape(2, -1)))
+
+    y = np.arange(lower[1], upper[1] + spacing, spacing * np.sqrt(3) / 2)
+    x = np.arange(lower[0], upper[0] + spacing, spacing)
+    xv, yv = np.meshgrid(x, y)
+    xv[1::2] += spacing / 2
+    points = np.column_stack((xv.ravel(), yv.ravel()))
+    points = points[inside_domain(points, paths)]
+
+    h = h_function(points.T)
+    keep = np.random.RandomState(seed).random_sample(np.shape(points)[0]) < (spacing / h) ** 2
+
+    # Distance to the boundary, measured on eight samples per segment
+    s = np.arange(8) / 8
+    a = boundary_points[segments[:, 0]]
+    b = boundary_points[segments[:, 1]]
+    samples = (a[:, np.newaxis, :] + (b - a)[:, np.newaxis, :] * s[:, np.newaxis]).reshape(-1, 2)
+    distance = cKDTree(samples).query(points)[0]
+    keep = np.logical_and(keep, distance > 0.5 * h)
+    return points[keep]
+
+
+def inside_domain(points, paths):
+    """
+    Tests if points lie inside the outer polygon and outside all holes
+    :param points: Array (N,2) of the points
+    :param paths: The matplotlib paths, the first one is the outer boundary
+    :return: Boolean array (N)
+    """
+    if np.shape(points)[0] == 0:
+        return np.zeros(0, dtype=bool)
+    inside = paths[0].contains_points(points)
+    for path in paths[1:]:
+        inside = np.logical_and(inside, np.logical_not(path.contains_points(points)))
+    return inside
+
+
+def triangulate_domain(points, paths):
+    """
+    Delaunay triangulation of the points, restricted to the domain
+    :param points: Array (N,2) of the points
+    :param paths: The matplotlib paths of the polygons
+    :return: Array (T,3) of the vertex ids of the triangles inside the domain
+    """
+    triangle_array = Delaunay(points).simplices
+
+    # Qhull may give flat simplices along collinear points of the convex hull
+    a = points[triangle_array[:, 0]]
+    b = points[triangle_array[:, 1]] - a
+    c = points[triangle_array[:, 2]] - a
+    area = np.abs(b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    extent = np.max(np.ptp(points, axis=0))
+    triangle_array = triangle_array[area > 1e-12 * extent ** 2]
+
+    centroids = np.mean(points[triangle_array], axis=1)
+    return triangle_array[inside_domain(centroids, paths)]
+
+
+def get_missing_segments(triangle_array, segments):
+    """
+    Tests which boundary segments are not an edge of the triangulation
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :param segments: Array (S,2) of the vertex ids of the segments
+    :return: Boolean array (S)
+    """
+    edges = np.concatenate((triangle_array[:, [1, 2]], triangle_array[:, [2, 0]], triangle_array[:, [0, 1]]))
+    edges = np.sort(edges, axis=1)
+    varnr = np.max(triangle_array) + 1 if np.size(triangle_array) else 0
+    varnr = max(varnr, np.max(segments) + 1)
+    edge_keys = edges[:, 0] * varnr + edges[:, 1]
+    segment_keys = np.min(segments, axis=1) * varnr + np.max(segments, axis=1)
+    return np.logical_not(np.isin(segment_keys, edge_keys))
+
+
+def get_encroached_by_vertices(points, segments, triangle_array):
+    """
+    Tests which boundary segments contain a vertex of the triangulation in their diametral circle. It suffices to
+    check the vertices opposite to the segments.
+    :param points: Array (N,2) of the points
+    :param segments: Array (S,2) of the vertex ids of the segments
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :return: Boolean array (S)
+    """
+    varnr = np.shape(points)[0]
+    keys = np.min(segments, axis=1) * varnr + np.max(segments, axis=1)
+    encroached = np.zeros(np.shape(segments)[0], dtype=bool)
+    for k in range(3):
+        edges = np.sort(triangle_array[:, [(k + 1) % 3, (k + 2) % 3]], axis=1)
+        edge_keys = edges[:, 0] * varnr + edges[:, 1]
+        order = np.argsort(edge_keys)
+        position = np.minimum(np.searchsorted(edge_keys[order], keys), np.shape(order)[0] - 1)
+        found = edge_keys[order][position] == keys
+        opposite = points[triangle_array[order[position], k]]
+        midpoints = np.mean(points[segments], axis=1)
+        radius = np.linalg.norm(points[segments[:, 1]] - points[segments[:, 0]], axis=1) / 2
+        inside = np.linalg.norm(opposite - midpoints, axis=1) < radius * (1 - 1e-10)
+        encroached = np.logical_or(encroached, np.logical_and(found, inside))
+    return encroached
+
+
+def split_segments(points, segments, segment_tags, split):
+    """
+    Splits boundary segments at their midpoints
+    :param points: Array (N,2) of the points
+    :param segments: Array (S,2) of the vertex ids of the segments
+    :param segment_tags: Array (S) of the tags of the segments
+    :param split: Indices of the segments to split
+    :return: The new points, segments and segment tags
+    """
+    midpoints = np.mean(points[segments[split]], axis=1)
+    ids = np.shape(points)[0] + np.arange(np.shape(split)[0])
+    kept = np.ones(np.shape(segments)[0], dtype=bool)
+    kept[split] = False
+
+    points = np.concatenate((points, midpoints))
+    segments = np.concatenate((segments[kept], np.column_stack((segments[split, 0], ids)),
+                               np.column_stack((ids, segments[split, 1]))))
+    segment_tags = np.concatenate((segment_tags[kept], segment_tags[split], segment_tags[split]))
+    return points, segments, segment_tags
+
+
+def get_circumcircles(points, triangle_array):
+    """
+    Gives the circumcircles, shortest edges and centroids of triangles
+    :param points: Array (N,2) of the points
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :return: Circumcenters (T,2), circumradii (T), shortest edge lengths (T) and centroids (T,2)
+    """
+    a = points[triangle_array[:, 0]]
+    b = points[triangle_array[:, 1]] - a
+    c = points[triangle_array[:, 2]] - a
+    d = 2 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    b2 = np.sum(b ** 2, axis=1)
+    c2 = np.sum(c ** 2, axis=1)
+    offset = np.column_stack((c[:, 1] * b2 - b[:, 1] * c2, b[:, 0] * c2 - c[:, 0] * b2)) / d[:, np.newaxis]
+    radius = np.linalg.norm(offset, axis=1)
+    shortest = np.sqrt(np.min(np.column_stack((b2, c2, np.sum((c - b) ** 2, axis=1))), axis=1))
+    return a + offset, radius, shortest, a + (b + c) / 3
+
+
+def get_encroached_segments(points, segments, candidates):
+    """
+    Finds for every candidate point a boundary segment whose diametral circle contains it
+    :param points: Array (N,2) of the points
+    :param segments: Array (S,2) of the vertex ids of the segments
+    :param candidates: Array (C,2) of the candidate points
+    :return: Array (C) of the index of an encroached segment or -1
+    """
+    midpoints = np.mean(points[segments], axis=1)
+    radius = np.linalg.norm(points[segments[:, 1]] - points[segments[:, 0]], axis=1) / 2
+    encroached = np.full(np.shape(candidates)[0], -1, dtype=int)
+    if np.shape(candidates)[0] == 0:
+        return encroached
+
+    # Only the segments whose midpoints are close enough can be encroached
+    tree = cKDTree(midpoints)
+    neighbours = tree.query_ball_point(candidates, np.max(radius))
+    for i, segment_ids in enumerate(neighbours):
+        if not segment_ids:
+            continue
+        segment_ids = np.asarray(segment_ids)
+        inside = np.linalg.norm(midpoints[segment_ids] - candidates[i], axis=1) < radius[segment_ids]
+        if np.any(inside):
+            encroached[i] = segment_ids[np.argmax(inside)]
+    return encroached
+
+
+def select_separated_points(candidates, distance):
+    """
+    Greedily selects candidates, skipping any candidate closer than its distance to an already selected one
+    :param candidates: Array (C,2) of the points in order of priority
+    :param distance: Array (C) of the minimal distances
+    :return: Array of the selected points
+    """
+    if np.shape(candidates)[0] == 0:
+        return candidates
+    tree = cKDTree(candidates)
+    selected = np.zeros(np.shape(candidates)[0], dtype=bool)
+    blocked = np.zeros(np.shape(candidates)[0], dtype=bool)
+    for i in range(np.shape(candidates)[0]):
+        if blocked[i]:
+            continue
+        selected[i] = True
+        blocked[tree.query_ball_point(candidates[i], distance[i])] = True
+    return candidates[selected]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements a hierarchy of uniformly refined meshes with the prolongation operators between the levels
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+
+
+class MeshHierarchy:
+    """
+    Sequence of meshes where level l + 1 is the red refinement of level l. Level 0 is the coarsest mesh.
+    """
+
+    def __init__(self, mesh, levels):
+        """
+        Builds the hierarchy
+        :param mesh: The coarsest mesh
+        :param levels: Number of refinements, the hierarchy holds levels + 1 meshes
+        """
+        self.meshes = [mesh]
+        self.prolongations = []
+        for level in range(levels):
+            print("[Info] Refining level " + str(level))
+            fine, P = self.meshes[-1].refine_uniform()
+            self.meshes.append(fine)
+            self.prolongations.append(P)
+
+    def __len__(self):
+        """
+        Number of levels
+        :return: The number of meshes
+        """
+        return len(self.meshes)
+
+    def __getitem__(self, level):
+        """
+        Gives the mesh of a level
+        :param level: The level
+        :return: The mesh
+        """
+        return self.meshes[level]
+
+    @property
+    def finest(self):
+        """
+        The finest mesh
+        :return: The mesh
+        """
+        return self.meshes[-1]
+
+    def prolong(self, u, level_from, level_to=None):
+        """
+        Interpolates P1 coefficients from a coarser onto a finer level
+        :param u: Array with the node values of level_from along the first axis
+        :param level_from: The level of u
+        :param level_to: The target level, the finest one by default
+        :return: The node values on level_to
+        """
+        if level_to is None:
+            level_to = len(self.meshes) - 1
+        for level in range(level_from, level_to):
+            u = self.prolongations[level].dot(u)
+        return u
+
+    def restrict(self, r, level_from, level_to=0):
+        """
+        Applies the transposed prolongations, e.g. to transfer residuals from a finer onto a coarser level
+        :param r: Array with the node values of level_from along the first axis
+        :param level_from: The level of r
+        :param level_to: The target level, the coarsest one by default
+        :return: The values on level_to
+        """
+        for level in range(level_from - 1, level_to - 1, -1):
+            r = self.prolongations[level].T.dot(r)
+        return r
+
+    def inject(self, u, level_from, level_to=0):
+        """
+        Restricts node values by injection. The nodes of a coarse level keep their ids on all finer levels.
+        :param u: Array with the node values of level_from along the first axis
+        :param level_from: The level of u
+        :param level_to: The target level, the coarsest one by default
+        :return: The node values on level_to
+        """
+        return np.asarray(u)[:np.shape(self.meshes[level_to].vertices)[1]]
+
+    def get_prolongation(self, level_from, level_to=None):
+        """
+        Gives the combined prolongation matrix between two levels
+        :param level_from: The coarser level
+        :param level_to: The finer level, the finest one by default
+        :return: The sparse matrix
+        """
+        if level_to is None:
+            level_to = len(self.meshes) - 1
+        P = sparse.identity(np.shape(self.meshes[level_from].vertices)[1], format='csr')
+        for level in range(level_from, level_to):
+            P = self.prolongations[level].dot(P)
+        return P
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Reads and writes meshes. Supports Gmsh .msh files (ASCII v2 and v4.1), Triangle .node/.ele files and a binary
+mesh cache that is memory mapped on load.
+"""
+
+import os
+import numpy as np
+
+from project_1.infrastructure.mesh import Mesh
+from project_1.infrastructure.topology import get_boundary_edges
+
+# Element types of Gmsh
+GMSH_LINE = 1
+GMSH_TRIANGLE = 2
+
+MESH_EXTENSIONS = ('.msh', '.node', '.ele')
+
+CACHE_ARRAYS = ('vertices', 'triangle_array', 'boundary_facets', 'boundary_facet_tags')
+
+
+def read_mesh(path, cache=True):
+    """
+    Reads a mesh file. The parsed mesh is stored in a binary cache next to the file and loaded from there as long as
+    the cache is newer than the file.
+    :param path: Path of a .msh file, a Triangle .node/.ele file or basename, a .npz file or a cache directory
+    :param cache: Should the binary cache be used
+    :return: The mesh
+    """
+    if os.path.isdir(path) or path.endswith('.npz'):
+        return load_mesh(path)
+
+    # Only the known extensions are stripped, Triangle basenames like box.1 contain dots
+    basename = path
+    for extension in MESH_EXTENSIONS:
+        if path.endswith(extension):
+            basename = path[:-len(extension)]
+    source = path if os.path.isfile(path) else basename + '.ele'
+    cache_path = basename + '.mesh_cache'
+    if cache and os.path.isdir(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(source):
+        return load_mesh(cache_path)
+
+    if path.endswith('.msh'):
+        mesh = read_gmsh(path)
+    else:
+        mesh = read_triangle(basename)
+
+    if cache:
+        save_mesh(mesh, cache_path)
+    return mesh
+
+
+def read_gmsh(path):
+    """
+    Reads a 2D triangular mesh from a Gmsh ASCII file of version 2 or 4.1. Line elements become boundary facets, tagged
+    by their physical group (or their entity if they belong to none).
+    :param path: Path of the .msh file
+    :return: The mesh
+    """
+    with open(path) as file:
+        lines = [line.strip() for line in file.read().splitlines()]
+
+    sections = {}
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith('$') and not line.startswith('$End'):
+            name = line[1:]
+            end = lines.index('$End' + name, i)
+            sections[name] = lines[i + 1:end]
+            i = end
+        i += 1
+
+    if 'MeshFormat' not in sections:
+        raise ValueError('No $MeshFormat section found in ' + str(path))
+    version, file_type = sections['MeshFormat'][0].split()[:2]
+    if file_type != '0':
+        raise ValueError('Only ASCII Gmsh files are supported.')
+
+    if version.startswith('2'):
+        node_tags, coordinates, elements = _read_gmsh_2(sections)
+    elif version == '4.1':
+        node_tags, coordinates, elements = _read_gmsh_4(sections)
+    else:
+        raise ValueError('Unsupported Gmsh version ' + version + ', only the ASCII formats 2 and 4.1 are read')
+
+    # Node tags need not be contiguous
+    index = np.full(np.max(node_tags) + 1, -1, dtype=int)
+    index[node_tags] = np.arange(np.shape(node_tags)[0])
+    vertices = coordinates[:, 0:2].T.copy()
+
+    triangle_array = index[elements[GMSH_TRIANGLE][0]] if GMSH_TRIANGLE in elements else np.zeros((0, 3), dtype=int)
+    if GMSH_LINE in elements:
+        boundary_facets = index[elements[GMSH_LINE][0]]
+        boundary_facet_tags = elements[GMSH_LINE][1]
+    else:
+        boundary_facets = None
+        boundary_facet_tags = None
+
+    return Mesh.from_arrays(vertices, triangle_array, boundary_facets, boundary_facet_tags)
+
+
+def _read_gmsh_2(sections):
+    """
+    Parses the nodes and elements of a Gmsh 2 file
+    :param sections: Dictionary of the lines of all sections
+    :return: Node tags, node coordinates (N,3) and a dictionary element type -> (node tags, physical tags)
+    """
+    node_lines = sections['Nodes']
+    nodes = _parse_numbers(node_lines[1:1 + int(node_lines[0])]).reshape(-1, 4)
+    node_tags = nodes[:, 0].astype(int)
+
+    elements = {}
+    for line in sections['Elements'][1:]:
+        values = line.split()
+        element_type = int(values[1])
+        if element_type not in (GMSH_LINE, GMSH_TRIANGLE):
+            continue
+        tag_nr = int(values[2])
+        physical = int(values[3]) if tag_nr > 0 else 0
+        connectivity, tags = elements.setdefault(element_type, ([], []))
+        connectivity.append([int(v) for v in values[3 + tag_nr:]])
+        tags.append(physical)
+
+    return node_tags, nodes[:, 1:4], _to_arrays(elements)
+
+
+def _read_gmsh_4(sections):
+    """
+    Parses the nodes and elements of a Gmsh 4.1 file
+    :param sections: Dictionary of the lines of all sections
+    :return: Node tags, node coordinates (N,3) and a dictionary element type -> (node tags, physical tags)
+    """
+    curve_physical = _read_gmsh_4_curve_groups(sections.get('Entities'))
+
+    node_lines = sections['Nodes']
+    block_nr = int(node_lines[0].split()[0])
+    tags = []
+    coordinates = []
+    i = 1
+    for block in range(block_nr):
+        entity_dim, entity_tag, parametric, node_nr = [int(v) for v in node_lines[i].split()]
+        if parametric != 0:
+            raise ValueError('Parametric node blocks are not supported')
+        tags.append(_parse_numbers(node_lines[i + 1:i + 1 + node_nr]).astype(int))
+        coordinates.append(_parse_numbers(node_lines[i + 1 + node_nr:i + 1 + 2 * node_nr]).reshape(-1, 3))
+        i += 1 + 2 * node_nr
+
+    element_lines = sections['Elements']
+    block_nr = int(element_lines[0].split()[0])
+    elements = {}
+    i = 1
+    for block in range(block_nr):
+        entity_dim, entity_tag, element_type, element_nr = [int(v) for v in element_lines[i].split()]
+        if element_type in (GMSH_LINE, GMSH_TRIANGLE):
+            block_elements = _parse_numbers(element_lines[i + 1:i + 1 + element_nr]).astype(int)
+            block_elements = block_elements.reshape(element_nr, -1)[:, 1:]
+            connectivity, physical = elements.setdefault(element_type, ([], []))
+            connectivity.extend(block_elements.tolist())
+            physical.extend([curve_physical.get(entity_tag, entity_tag)] * element_nr)
+        i += 1 + element_nr
+
+    return np.concatenate(tags), np.concatenate(coordinates), _to_arrays(elements)
+
+
+def _read_gmsh_4_curve_groups(entity_lines):
+    """
+    Reads the physical group of every curve from the $Entities section of a Gmsh 4.1 file
+    :param entity_lines: The lines of the section or None
+    :return: Dictionary curve tag -> physical tag
+    """
+    groups = {}
+    if entity_lines is None:
+        return groups
+    point_nr, curve_nr = [int(v) for v in entity_lines[0].split()[:2]]
+    for line in entity_lines[1 + point_nr:1 + point_nr + curve_nr]:
+        values = line.split()
+        physical_nr = int(values[7])
+        if physical_nr > 0:
+            groups[int(values[0])] = abs(int(values[8]))
+    return groups
+
+
+def read_triangle(basename):
+    """
+    Reads a mesh written by Triangle from basename.node and basename.ele. Boundary facets are read from basename.edge
+    if present, otherwise they are the edges with one adjacent triangle, tagged with the node boundary markers.
+    :param basename: Path of the files without extension
+    :return: The mesh
+    """
+    node_header, node_data = _read_triangle_file(basename + '.node')
+    node_nr, dim, attribute_nr, marker_nr = node_header[:4]
+    node_data = node_data.reshape(node_nr, 1 + dim + attribute_nr + marker_nr)
+    first = int(node_data[0, 0])
+    vertices = node_data[:, 1:3].T.copy()
+
+    element_header, element_data = _read_triangle_file(basename + '.ele')
+    element_nr, corner_nr = element_header[:2]
+    element_data = element_data.reshape(element_nr, -1).astype(int)
+    triangle_array = element_data[:, 1:4] - first
+
+    if os.path.exists(basename + '.edge'):
+        edge_header, edge_data = _read_triangle_file(basename + '.edge')
+        edge_data = edge_data.reshape(edge_header[0], -1).astype(int)
+        if edge_header[1] > 0:
+            edge_data = edge_data[edge_data[:, 3] != 0]
+            boundary_facet_tags = edge_data[:, 3]
+        else:
+            boundary_facet_tags = None
+        boundary_facets = edge_data[:, 1:3] - first
+    else:
+        boundary_facets = get_boundary_edges(triangle_array)
+        if marker_nr > 0:
+            # An edge gets the marker its nodes agree on, otherwise the default boundary marker 1 of Triangle
+            markers = node_data[:, -1].astype(int)
+            first_markers = markers[boundary_facets[:, 0]]
+            boundary_facet_tags = np.where(first_markers == markers[boundary_facets[:, 1]], first_markers, 1)
+        else:
+            boundary_facet_tags = None
+
+    return Mesh.from_arrays(vertices, triangle_array, boundary_facets, boundary_facet_tags)
+
+
+def _read_triangle_file(path):
+    """
+    Reads a file of Triangle
+    :param path: The path
+    :return: The header as list of ints and all further numbers as flat array
+    """
+    with open(path) as file:
+        lines = [line.split('#')[0] for line in file.read().splitlines()]
+    lines = [line for line in lines if line.strip()]
+    return [int(v) for v in lines[0].split()], _parse_numbers(lines[1:])
+
+
+def save_mesh(mesh, path):
+    """
+    Writes a mesh into the binary cache format. A path ending on .npz gives a single uncompressed archive. Any other
+    path is used as directory with one .npy file per array, which load_mesh memory maps.
+    :param mesh: The mesh
+    :param path: The path
+    """
+    arrays = {name: np.asarray(getattr(mesh, name)) for name in CACHE_ARRAYS}
+    if path.endswith('.npz'):
+        np.savez(path, **arrays)
+        return
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+
+
+def load_mesh(path, mmap=True):
+    """
+    Loads a mesh from the binary cache format
+    :param path: A .npz file or a cache directory written by save_mesh
+    :param mmap: Should the arrays of a cache directory be memory mapped instead of read
+    :return: The mesh
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            arrays = [data[name] for name in CACHE_ARRAYS]
+    else:
+        arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None) for name in
+                  CACHE_ARRAYS]
+    return Mesh.from_arrays(*arrays, orient=False)
+
+
+def _parse_numbers(lines):
+    """
+    Parses whitespace separated numbers
+    :param lines: List of lines
+    :return: Flat array of the numbers
+    """
+    return np.array(' '.join(lines).split(), dtype=float)
+
+
+def _to_arrays(elements):
+    """
+    Converts the element lists to arrays
+    :param elements: Dictionary element type -> (list of node tags, list of physical tags)
+    :return: Dictionary element type -> (array of node tags, array of physical tags)
+    """
+    return {element_type: (np.array(connectivity, dtype=int), np.array(tags, dtype=int)) for
+            element_type, (connectivity, tags) in elements.items()}
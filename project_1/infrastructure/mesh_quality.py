@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements vectorized quality metrics of triangle meshes. All metrics are computed for every triangle at once, so
+degenerate, inverted or badly shaped cells can be found before assembly and the metrics can guide refinement and
+smoothing.
+"""
+
+import numpy as np
+
+
+def get_element_quality(vertices, triangle_array, tolerance=1e-10):
+    """
+    Computes the quality metrics of all triangles
+    :param vertices: Array (2,N) of the node coordinates
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :param tolerance: Triangles whose area is below this fraction of the squared longest edge count as degenerate
+    :return: Dictionary of arrays (T): 'area' (signed, positive for counter clockwise), 'aspect_ratio' (circumradius
+    over twice the inradius, 1 for the equilateral triangle), 'min_angle' and 'max_angle' in degrees, 'condition' (the
+    condition number of the jacobian of the affine transformation) and 'orientation' (1 counter clockwise, -1
+    clockwise, 0 degenerate)
+    """
+    corners = vertices[:, triangle_array]
+    e1 = corners[:, :, 1] - corners[:, :, 0]
+    e2 = corners[:, :, 2] - corners[:, :, 0]
+    det = e1[0] * e2[1] - e1[1] * e2[0]
+    area = det / 2
+
+    # Edge k lies opposite vertex k
+    lengths = np.linalg.norm(np.roll(corners, -1, axis=2) - np.roll(corners, -2, axis=2), axis=0)
+    longest = np.max(lengths, axis=1)
+    degenerate = np.abs(area) <= tolerance * longest ** 2
+    abs_area = np.where(degenerate, 1, np.abs(area))
+
+    inradius = 2 * abs_area / np.sum(lengths, axis=1)
+    circumradius = np.prod(lengths, axis=1) / (4 * abs_area)
+    aspect_ratio = np.where(degenerate, np.inf, circumradius / (2 * inradius))
+
+    # Law of cosines, the angle at vertex k lies opposite edge k
+    a = lengths
+    b = np.roll(lengths, -1, axis=1)
+    c = np.roll(lengths, -2, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = (b ** 2 + c ** 2 - a ** 2) / (2 * b * c)
+    angles = np.degrees(np.arccos(np.clip(np.nan_to_num(cosine, nan=1.0), -1, 1)))
+
+    # Singular values of the 2x2 jacobian from its Frobenius norm and determinant
+    frobenius = np.sum(e1 ** 2 + e2 ** 2, axis=0)
+    root = np.sqrt(np.maximum(frobenius ** 2 - 4 * det ** 2, 0))
+    condition = np.where(degenerate, np.inf, (frobenius + root) / (2 * np.where(degenerate, 1, np.abs(det))))
+
+    orientation = np.where(degenerate, 0, np.sign(det)).astype(int)
+
+    return {'area': area, 'aspect_ratio': aspect_ratio, 'min_angle': np.min(angles, axis=1),
+            'max_angle': np.max(angles, axis=1), 'condition': condition, 'orientation': orientation}
+
+
+def get_quality_summary(quality):
+    """
+    Summarizes the quality metrics of a mesh
+    :param quality: Dictionary of the metrics, see get_element_quality
+    :return: Dictionary with the minimum, maximum, mean and median of every metric and the number of inverted and
+    degenerate triangles
+    """
+    summary = {}
+    for name in ['area', 'aspect_ratio', 'min_angle', 'max_angle', 'condition']:
+        values = quality[name]
+        summary[name] = {'min': np.min(values), 'max': np.max(values), 'mean': np.mean(values),
+                         'median': np.median(values)}
+    summary['inverted'] = int(np.sum(quality['orientation'] < 0))
+    summary['degenerate'] = int(np.sum(quality['orientation'] == 0))
+    return summary
+
+
+def find_bad_elements(quality, min_angle=None, max_angle=None, max_aspect_ratio=None, max_condition=None,
+                      min_area=None, allow_inverted=False):
+    """
+    Finds the triangles violating quality thresholds. Degenerate triangles are always reported.
+    :param quality: Dictionary of the metrics, see get_element_quality
+    :param min_angle: Smallest allowed angle in degrees
+    :param max_angle: Largest allowed angle in degrees
+    :param max_aspect_ratio: Largest allowed aspect ratio
+    :param max_condition: Largest allowed condition number of the jacobian
+    :param min_area: Smallest allowed absolute area
+    :param allow_inverted: Should clockwise triangles be accepted
+    :return: Sorted array of the ids of the bad triangles
+    """
+    bad = quality['orientation'] == 0
+    if not allow_inverted:
+        bad |= quality['orientation'] < 0
+    if min_angle is not None:
+        bad |= quality['min_angle'] < min_angle
+    if max_angle is not None:
+        bad |= quality['max_angle'] > max_angle
+    if max_aspect_ratio is not None:
+        bad |= quality['aspect_ratio'] > max_aspect_ratio
+    if max_condition is not None:
+        bad |= quality['condition'] > max_condition
+    if min_area is not None:
+        bad |= np.abs(quality['area']) < min_area
+    return np.where(bad)[0]
+
+
+def check_mesh_quality(quality, **thresholds):
+    """
+    Raises before assembly if any triangle violates the thresholds
+    :param quality: Dictionary of the metrics, see get_element_quality
+    :param thresholds: Keyword arguments of find_bad_elements
+    :return: The quality summary
+    """
+    bad = find_bad_elements(quality, **thresholds)
+    if np.shape(bad)[0] > 0:
+        raise ValueError(str(np.shape(bad)[0]) + ' triangles fail the quality check, e.g. the cells ' + str(bad[:10]))
+    return get_quality_summary(quality)
+
+
+def print_quality_summary(summary):
+    """
+    Prints a quality summary
+    :param summary: The summary, see get_quality_summary
+    """
+    for name in ['area', 'aspect_ratio', 'min_angle', 'max_angle', 'condition']:
+        values = summary[name]
+        print("[Info] " + name + ": min " + str(values['min']) + ", mean " + str(values['mean']) + ", max " +
+              str(values['max']))
+    print("[Info] " + str(summary['inverted']) + " inverted and " + str(summary['degenerate']) +
+          " degenerate triangles")
@@ -41,3 +41,18 @@ class P1ReferenceElement:
             grad = np.matrix('0 0 0; 0 0 0')
 
         return grad
+
+    def batch_value(self, points):
+        """
+        Returns the value of the three shape functions at many points inside the reference cell
+        :param points: Array (2,Q) of (x,y) coordinates
+        :return: Array (3,Q) of the values of the shape functions
+        """
+        return np.array([1 - points[0] - points[1], points[0], points[1]])
+
+    def constant_gradients(self):
+        """
+        Gives the gradients of the shape functions, which are constant on the reference cell
+        :return: Array 2x3 containing the gradients
+        """
+        return np.array([[-1., 1., 0.], [-1., 0., 1.]])
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements partitioning of a mesh into subdomains for domain decomposition. The triangles are split by recursive
+coordinate bisection, recursive inertial bisection, spectral bisection or greedy graph growing on the dual graph.
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import eigsh
+
+
+def partition_mesh(mesh, parts, method='rcb'):
+    """
+    Assigns every triangle to one of parts subdomains with balanced triangle counts
+    :param mesh: The mesh
+    :param parts: Number of subdomains
+    :param method: 'rcb' (recursive coordinate bisection), 'inertial' (recursive inertial bisection), 'spectral'
+    (recursive spectral bisection of the dual graph) or 'greedy' (greedy graph growing on the dual graph)
+    :return: Array (T) of the subdomain of every triangle
+    """
+    centroids = np.mean(mesh.vertices[:, mesh.triangle_array], axis=2)
+    tr_nr = np.shape(centroids)[1]
+
+    if method == 'greedy':
+        return greedy_partition(get_dual_graph(mesh), parts)
+    elif method == 'rcb':
+        def split(elements, fraction):
+            return coordinate_split(centroids[:, elements], fraction)
+    elif method == 'inertial':
+        def split(elements, fraction):
+            return inertial_split(centroids[:, elements], fraction)
+    elif method == 'spectral':
+        dual_graph = get_dual_graph(mesh)
+
+        def split(elements, fraction):
+            return spectral_split(dual_graph, elements, fraction, centroids)
+    else:
+        raise ValueError('Unknown partitioning method ' + str(method))
+
+    # Recursive bisection, parts that are not a power of two are split proportionally
+    part = np.zeros(tr_nr, dtype=int)
+    stack = [(np.arange(tr_nr), 0, parts)]
+    while stack:
+        elements, first, count = stack.pop()
+        if count == 1:
+            part[elements] = first
+            continue
+        count_left = count // 2
+        left = split(elements, count_left / count)
+        stack.append((elements[left], first, count_left))
+        stack.append((elements[~left], first + count_left, count - count_left))
+    return part
+
+
+def coordinate_split(points, fraction):
+    """
+    Splits points orthogonal to the coordinate axis of their largest extent
+    :param points: Array (2,n) of the points
+    :param fraction: Fraction of the points on the first side
+    :return: Boolean array (n), True for the first side
+    """
+    axis = np.argmax(np.ptp(points, axis=1))
+    return split_along(points[axis], fraction)
+
+
+def inertial_split(points, fraction):
+    """
+    Splits points orthogonal to their principal axis of inertia
+    :param points: Array (2,n) of the points
+    :param fraction: Fraction of the points on the first side
+    :return: Boolean array (n), True for the first side
+    """
+    centered = points - np.mean(points, axis=1)[:, np.newaxis]
+    eigenvalues, eigenvectors = np.linalg.eigh(centered.dot(centered.T))
+    return split_along(eigenvectors[:, -1].dot(centered), fraction)
+
+
+def spectral_split(dual_graph, elements, fraction, centroids):
+    """
+    Splits a set of triangles along the Fiedler vector of the graph Laplacian of their dual graph
+    :param dual_graph: Sparse adjacency matrix of the triangles
+    :param elements: Ids of the triangles to split
+    :param fraction: Fraction of the triangles on the first side
+    :param centroids: Array (2,T) of the centroids, used for tiny sets
+    :return: Boolean array, True for the first side
+    """
+    if np.shape(elements)[0] < 8:
+        return coordinate_split(centroids[:, elements], fraction)
+    graph = dual_graph[elements][:, elements]
+    laplacian = sparse.diags(np.ravel(graph.sum(axis=1))) - graph
+
+    # Shift-invert around a small negative shift converges to the smallest eigenvalues
+    eigenvalues, eigenvectors = eigsh(laplacian.tocsc().astype(float), k=2, sigma=-1e-3, which='LM')
+    fiedler = eigenvectors[:, np.argsort(eigenvalues)[1]]
+    return split_along(fiedler, fraction)
+
+
+def split_along(values, fraction):
+    """
+    Splits a set by the value of a key
+    :param values: Array (n) of the keys
+    :param fraction: Fraction of the entries with the smallest keys that form the first side
+    :return: Boolean array (n), True for the first side
+    """
+    n = np.shape(values)[0]
+    first = np.zeros(n, dtype=bool)
+    first[np.argsort(values, kind='stable')[:int(round(fraction * n))]] = True
+    return first
+
+
+def get_dual_graph(mesh):
+    """
+    Gives the dual graph of the mesh, triangles sharing an edge are adjacent
+    :param mesh: The mesh
+    :return: Sparse symmetric adjacency matrix (T,T) in CSR format
+    """
+    edge_triangles = mesh.get_edge_triangles()
+    interior = edge_triangles[edge_triangles[:, 1] >= 0]
+    tr_nr = np.shape(mesh.triangle_array)[0]
+    rows = np.concatenate((interior[:, 0], interior[:, 1]))
+    cols = np.concatenate((interior[:, 1], interior[:, 0]))
+    return sparse.csr_matrix((np.ones(np.shape(rows)[0]), (rows, cols)), shape=(tr_nr, tr_nr))
+
+
+def greedy_partition(dual_graph, parts):
+    """
+    Greedy graph growing. The subdomains grow breadth first one after another, each from the first unassigned
+    triangle in a breadth first ordering that starts at a peripheral triangle, until they have their share.
+    :param dual_graph: Sparse adjacency matrix of the triangles
+    :param parts: Number of subdomains
+    :return: Array (T) of the subdomain of every triangle
+    """
+    tr_nr = np.shape(dual_graph)[0]
+    indptr = dual_graph.indptr
+    indices = dual_graph.indices
+    sizes = np.diff(np.linspace(0, tr_nr, parts + 1).astype(int))
+
+    # A peripheral triangle is the last one reached from any triangle
+    order = _get_bfs_order(indptr, indices, _get_bfs_order(indptr, indices, 0)[-1])
+
+    part = np.full(tr_nr, -1, dtype=int)
+    next_seed = 0
+    for p in range(parts):
+        while part[order[next_seed]] >= 0:
+            next_seed += 1
+        frontier = [order[next_seed]]
+        part[frontier[0]] = p
+        count = 1
+        position = 0
+        while count < sizes[p]:
+            if position == len(frontier):
+                # Disconnected remainder, continue at the next unassigned triangle
+                while part[order[next_seed]] >= 0:
+                    next_seed += 1
+                frontier.append(order[next_seed])
+                part[frontier[-1]] = p
+                count += 1
+                continue
+            t = frontier[position]
+            position += 1
+            for s in indices[indptr[t]:indptr[t + 1]]:
+                if part[s] < 0 and count < sizes[p]:
+                    part[s] = p
+                    frontier.append(s)
+                    count += 1
+    return part
+
+
+def _get_bfs_order(indptr, indices, start):
+    """
+    Gives the breadth first ordering of a graph, restarting in every further connected component
+    :param indptr: CSR pointers of the graph
+    :param indices: CSR indices of the graph
+    :param start: The starting vertex
+    :return: Array of all vertices in the order they are reached
+    """
+    n = np.shape(indptr)[0] - 1
+    visited = np.zeros(n, dtype=bool)
+    order = []
+    for root in [start] + list(range(n)):
+        if visited[root]:
+            continue
+        visited[root] = True
+        position = len(order)
+        order.append(root)
+        while position < len(order):
+            t = order[position]
+            position += 1
+            neighbors = indices[indptr[t]:indptr[t + 1]]
+            neighbors = neighbors[~visited[neighbors]]
+            visited[neighbors] = True
+            order.extend(neighbors.tolist())
+    return np.array(order, dtype=int)
+
+
+class Subdomain:
+    """
+    A subdomain of a partitioned mesh with its overlap layers and the map from local to global node ids
+    """
+
+    def __init__(self, mesh, index, core_elements, elements, owned_nodes, interface_nodes):
+        """
+        Stores the subdomain
+        :param mesh: The global mesh
+        :param index: Number of the subdomain
+        :param core_elements: Global ids of the triangles assigned to the subdomain by the partition
+        :param elements: Global ids of the triangles including the overlap layers
+        :param owned_nodes: Global ids of the nodes this subdomain is responsible for, every node has one owner
+        :param interface_nodes: Global ids of the nodes of core_elements shared with other subdomains
+        """
+        self.mesh = mesh
+        self.index = index
+        self.core_elements = core_elements
+        self.elements = elements
+        self.nodes = np.unique(mesh.triangle_array[elements])
+        self.owned_nodes = owned_nodes
+        self.interface_nodes = interface_nodes
+
+    @property
+    def local_to_global(self):
+        """
+        Global id of every local node
+        :return: The array nodes
+        """
+        return self.nodes
+
+    def global_to_local(self, global_ids):
+        """
+        Maps global node ids to local ones
+        :param global_ids: Array of global node ids
+        :return: Array of local node ids, -1 for nodes outside the subdomain
+        """
+        global_ids = np.asarray(global_ids)
+        position = np.minimum(np.searchsorted(self.nodes, global_ids), np.shape(self.nodes)[0] - 1)
+        return np.where(self.nodes[position] == global_ids, position, -1)
+
+    def get_local_mesh(self):
+        """
+        Builds the mesh of the subdomain with local node ids
+        :return: The mesh
+        """
+        facets = self.mesh.boundary_facets
+        local_facets = self.global_to_local(facets)
+        inside = np.all(local_facets >= 0, axis=1)
+        return type(self.mesh).from_arrays(self.mesh.vertices[:, self.nodes],
+                                           self.global_to_local(self.mesh.triangle_array[self.elements]),
+                                           local_facets[inside], self.mesh.boundary_facet_tags[inside], orient=False)
+
+
+def get_subdomains(mesh, part, overlap=0):
+    """
+    Builds the subdomains of a partition
+    :param mesh: The mesh
+    :param part: Array (T) of the subdomain of every triangle
+    :param overlap: Number of layers of triangles added around every subdomain
+    :return: List of the subdomains
+    """
+    parts = np.max(part) + 1
+    varnr = np.shape(mesh.vertices)[1]
+    triangle_array = mesh.triangle_array
+    indptr, indices = mesh.get_vertex_triangles()
+
+    # Subdomains touching every node, as a sparse node x subdomain incidence
+    node_parts = sparse.csr_matrix((np.ones(np.size(triangle_array)), (triangle_array.ravel(), np.repeat(part, 3))),
+                                   shape=(varnr, parts))
+    node_parts.data[:] = 1
+    shared = np.ravel(node_parts.sum(axis=1)) > 1
+    owner = np.asarray(node_parts.argmax(axis=1)).ravel()
+
+    subdomains = []
+    for p in range(parts):
+        core_elements = np.where(part == p)[0]
+        elements = core_elements
+        for layer in range(overlap):
+            nodes = np.unique(triangle_array[elements])
+            starts = indptr[nodes]
+            stops = indptr[nodes + 1]
+            around = np.concatenate([indices[start:stop] for start, stop in zip(starts, stops)])
+            elements = np.union1d(elements, around)
+        core_nodes = np.unique(triangle_array[core_elements])
+        subdomains.append(Subdomain(mesh, p, core_elements, elements, np.where(owner == p)[0],
+                                    core_nodes[shared[core_nodes]]))
+    return subdomains
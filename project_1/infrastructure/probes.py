@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements point probes of P1 functions. The containing triangle and the barycentric weights of every probe are
+computed once and stored as sparse sampling matrix, so sampling a solution is one sparse matrix vector product.
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+from matplotlib.tri import Triangulation
+
+
+def locate_points(mesh, points, tolerance=1e-10):
+    """
+    Finds the triangle containing every point
+    :param mesh: The mesh
+    :param points: Array (2,n) of the coordinates of the points
+    :param tolerance: Points this far outside a triangle, in barycentric coordinates, still count as inside
+    :return: Array (n) of the triangle ids and array (n,3) of the barycentric coordinates
+    """
+    points = np.asarray(points, dtype=float).reshape(2, -1)
+    vertices = mesh.vertices
+    triangle_array = mesh.triangle_array
+    J, det, J_inv = mesh.get_element_geometry()
+
+    def get_barycentric(triangles, p):
+        local = np.einsum('tab,tb->ta', J_inv[triangles], (p - vertices[:, triangle_array[triangles, 0]]).T)
+        return np.column_stack((1 - local[:, 0] - local[:, 1], local[:, 0], local[:, 1]))
+
+    triangulation = Triangulation(vertices[0], vertices[1], triangle_array)
+    triangles = np.asarray(triangulation.get_trifinder()(points[0], points[1]), dtype=int)
+
+    # Points on the boundary may be missed by the trifinder, search them among all triangles
+    for i in np.where(triangles < 0)[0]:
+        barycentric = get_barycentric(np.arange(np.shape(triangle_array)[0]), points[:, [i]])
+        best = np.argmax(np.min(barycentric, axis=1))
+        if np.min(barycentric[best]) >= -tolerance:
+            triangles[i] = best
+    outside = np.where(triangles < 0)[0]
+    if np.shape(outside)[0] > 0:
+        raise ValueError('The points ' + str(outside) + ' lie outside the mesh')
+
+    return triangles, get_barycentric(triangles, points)
+
+
+def get_sampling_matrix(mesh, points, varnr=None):
+    """
+    Builds the sparse matrix evaluating a P1 function at points
+    :param mesh: The mesh
+    :param points: Array (2,n) of the coordinates of the probes
+    :param varnr: Number of columns, larger than the number of nodes for states holding more than the nodal values,
+    e.g. displacement and velocity of the wave equation
+    :return: Sparse matrix (n, varnr) in CSR format
+    """
+    triangles, barycentric = locate_points(mesh, points)
+    n = np.shape(triangles)[0]
+    if varnr is None:
+        varnr = np.shape(mesh.vertices)[1]
+    rows = np.repeat(np.arange(n), 3)
+    columns = mesh.triangle_array[triangles].ravel()
+    return sparse.csr_matrix((barycentric.ravel(), (rows, columns)), shape=(n, varnr))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements orderings of nodes and triangles that reduce bandwidth and improve locality
+"""
+
+import numpy as np
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+
+def get_rcm_order(sparsity_pattern):
+    """
+    Gives the reverse Cuthill-McKee ordering of the nodes
+    :param sparsity_pattern: The SparsityPattern of the mesh
+    :return: Array with the old index of every new node
+    """
+    return np.asarray(reverse_cuthill_mckee(sparsity_pattern.create_matrix(np.ones(sparsity_pattern.nnz)),
+                                            symmetric_mode=True), dtype=int)
+
+
+def get_space_filling_curve_order(points, curve='hilbert', bits=16):
+    """
+    Gives the ordering of points along a space filling curve
+    :param points: Array (2,N) of coordinates
+    :param curve: Either 'hilbert' or 'morton'
+    :param bits: Number of bits per coordinate used to quantize the points
+    :return: Array with the old index of every new point
+    """
+    if curve == 'hilbert':
+        keys = get_hilbert_keys(points, bits)
+    elif curve == 'morton':
+        keys = get_morton_keys(points, bits)
+    else:
+        raise ValueError('Unknown space filling curve ' + str(curve))
+    return np.argsort(keys, kind='stable')
+
+
+def quantize_points(points, bits=16):
+    """
+    Maps points onto the integer grid [0, 2^bits - 1]^2 of their bounding box
+    :param points: Array (2,N) of coordinates
+    :param bits: Number of bits per coordinate
+    :return: Arrays of the integer x and y coordinates
+    """
+    lower = np.min(points, axis=1)
+    extent = np.max(points, axis=1) - lower
+    extent[extent == 0] = 1
+    scaled = (points - lower[:, np.newaxis]) / extent[:, np.newaxis] * (2 ** bits - 1)
+    grid = np.round(scaled).astype(np.int64)
+    return grid[0], grid[1]
+
+
+def get_morton_keys(points, bits=16):
+    """
+    Gives the position of points on the Morton (Z-order) curve
+    :param points: Array (2,N) of coordinates
+    :param bits: Number of bits per coordinate, at most 31
+    :return: Array of the keys
+    """
+    x, y = quantize_points(points, bits)
+    return _spread_bits(x) | (_spread_bits(y) << 1)
+
+
+def get_hilbert_keys(points, bits=16):
+    """
+    Gives the position of points on the Hilbert curve
+    :param points: Array (2,N) of coordinates
+    :param bits: Number of bits per coordinate, at most 31
+    :return: Array of the keys
+    """
+    x, y = quantize_points(points, bits)
+    n = 2 ** bits
+    keys = np.zeros_like(x)
+    s = n // 2
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.int64)
+        ry = ((y & s) > 0).astype(np.int64)
+        keys += s * s * ((3 * rx) ^ ry)
+
+        # Rotate the quadrant
+        flip = np.logical_and(ry == 0, rx == 1)
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s //= 2
+    return keys
+
+
+def _spread_bits(v):
+    """
+    Inserts a zero bit between all bits of 32 bit integers
+    :param v: Array of integers
+    :return: Array of the spread integers
+    """
+    v = v.astype(np.int64) & 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
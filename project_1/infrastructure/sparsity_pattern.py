@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements the sparsity pattern of the P1 system matrices of a mesh
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+
+
+class SparsityPattern:
+    """
+    CSR sparsity pattern of a mesh together with the map from the entries of the element matrices to the nonzeros
+    """
+
+    def __init__(self, triangle_array, varnr):
+        """
+        Computes the pattern
+        :param triangle_array: Array (T,3) of the vertex ids of the triangles
+        :param varnr: The number of nodes
+        """
+        rows = np.repeat(triangle_array, 3, axis=1).ravel().astype(np.int64)
+        cols = np.tile(triangle_array, (1, 3)).ravel().astype(np.int64)
+
+        # Sorting the keys row major gives the CSR ordering, the inverse is the scatter map
+        unique_keys, scatter = np.unique(rows * varnr + cols, return_inverse=True)
+
+        self.varnr = varnr
+        self.nnz = np.shape(unique_keys)[0]
+        self.indices = (unique_keys % varnr).astype(np.int32)
+        self.indptr = np.zeros(varnr + 1, dtype=np.int32)
+        self.indptr[1:] = np.cumsum(np.bincount(unique_keys // varnr, minlength=varnr))
+        self.scatter = scatter.ravel()
+
+    def assemble(self, element_matrices, out=None):
+        """
+        Sums the element matrices into a matrix on this pattern
+        :param element_matrices: Array (T,3,3) of the element matrices
+        :param out: A matrix created by this pattern. If given, its data array is overwritten in place
+        :return: The sparse matrix in CSR format
+        """
+        data = np.bincount(self.scatter, weights=np.ravel(element_matrices), minlength=self.nnz)
+        if out is not None:
+            out.data[:] = data
+            return out
+        return self.create_matrix(data)
+
+    def create_matrix(self, data=None):
+        """
+        Creates a CSR matrix on this pattern without sorting or summing duplicates
+        :param data: The nonzero values. Zeros if None
+        :return: The sparse matrix
+        """
+        if data is None:
+            data = np.zeros(self.nnz)
+        matrix = sparse.csr_matrix((data, self.indices, self.indptr), shape=(self.varnr, self.varnr), copy=False)
+        matrix.has_sorted_indices = True
+        return matrix
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Builds the topology tables of a triangulation (edges, neighbors and vertex to triangle adjacency) with sort and
+unique operations on the triangle array
+"""
+
+import numpy as np
+
+
+def get_edge_data(triangle_array):
+    """
+    Builds the edges of a triangulation. Local edge k of a triangle lies opposite its vertex k.
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :return: Array (E,2) of the edges with ascending vertex ids, array (T,3) of the edge opposite every vertex and
+    array (E,2) of the triangles adjacent to every edge, -1 on the boundary
+    """
+    tr_nr = np.shape(triangle_array)[0]
+    local = np.concatenate((triangle_array[:, [1, 2]], triangle_array[:, [2, 0]], triangle_array[:, [0, 1]]))
+    edges, inverse = np.unique(np.sort(local, axis=1), axis=0, return_inverse=True)
+    inverse = np.ravel(inverse)
+    triangle_edges = inverse.reshape(3, tr_nr).T
+
+    # The first occurrence of an edge gives the first triangle, a second one the neighbor
+    edge_triangles = np.full((np.shape(edges)[0], 2), -1, dtype=int)
+    owner = np.tile(np.arange(tr_nr), 3)
+    order = np.argsort(inverse, kind='stable')
+    first = np.ones(3 * tr_nr, dtype=bool)
+    first[1:] = inverse[order][1:] != inverse[order][:-1]
+    edge_triangles[inverse[order][first], 0] = owner[order][first]
+    edge_triangles[inverse[order][~first], 1] = owner[order][~first]
+    return edges, triangle_edges, edge_triangles
+
+
+def get_triangle_neighbors(triangle_edges, edge_triangles):
+    """
+    Gives the neighbors of all triangles
+    :param triangle_edges: Array (T,3) of the edge opposite every vertex
+    :param edge_triangles: Array (E,2) of the triangles adjacent to every edge
+    :return: Array (T,3) of the triangle across the edge opposite every vertex, -1 on the boundary
+    """
+    adjacent = edge_triangles[triangle_edges]
+    own = np.arange(np.shape(triangle_edges)[0])[:, np.newaxis]
+    return np.where(adjacent[:, :, 0] == own, adjacent[:, :, 1], adjacent[:, :, 0])
+
+
+def get_vertex_triangles(triangle_array, varnr):
+    """
+    Gives the triangles around every vertex in CSR format
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :param varnr: The number of vertices
+    :return: Arrays indptr (N+1) and indices, the triangles of vertex i are indices[indptr[i]:indptr[i+1]]
+    """
+    nodes = triangle_array.ravel()
+    order = np.argsort(nodes, kind='stable')
+    indptr = np.zeros(varnr + 1, dtype=int)
+    indptr[1:] = np.cumsum(np.bincount(nodes, minlength=varnr))
+    return indptr, order // 3
+
+
+def get_boundary_edges(triangle_array, edge_data=None):
+    """
+    Gives the edges that belong to exactly one triangle
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :param edge_data: The result of get_edge_data, computed if not given
+    :return: Array (B,2) of the boundary edges, oriented as in their triangle
+    """
+    if edge_data is None:
+        edge_data = get_edge_data(triangle_array)
+    edges, triangle_edges, edge_triangles = edge_data
+    boundary = np.where(edge_triangles[:, 1] < 0)[0]
+    owner = edge_triangles[boundary, 0]
+    local = np.argmax(triangle_edges[owner] == boundary[:, np.newaxis], axis=1)
+    return np.column_stack((triangle_array[owner, (local + 1) % 3], triangle_array[owner, (local + 2) % 3]))
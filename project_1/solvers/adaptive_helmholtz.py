@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements an adaptive solver for the 2D Helmholtz problem -laplace(u) + u = f. Every level runs
+solve -> estimate -> mark -> refine with a residual based error estimator, Doerfler marking and newest vertex bisection.
+"""
+import numpy as np
+import scipy.sparse as sparse
+
+from project_1.infrastructure.mesh import Mesh
+from project_1.infrastructure.p1_reference_element import P1ReferenceElement
+from project_1.infrastructure.topology import get_edge_data
+from project_1.solvers.matrix_generation import assemble_mass_matrix, assemble_stiffness_matrix, \
+    assemble_load_vector, evaluate_coefficient
+from project_1.solvers.solver_helmholtz import get_dirichlet_nodes
+from project_1.utils.error_analysis import calc_l2_error_quadrature
+from project_1.utils.integration import gauss_legendre_reference_points
+from project_1.utils.iterative_solvers import conjugate_gradient, get_jacobi_preconditioner
+
+
+def solve_helmholtz_adaptive(mesh, f_function, tolerance=1e-2, theta=0.5, max_levels=20, max_dofs=50000, supports=7,
+                             u_tilde_function=None):
+    """
+    Solves the Helmholtz problem under fixed BC on adaptively refined meshes
+    :param mesh: The initial mesh
+    :param f_function: The inhomogenous right hand side
+    :param tolerance: Stop once the estimated error is below this value
+    :param theta: The Doerfler parameter, the marked triangles carry this fraction of the estimated error
+    :param max_levels: Maximal number of meshes
+    :param max_dofs: Stop once the mesh has this many nodes
+    :param supports: Number of supports for the Gauss-Legendre integration
+    :param u_tilde_function: The analytical solution. If given, the L2 error of every level is recorded
+    :return: The final mesh, the solution on it and a list with the number of nodes, the estimate, the CG iterations,
+    the smallest angle and the L2 error of every level
+    """
+    vertices = np.array(mesh.vertices, dtype=float)
+    triangle_array = label_longest_edge(vertices, mesh.triangle_array)
+    boundary_facets = mesh.boundary_facets
+    boundary_facet_tags = mesh.boundary_facet_tags
+    u_prolonged = None
+    history = []
+
+    for level in range(max_levels):
+        mesh = Mesh.from_arrays(vertices, triangle_array, boundary_facets, boundary_facet_tags, orient=False)
+        u, iterations = solve_helmholtz_sparse(mesh, f_function, supports, u_prolonged)
+
+        eta = estimate_error(mesh, f_function, u, supports)
+        estimate = np.sqrt(np.sum(eta))
+        entry = {'dofs': np.shape(vertices)[1], 'estimate': estimate, 'iterations': iterations,
+                 'min_angle': np.min(mesh.get_quality()['min_angle'])}
+        if u_tilde_function is not None:
+            entry['l2_error'] = calc_l2_error_quadrature(mesh, u_tilde_function, u, supports)
+        history.append(entry)
+        print("[Info] Level " + str(level) + ": " + str(entry['dofs']) + " nodes, estimated error " + str(estimate))
+
+        if estimate <= tolerance or entry['dofs'] >= max_dofs or level == max_levels - 1:
+            break
+
+        marked = doerfler_marking(eta, theta)
+        vertices, triangle_array, boundary_facets, boundary_facet_tags, P = bisect(
+            vertices, triangle_array, marked, boundary_facets, boundary_facet_tags)
+        u_prolonged = P.dot(u)
+
+    return mesh, u, history
+
+
+def solve_helmholtz_sparse(mesh, f_function, supports=7, u0=None, tol=1e-10):
+    """
+    Solves the Helmholtz problem with homogenous Dirichlet BC at y=0 and y=1 by CG on the free nodes
+    :param mesh: The mesh
+    :param f_function: The right hand side
+    :param supports: Number of supports for the Gauss-Legendre integration
+    :param u0: The initial guess, e.g. the prolonged solution of the previous mesh
+    :param tol: The relative tolerance of CG
+    :return: The solution and the number of CG iterations
+    """
+    varnr = np.shape(mesh.vertices)[1]
+    A = assemble_stiffness_matrix(mesh, supports=supports) + assemble_mass_matrix(mesh, supports=supports)
+    b = assemble_load_vector(mesh, f_function, supports)
+
+    free = np.ones(varnr, dtype=bool)
+    free[get_dirichlet_nodes(mesh.vertices)] = False
+    A_free = A[free][:, free].tocsr()
+    x0 = None if u0 is None else u0[free]
+
+    u = np.zeros(varnr)
+    u[free], iterations = conjugate_gradient(A_free, b[free], x0, tol, preconditioner=get_jacobi_preconditioner(A_free))
+    return u, iterations
+
+
+def estimate_error(mesh, f_function, u, supports=7):
+    """
+    Residual based a posteriori error estimator. For P1 elements the element residual of -laplace(u) + u = f is
+    f - u_h, the edge residuals are the jumps of the normal derivative on interior edges (split evenly between the two
+    triangles) and the normal derivative on Neumann edges.
+    :param mesh: The mesh
+    :param f_function: The right hand side
+    :param u: The solution
+    :param supports: Number of supports for the Gauss-Legendre integration
+    :return: Array (T) of the squared error indicators
+    """
+    vertices = mesh.vertices
+    triangle_array = mesh.triangle_array
+    J, det, J_inv = mesh.get_element_geometry()
+    tr_nr = np.shape(triangle_array)[0]
+    u_local = u[triangle_array]
+
+    # Element residuals
+    points, weights = gauss_legendre_reference_points(supports)
+    phi = P1ReferenceElement().batch_value(points)
+    residual = np.broadcast_to(evaluate_coefficient(f_function, mesh, points), (tr_nr, np.shape(weights)[0])) - \
+        np.einsum('ti,iq->tq', u_local, phi)
+    corners = vertices[:, triangle_array]
+    diameter = np.max(np.linalg.norm(corners - np.roll(corners, 1, axis=2), axis=0), axis=1)
+    eta = diameter ** 2 * np.einsum('tq,q,t->t', residual ** 2, weights, np.abs(det))
+
+    # Edge residuals
+    edges = mesh.get_edges()
+    edge_triangles = mesh.get_edge_triangles()
+    gradients = np.einsum('tba,bi,ti->ta', J_inv, P1ReferenceElement().constant_gradients(), u_local)
+    tangent = vertices[:, edges[:, 1]] - vertices[:, edges[:, 0]]
+    length = np.linalg.norm(tangent, axis=0)
+    normal = np.array([tangent[1], -tangent[0]]) / length
+
+    interior = edge_triangles[:, 1] >= 0
+    jump = np.sum((gradients[edge_triangles[:, 0]] - gradients[edge_triangles[:, 1]]).T * normal, axis=0)
+    jump[~interior] = np.sum(gradients[edge_triangles[~interior, 0]].T * normal[:, ~interior], axis=0)
+
+    dirichlet = np.zeros(np.shape(vertices)[1], dtype=bool)
+    dirichlet[get_dirichlet_nodes(vertices)] = True
+    neumann = np.logical_and(~interior, ~np.logical_and(dirichlet[edges[:, 0]], dirichlet[edges[:, 1]]))
+
+    edge_eta = length ** 2 * jump ** 2
+    eta += np.bincount(edge_triangles[interior].ravel(), weights=np.repeat(edge_eta[interior] / 2, 2),
+                       minlength=tr_nr)
+    eta += np.bincount(edge_triangles[neumann, 0], weights=edge_eta[neumann], minlength=tr_nr)
+    return eta
+
+
+def doerfler_marking(eta, theta=0.5):
+    """
+    Marks a minimal set of triangles whose indicators sum up to the fraction theta of the total
+    :param eta: Array (T) of the squared error indicators
+    :param theta: The fraction, between 0 and 1
+    :return: Indices of the marked triangles
+    """
+    order = np.argsort(-eta, kind='stable')
+    cumulative = np.cumsum(eta[order])
+    count = np.searchsorted(cumulative, theta * cumulative[-1]) + 1
+    return order[:min(count, np.shape(eta)[0])]
+
+
+def label_longest_edge(vertices, triangle_array):
+    """
+    Rotates the vertices of every triangle so that the first vertex lies opposite the longest edge, which makes the
+    longest edge the refinement edge of the initial mesh. The orientation is preserved.
+    :param vertices: Array (2,N) of the node coordinates
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :return: The relabeled triangle array
+    """
+    corners = vertices[:, triangle_array]
+    opposite_length = np.linalg.norm(np.roll(corners, -1, axis=2) - np.roll(corners, -2, axis=2), axis=0)
+    first = np.argmax(opposite_length, axis=1)
+    rotation = (first[:, np.newaxis] + np.arange(3)) % 3
+    return np.take_along_axis(triangle_array, rotation, axis=1)
+
+
+def bisect(vertices, triangle_array, marked, boundary_facets=None, boundary_facet_tags=None):
+    """
+    Refines a mesh conformingly by newest vertex bisection. The refinement edge of a triangle [p0, p1, p2] is
+    (p1, p2), its children are [m, p0, p1] and [m, p2, p0] with the midpoint m as newest vertex.
+    :param vertices: Array (2,N) of the node coordinates
+    :param triangle_array: Array (T,3) of the vertex ids of the triangles
+    :param marked: Indices of the triangles that must be refined
+    :param boundary_facets: Array (B,2) of the boundary facets, split facets keep their tag
+    :param boundary_facet_tags: Array (B) of the tags of the boundary facets
+    :return: The new vertices, triangles, boundary facets, boundary facet tags and the sparse prolongation matrix
+    that interpolates P1 coefficients onto the new mesh
+    """
+    varnr = np.shape(vertices)[1]
+    edges, triangle_edges, edge_triangles = get_edge_data(triangle_array)
+
+    # Closure: a triangle with any marked edge also needs its refinement edge marked
+    marked_edges = np.zeros(np.shape(edges)[0], dtype=bool)
+    marked_edges[triangle_edges[marked, 0]] = True
+    while True:
+        refine = np.any(marked_edges[triangle_edges], axis=1)
+        missing = np.logical_and(refine, ~marked_edges[triangle_edges[:, 0]])
+        if not np.any(missing):
+            break
+        marked_edges[triangle_edges[missing, 0]] = True
+
+    split_edges = edges[marked_edges]
+    new_nr = np.shape(split_edges)[0]
+    new_varnr = varnr + new_nr
+    midpoints = (vertices[:, split_edges[:, 0]] + vertices[:, split_edges[:, 1]]) / 2
+    edge_keys = split_edges[:, 0] * new_varnr + split_edges[:, 1]
+
+    def find_midpoints(a, b):
+        keys = np.minimum(a, b) * new_varnr + np.maximum(a, b)
+        position = np.minimum(np.searchsorted(edge_keys, keys), max(new_nr - 1, 0))
+        found = edge_keys[position] == keys if new_nr > 0 else np.zeros(np.shape(keys), dtype=bool)
+        return np.where(found, varnr + position, -1)
+
+    # Bisect until no refinement edge carries a midpoint, at most three sweeps
+    while True:
+        midpoint = find_midpoints(triangle_array[:, 1], triangle_array[:, 2])
+        split = midpoint >= 0
+        if not np.any(split):
+            break
+        m = midpoint[split]
+        p0, p1, p2 = triangle_array[split].T
+        triangle_array = np.concatenate((triangle_array[~split], np.column_stack((m, p0, p1)),
+                                         np.column_stack((m, p2, p0))))
+
+    if boundary_facets is not None and np.shape(boundary_facets)[0] > 0:
+        midpoint = find_midpoints(boundary_facets[:, 0], boundary_facets[:, 1])
+        split = midpoint >= 0
+        boundary_facets = np.concatenate((boundary_facets[~split],
+                                          np.column_stack((boundary_facets[split, 0], midpoint[split])),
+                                          np.column_stack((midpoint[split], boundary_facets[split, 1]))))
+        boundary_facet_tags = np.concatenate((boundary_facet_tags[~split], boundary_facet_tags[split],
+                                              boundary_facet_tags[split]))
+
+    rows = np.concatenate((np.arange(varnr), np.repeat(varnr + np.arange(new_nr), 2)))
+    cols = np.concatenate((np.arange(varnr), split_edges.ravel()))
+    data = np.concatenate((np.ones(varnr), np.full(2 * new_nr, 0.5)))
+    P = sparse.csr_matrix((data, (rows, cols)), shape=(new_varnr, varnr))
+
+    return np.concatenate((vertices, midpoints), axis=1), triangle_array, boundary_facets, boundary_facet_tags, P
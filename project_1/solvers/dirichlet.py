@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements the lifting of time dependent Dirichlet BC for dynamic problems. The nodes are split into free nodes F and
+constrained nodes D with prescribed values g(t). Only the free nodes are integrated, e.g.
+M_FF u_F'' = -K_FF u_F - K_FD g(t) - M_FD g''(t), so the integrators see a smooth system and their error control is
+never bypassed by overwriting the state.
+"""
+
+import numpy as np
+
+# Step of the central differences for boundary data without given derivatives
+DIFFERENCE_STEP = 1e-4
+
+
+class DirichletLifting:
+    """
+    Splits the nodes into free ones and constrained ones with prescribed values g(t)
+    """
+
+    def __init__(self, varnr, nodes, values=0.0, derivative=None, second_derivative=None):
+        """
+        :param varnr: The number of nodes
+        :param nodes: The indices of the constrained nodes
+        :param values: The prescribed values, a constant (D) or scalar, or a callable g(t) giving an array (D)
+        :param derivative: Callable g'(t). For callable values without it, central differences are used
+        :param second_derivative: Callable g''(t). For callable values without it, central differences are used
+        """
+        self.varnr = varnr
+        self.nodes = np.unique(np.asarray(nodes, dtype=int))
+        self.free = np.setdiff1d(np.arange(varnr), self.nodes)
+        self.values = values
+        self.derivatives = [derivative, second_derivative]
+
+    def get_values(self, t, order=0):
+        """
+        Gives the prescribed values or their time derivatives
+        :param t: The time
+        :param order: 0 for g, 1 for g' and 2 for g''
+        :return: Array (D)
+        """
+        if not callable(self.values):
+            value = self.values if order == 0 else 0.0
+            return np.broadcast_to(np.asarray(value, dtype=float), np.shape(self.nodes))
+        if order == 0:
+            return np.asarray(self.values(t), dtype=float)
+        if self.derivatives[order - 1] is not None:
+            return np.asarray(self.derivatives[order - 1](t), dtype=float)
+        h = DIFFERENCE_STEP
+        if order == 1:
+            return (self.get_values(t + h) - self.get_values(t - h)) / (2 * h)
+        return (self.get_values(t + h) - 2 * self.get_values(t) + self.get_values(t - h)) / h ** 2
+
+    def split(self, matrix):
+        """
+        Splits the rows of the free nodes of a matrix into the free and the constrained columns
+        :param matrix: A dense or sparse matrix (N, N)
+        :return: The blocks A_FF and A_FD
+        """
+        rows = matrix[self.free]
+        return rows[:, self.free], rows[:, self.nodes]
+
+    def restrict(self, u):
+        """
+        Gives the values at the free nodes
+        :param u: Array (N)
+        :return: Array (F)
+        """
+        return np.asarray(u)[self.free]
+
+    def extend(self, u_free, t, order=0):
+        """
+        Gives the full field from the values at the free nodes
+        :param u_free: Array (F)
+        :param t: The time
+        :param order: The order of the time derivative the field represents, e.g. 1 for velocities
+        :return: Array (N)
+        """
+        u = np.zeros(self.varnr)
+        u[self.free] = u_free
+        u[self.nodes] = self.get_values(t, order)
+        return u
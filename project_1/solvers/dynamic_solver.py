@@ -4,16 +4,30 @@
 """
 Implements solver for dynamic 2D problem
 """
+import os
 import numpy as np
+import scipy.sparse as sparse
 
 from project_1.infrastructure.p1_reference_element import P1ReferenceElement
 from project_1.infrastructure.affine_transformation import AffineTransformation
-from project_1.solvers.rk_45_fd_solver import solve_dynamic_system
+from project_1.solvers.rk_45_fd_solver import solve_dynamic_system, IMPLICIT_METHODS
+from project_1.utils.trajectory_store import open_trajectory_store, TrajectoryStore
 from scipy.interpolate import interp1d
 from project_1.solvers.matrix_generation import generate_mass_matrix, generate_stiffness_matrix
-
-
-def solve_dynamic(mesh, reference_function, t_end, t_0=0, timestep=0.01, quadpack=False, accuracy=1.49e-05):
+from project_1.solvers.matrix_free import get_heat_operator, get_heat_jacobian, get_lumped_mass
+from project_1.solvers.matrix_generation import assemble_stiffness_matrix
+from project_1.solvers.solver_helmholtz import get_dirichlet_nodes
+from project_1.solvers.exponential_integrator import integrate_exponential
+from project_1.solvers.ensemble import integrate_theta, THETA_METHODS
+from project_1.solvers.parareal import integrate_parareal
+from project_1.infrastructure.probes import get_sampling_matrix
+
+
+def solve_dynamic(mesh, reference_function, t_end, t_0=0, timestep=0.01, quadpack=False, accuracy=1.49e-05,
+                  matrix_free=False, method='RK45', rtol=1e-3, atol=1e-6, output_times=None, u0=None,
+                  dirichlet_values=None, checkpoint=None, checkpoint_interval=100, restart=False,
+                  store=None, probes=None, slices=8, fine='crank_nicolson', processes=None, tolerance=1e-6,
+                  check_quality=False):
     """
     Solves the dynamic problem under fixed BC.
     :param mesh: The mesh to operate on
@@ -21,26 +35,84 @@ def solve_dynamic(mesh, reference_function, t_end, t_0=0, timestep=0.01, quadpac
     :param f_function: The inhomogenous right hand side
     :param quadpack: Should the Fortran quadpack package be used to integrate numerically
     :param accuracy: The accuracy for quadpack
-    :return: A ND interpolator
+    :param matrix_free: If True, no matrices are assembled. K is applied matrix free and the mass matrix is lumped.
+    Implicit methods still get the assembled sparse jacobian -M_L^-1 K.
+    :param method: The integration method, see solve_dynamic_system. 'SDIRK' integrates M u' = -K u directly. 'expm'
+    advances from output time to output time by the action of the matrix exponential without stability restriction.
+    'backward_euler' and 'crank_nicolson' take fixed steps of length timestep with one factorization. 'parareal'
+    integrates the time slices in parallel, see integrate_parareal.
+    :param rtol: The relative tolerance of the integration
+    :param atol: The absolute tolerance of the integration
+    :param output_times: The times at which the exponential integrator gives the solution, every timestep by default
+    :param u0: The initial state (N), 0.7 everywhere by default. An array (N, n_ens) integrates an ensemble with one
+    member per column, which needs 'expm' or a fixed step method.
+    :param dirichlet_values: The values at the Dirichlet nodes, array (D) or (D, n_ens) in the order of
+    get_dirichlet_nodes. By default 0 at y=0 and 1 at y=1.
+    :param checkpoint: Path of a .npz checkpoint file for the adaptive methods, see solve_dynamic_system
+    :param checkpoint_interval: Number of steps between two checkpoints
+    :param restart: Resume from the checkpoint if it exists
+    :param store: Directory of a TrajectoryStore, or a TrajectoryStore opened for appending, e.g. a compressed one. If
+    given, the states are written to disk step by step and the returned interpolator reads only the time steps it needs
+    :param probes: Array (2, n_probes) of probe coordinates. If given, only the solution at the probes is recorded and
+    the interpolator gives an array (n_probes) instead of the nodal values. Not supported by parareal
+    :param slices: The number of time slices of parareal
+    :param fine: The fine propagator of parareal, its step size is timestep
+    :param processes: Number of worker processes of parareal
+    :param tolerance: The tolerance of the parareal iteration
+    :param check_quality: If True, a ValueError listing the degenerate and inverted triangles is raised before
+    assembly, see Mesh.check_quality
+    :return: A ND interpolator, for ensembles it gives an array (N, n_ens). For parareal, its attribute info holds the
+    dictionary of integrate_parareal with the iterations, the changes and the speedup
     """
 
+    if check_quality:
+        mesh.check_quality()
+
     vertices = mesh.vertices
     triangles = mesh.triangles
-    varnr = mesh.supportsy * mesh.supportsx
+    varnr = np.shape(vertices)[1]
     atraf = AffineTransformation()
     p1_ref = P1ReferenceElement()
-
-    # Mass matrix
-    print("[Info] Calculating mass matrix")
-    M = generate_mass_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
-
-    # Stiffness Matrix
-    print("[Info] Calculating stiffness matrix")
-    K = generate_stiffness_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
-
     b = np.zeros((varnr))
-    nr = np.shape(vertices)[1]
-    A = -np.linalg.inv(M).dot(K)
+
+    # The Dirichlet nodes are held fixed in the system, so implicit methods see a consistent problem
+    dirichlet = get_dirichlet_nodes(vertices)
+    free = sparse.diags(np.where(np.isin(np.arange(varnr), dirichlet), 0.0, 1.0))
+
+    if matrix_free:
+        print("[Info] Setting up matrix free operator")
+        A = get_heat_operator(mesh)
+        bm = b
+        jac = None
+        if method in IMPLICIT_METHODS or method == 'expm':
+            jac = free.dot(get_heat_jacobian(mesh)).tocsr()
+        mass = None
+        if method in THETA_METHODS or method == 'parareal':
+            M = sparse.csr_matrix(free.dot(sparse.diags(get_lumped_mass(mesh))) + sparse.identity(varnr) - free)
+            K = sparse.csr_matrix(free.dot(assemble_stiffness_matrix(mesh)))
+    else:
+        # Mass matrix
+        print("[Info] Calculating mass matrix")
+        M = generate_mass_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
+
+        # Stiffness Matrix
+        print("[Info] Calculating stiffness matrix")
+        K = generate_stiffness_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
+
+        # Identity rows in M and zero rows in K for the Dirichlet nodes
+        M = sparse.csr_matrix(free.dot(M) + sparse.identity(varnr) - free)
+        K = sparse.csr_matrix(free.dot(K))
+
+        if method == 'SDIRK' or method == 'parareal' or method in THETA_METHODS:
+            # Mass matrix form, M^-1 is never formed, the theta methods factorize M + theta dt K only
+            A = -K
+            bm = b
+            mass = M
+        else:
+            A = -np.linalg.inv(M.toarray()).dot(K.toarray())
+            bm = np.linalg.inv(M.toarray()).dot(b)
+            mass = None
+        jac = A
 
 
     t_arr = np.arange(t_0, t_end, timestep)
@@ -49,12 +121,28 @@ def solve_dynamic(mesh, reference_function, t_end, t_0=0, timestep=0.01, quadpac
     u = np.zeros((varnr, nrtsteps))
 
     print("[Info] Solving system in time domain")
-    u0 = np.ones_like(u[:, 0]) * 0.7
+    if u0 is None:
+        u0 = np.ones_like(u[:, 0]) * 0.7
+    u0 = np.array(u0, dtype=float)
+    if u0.ndim > 1 and method not in THETA_METHODS and method != 'expm':
+        raise ValueError('Ensembles need expm or a fixed step method, not ' + str(method))
+    sampling = None if probes is None else get_sampling_matrix(mesh, probes)
+    if sampling is not None and method == 'parareal':
+        raise ValueError('Parareal keeps the full fine trajectories, probes are not supported')
+    if store is not None:
+        if method in THETA_METHODS or method in ['expm', 'parareal']:
+            raise ValueError('Trajectory stores are written by the adaptive methods, not ' + str(method))
+        if not isinstance(store, TrajectoryStore):
+            resume = restart and checkpoint is not None and os.path.exists(checkpoint)
+            recorded = varnr if sampling is None else np.shape(sampling)[0]
+            store = open_trajectory_store(store, recorded, mesh, resume, metadata={'problem': 'heat', 'method': method})
 
     def system(t, y, args):
         J = args[0]
         b = args[1]
-        return J.dot(y) + b
+        dy = J.dot(y) + b
+        dy[dirichlet] = 0
+        return dy
 
     def bc_imposer(y,t,args):
         varnr = args[0]
@@ -69,12 +157,38 @@ def solve_dynamic(mesh, reference_function, t_end, t_0=0, timestep=0.01, quadpac
                 y[i] = 1
         return y
 
-    x, t_arr = solve_dynamic_system(system, (A,np.linalg.inv(M).dot(b)), timestep, t_end, u0,bc_imposer=bc_imposer,bc_args=(varnr,vertices))
+    u0 = bc_imposer(u0, t_0, (varnr, vertices))
+    if dirichlet_values is not None:
+        u0[dirichlet] = dirichlet_values
+
+    if method in THETA_METHODS:
+        n_steps = int(np.ceil((t_end - t_0) / timestep - 1e-10))
+        x, t_arr = integrate_theta(M, K, u0, (t_end - t_0) / n_steps, n_steps, THETA_METHODS[method], t_0, b,
+                                   sampling)
+    elif method == 'expm':
+        # The Dirichlet rows of the jacobian are zero, so the boundary values stay fixed
+        if output_times is None:
+            output_times = np.append(np.arange(t_0, t_end, timestep), t_end)
+        x, t_arr = integrate_exponential(jac, u0, output_times, t_0, bm, sampling)
+        print("[Info] Evaluated " + str(np.shape(t_arr)[0]) + " output times")
+    elif method == 'parareal':
+        x, t_arr, info = integrate_parareal(M, K, u0, t_0, t_end, slices, b, fine, timestep, tolerance=tolerance,
+                                            processes=processes, rtol=rtol, atol=atol)
+    else:
+        # The Dirichlet rows of the system are zero, the boundary values are never overwritten behind the integrator
+        x, t_arr = solve_dynamic_system(system, (A,bm), timestep, t_end, u0, t_0, method=method, rtol=rtol, atol=atol,
+                                        jac=jac, mass=mass, checkpoint=checkpoint,
+                                        checkpoint_interval=checkpoint_interval, restart=restart, store=store,
+                                        probes=sampling)
 
     print("[Info] Generating interpolator")
+    if store is not None:
+        return store.get_interpolator()
     t_arr = np.squeeze(t_arr)
 
     f = interp1d(t_arr, x)
+    if method == 'parareal':
+        f.info = info
 
     return f
 
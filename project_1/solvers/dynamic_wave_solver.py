@@ -4,114 +4,179 @@
 """
 Implements solver for 2D wave problem
 """
+import os
 import numpy as np
 import scipy.integrate as integrate
+import scipy.sparse as sparse
 
 from project_1.solvers.matrix_generation import generate_mass_matrix, generate_stiffness_matrix
 from project_1.infrastructure.p1_reference_element import P1ReferenceElement
 from project_1.infrastructure.affine_transformation import AffineTransformation
 from project_1.utils.integration import gauss_legendre_reference
-from project_1.solvers.rk_45_fd_solver import solve_dynamic_system
+from project_1.solvers.rk_45_fd_solver import solve_dynamic_system, IMPLICIT_METHODS
+from project_1.solvers.matrix_free import get_heat_operator, get_heat_jacobian
+from project_1.utils.trajectory_store import open_trajectory_store, TrajectoryStore
+from project_1.infrastructure.probes import get_sampling_matrix
+from project_1.solvers.dirichlet import DirichletLifting
 from scipy.interpolate import LinearNDInterpolator, interp1d
 
+# The wave speed c of u'' = c^2 laplace u
+WAVE_SPEED = 0.5
 
-def solve_wave_dynamic(mesh, t_end, t_0=0, timestep=0.01, quadpack=False, accuracy=1.49e-05):
+
+def solve_wave_dynamic(mesh, t_end, t_0=0, timestep=0.01, quadpack=False, accuracy=1.49e-05, matrix_free=False,
+                       method='RK45', rtol=1e-3, atol=1e-6, checkpoint=None, checkpoint_interval=100,
+                       restart=False, store=None, probes=None, check_quality=False):
     """
     Solves the Helmholtz problem under fixed BC.
     :param mesh: The mesh to operate on
     :param f_function: The inhomogenous right hand side
     :param quadpack: Should the Fortran quadpack package be used to integrate numerically
     :param accuracy: The accuracy for quadpack
+    :param matrix_free: If True, no matrices are assembled. K is applied matrix free and the mass matrix is lumped.
+    Implicit methods still get the assembled sparse jacobian.
+    :param method: The integration method, see solve_dynamic_system. 'SDIRK' integrates the mass matrix form directly.
+    :param rtol: The relative tolerance of the integration
+    :param atol: The absolute tolerance of the integration
+    :param checkpoint: Path of a .npz checkpoint file, see solve_dynamic_system
+    :param checkpoint_interval: Number of steps between two checkpoints
+    :param restart: Resume from the checkpoint if it exists
+    :param store: Directory of a TrajectoryStore, or a TrajectoryStore opened for appending, e.g. a compressed one. If
+    given, the states are written to disk step by step and the returned interpolator reads only the time steps it needs
+    :param probes: Array (2, n_probes) of probe coordinates. If given, only the displacement at the probes is recorded
+    and the interpolator gives an array (n_probes) instead of the nodal values
+    :param check_quality: If True, a ValueError listing the degenerate and inverted triangles is raised before
+    assembly, see Mesh.check_quality
     :return: An ND interpolator
     """
 
-    c = 0.5
+    c = WAVE_SPEED
+
+    if check_quality:
+        mesh.check_quality()
 
     vertices = mesh.vertices
     triangles = mesh.triangles
-    varnr = mesh.supportsy * mesh.supportsx
+    varnr = np.shape(vertices)[1]
     atraf = AffineTransformation()
     p1_ref = P1ReferenceElement()
 
-    # Mass matrix
-    print("[Info] Calculating mass matrix")
-    M = generate_mass_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
-
-    # Stiffness Matrix
-    print("[Info] Calculating stiffness matrix")
-    K = generate_stiffness_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
-    K*=c**2
-
-    b = np.zeros((varnr, 1))
-
-    A = -np.linalg.inv(M).dot(K)
-
-    # "Window" BC Dirichlet
-    nr = np.shape(vertices)[1]
-
-
-    bm = np.linalg.inv(M).dot(b)
-
-    u = np.zeros((varnr, 1))
+    lifting = get_wave_lifting(mesh)
+    free = lifting.free
+    nf = np.shape(free)[0]
+
+    if matrix_free:
+        print("[Info] Setting up matrix free operator")
+        A = get_heat_operator(mesh, c ** 2)
+
+        # The lumped mass matrix has no coupling M_FD, the constrained values enter through K_FD only
+        def first_order_system(t, y):
+            return np.concatenate((y[nf:], A.dot(lifting.extend(y[0:nf], t))[free]))
+
+        jac = None
+        if method in IMPLICIT_METHODS:
+            jac = sparse.bmat([[None, sparse.identity(nf)], [lifting.split(get_heat_jacobian(mesh, c ** 2))[0], None]],
+                              format='csr')
+        mass = None
+    else:
+        # Mass matrix
+        print("[Info] Calculating mass matrix")
+        M = generate_mass_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
+
+        # Stiffness Matrix
+        print("[Info] Calculating stiffness matrix")
+        K = generate_stiffness_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices)
+        K*=c**2
+
+        M_FF, M_FD = lifting.split(M)
+        K_FF, K_FD = lifting.split(K)
+
+        def load(t):
+            return -K_FD.dot(lifting.get_values(t)) - M_FD.dot(lifting.get_values(t, 2))
+
+        if method == 'SDIRK':
+            # Mass matrix form diag(I, M_FF) x' = [[0, I], [-K_FF, 0]] x + [0, load], M^-1 is never formed
+            J = sparse.bmat([[None, sparse.identity(nf)], [-sparse.csr_matrix(K_FF), None]], format='csr')
+            mass = sparse.block_diag((sparse.identity(nf), sparse.csr_matrix(M_FF)), format='csr')
+            forcing = load
+        else:
+            M_inv = np.linalg.inv(M_FF)
+            J = np.zeros((2 * nf, 2 * nf))
+            J[0:nf, nf:] = np.eye(nf)
+            J[nf:, 0:nf] = -M_inv.dot(K_FF)
+            mass = None
+
+            def forcing(t):
+                return M_inv.dot(load(t))
+
+        def first_order_system(t, y):
+            dy = J.dot(y)
+            dy[nf:] += forcing(t)
+            return dy
+
+        jac = J
 
     print("[Info] Solving system in time domain")
 
-    u0 = np.ones_like(u[:, 0]) * 0
-
-    v0 = np.ones_like(u[:, 0]) * 0
-
-    x0 = np.zeros((2 * varnr))
-
-    x0[0:varnr] = u0
-    x0[varnr:] = v0
-
-    J = np.zeros((2 * varnr, 2 * varnr))
-    J[0:varnr, varnr:] = np.eye(varnr)
-    J[varnr:, 0:varnr] = A
+    # Displacement and velocity at the free nodes, at rest initially
+    x0 = np.zeros((2 * nf))
 
     def system(t, y, args):
-        J = args[0]
-        b = args[1]
-        dy = J.dot(y)
-        varn = b.shape[0]
-        dy[varn:] +=b[:,0]
-        return J.dot(y)
+        return first_order_system(t, y)
 
-    def bc_imposer(y,t,args):
-        varnr = args[0]
-        vertices = args[1]
+    def expand(t, y):
+        return np.concatenate((lifting.extend(y[0:nf], t), lifting.extend(y[nf:], t, 1)))
 
-        for i in range(varnr):
-            if vertices[1, i] == 1:
-                if t<(1/3):
-                    y[i] = np.sin(3*np.pi*t)*0.2
-                else:
-                    y[i] = 0
+    # The probes sample the displacement, the first half of the state
+    sampling = None if probes is None else get_sampling_matrix(mesh, probes, 2 * varnr)
+    if store is not None and not isinstance(store, TrajectoryStore):
+        resume = restart and checkpoint is not None and os.path.exists(checkpoint)
+        recorded = 2 * varnr if sampling is None else np.shape(sampling)[0]
+        store = open_trajectory_store(store, recorded, mesh, resume, metadata={'problem': 'wave', 'method': method})
 
-        for i in range(varnr):
-            if vertices[1, i] <= 0.5 and vertices[0,i]<0.5:
-                y[i] = 0
-
-        for i in range(varnr):
-            if vertices[0, i] == 0:
-                y[i] = 0
-
-        for i in range(varnr):
-            if vertices[0, i] == 1:
-                y[i] = 0
-
-        return y
-
-    x, t_arr = solve_dynamic_system(system, (J,bm), timestep, t_end, x0,bc_imposer=bc_imposer,bc_args=(varnr,vertices))
+    x, t_arr = solve_dynamic_system(system, None, timestep, t_end, x0, t_0, method=method, rtol=rtol, atol=atol,
+                                    jac=jac, mass=mass, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
+                                    restart=restart, store=store, probes=sampling, expand=expand)
 
     print("[Info] Generating interpolator")
-    u = x[0:varnr]
+    if store is not None:
+        return store.get_interpolator(slice(0, varnr) if sampling is None else None)
+    u = x[0:varnr] if sampling is None else x
     t_arr = np.squeeze(t_arr)
     f = interp1d(t_arr, u)
 
     return f
 
 
+def get_wave_lifting(mesh):
+    """
+    Gives the "window" Dirichlet BC. The top is driven by a sine pulse, the sides and the lower left block are fixed
+    at 0.
+    :param mesh: The mesh
+    :return: The DirichletLifting
+    """
+    vertices = mesh.vertices
+    fixed = np.logical_or.reduce((np.logical_and(vertices[1] <= 0.5, vertices[0] < 0.5), vertices[0] == 0,
+                                  vertices[0] == 1))
+    driven = np.logical_and(vertices[1] == 1, np.logical_not(fixed))
+    nodes = np.where(np.logical_or(fixed, driven))[0]
+    drive = driven[nodes].astype(float)
+    return DirichletLifting(np.shape(vertices)[1], nodes, lambda t: drive * get_pulse(t),
+                            lambda t: drive * get_pulse(t, 1), lambda t: drive * get_pulse(t, 2))
+
+
+def get_pulse(t, derivative=0):
+    """
+    The boundary drive 0.2 sin(3 pi t) for t < 1/3, zero afterwards
+    :param t: The time
+    :param derivative: The order of the time derivative
+    :return: The value
+    """
+    if t >= 1 / 3:
+        return 0.0
+    return 0.2 * (3 * np.pi) ** derivative * np.sin(3 * np.pi * t + derivative * np.pi / 2)
+
+
 def mass_matrix_integrant(y, x, p1_ref, i, j):
     co = (x, y)
     return p1_ref.value(co)[i] * p1_ref.value(co)[j]
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements fixed step time integration of ensembles. All members of an ensemble share the mesh and the matrices, so
+they are advanced together: every step is one sparse matrix-matrix product and one solve with many right hand sides
+using a single factorization.
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import splu
+
+THETA_METHODS = {'backward_euler': 1.0, 'crank_nicolson': 0.5}
+
+
+def integrate_theta(mass, stiffness, X_0, timestep, n_steps, theta=1.0, t_0=0, b=None, probes=None):
+    """
+    Integrates M X' = -K X + b with the theta scheme (M + theta dt K) X_n+1 = (M - (1 - theta) dt K) X_n + dt b
+    :param mass: The sparse mass matrix M
+    :param stiffness: The sparse stiffness matrix K
+    :param X_0: The initial states, array (N) or (N, n_ens) with one member per column
+    :param timestep: The step size dt
+    :param n_steps: The number of steps
+    :param theta: 1 for backward Euler, 0.5 for Crank-Nicolson, 0 for forward Euler
+    :param t_0: The initial time
+    :param b: The constant load vector, zero if None
+    :param probes: Sparse sampling matrix (n_probes, N). If given, only the sampled values are kept at every step
+    :return: The states, array (N, n_steps + 1) or (N, n_ens, n_steps + 1), and the array of timestamps. With probes,
+    n_probes replaces N
+    """
+    stepper = ThetaStepper(mass, stiffness, timestep, theta, b)
+
+    X = np.array(X_0, dtype=float)
+    single = X.ndim == 1
+    if single:
+        X = X[:, np.newaxis]
+
+    def record(X):
+        return X if probes is None else probes.dot(X)
+
+    states = np.zeros((np.shape(record(X))[0], np.shape(X)[1], n_steps + 1))
+    states[:, :, 0] = record(X)
+    for n in range(n_steps):
+        X = stepper.step(X)
+        states[:, :, n + 1] = record(X)
+
+    t_arr = t_0 + timestep * np.arange(n_steps + 1)
+    print("[Info] Made " + str(n_steps) + " timesteps for " + str(np.shape(X)[1]) + " ensemble members")
+    if single:
+        return states[:, 0], t_arr
+    return states, t_arr
+
+
+class ThetaStepper:
+    """
+    One step of the theta scheme for M X' = -K X + b with a fixed step size, the implicit matrix is factorized once
+    """
+
+    def __init__(self, mass, stiffness, timestep, theta=1.0, b=None):
+        """
+        Factorizes M + theta dt K
+        :param mass: The sparse mass matrix M
+        :param stiffness: The sparse stiffness matrix K
+        :param timestep: The step size dt
+        :param theta: 1 for backward Euler, 0.5 for Crank-Nicolson, 0 for forward Euler
+        :param b: The constant load vector, zero if None
+        """
+        mass = sparse.csr_matrix(mass)
+        stiffness = sparse.csr_matrix(stiffness)
+        self.timestep = timestep
+        self.lu = splu(sparse.csc_matrix(mass + theta * timestep * stiffness))
+        self.explicit = (mass - (1 - theta) * timestep * stiffness).tocsr()
+        self.load = None if b is None else timestep * np.asarray(b, dtype=float)
+
+    def step(self, X):
+        """
+        Advances by one step
+        :param X: The state (N) or the states (N, n_ens)
+        :return: The states after the step
+        """
+        rhs = self.explicit.dot(X)
+        if self.load is not None:
+            rhs = rhs + (self.load if np.ndim(X) == 1 else self.load[:, np.newaxis])
+        return self.lu.solve(rhs)
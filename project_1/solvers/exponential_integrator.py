@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements an exponential integrator for linear systems x' = A x + b with constant A and b. The solution is advanced
+by the action of the matrix exponential, exp(dt A) x, computed with scipy's expm_multiply, so any dt is stable and
+only the requested output times are computed.
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import expm_multiply
+
+
+def integrate_exponential(A, x_0, output_times, t_0=0, b=None, probes=None):
+    """
+    Solves x' = A x + b exactly up to the accuracy of the exponential actions
+    :param A: The constant system matrix, dense or sparse
+    :param x_0: The initial state (N) or states (N, n_ens)
+    :param output_times: Ascending times at which the solution is wanted, all at or after t_0
+    :param t_0: The initial time
+    :param b: The constant inhomogeneity, zero if None
+    :param probes: Sparse sampling matrix (n_probes, N). If given, only the sampled values are kept at every output
+    time and the output times are advanced one by one
+    :return: An array of states (N, number of output times) or (N, n_ens, number of output times) and the array of
+    output times. With probes, n_probes replaces N
+    """
+    output_times = np.asarray(output_times, dtype=float)
+    if np.any(np.diff(output_times) < 0) or np.any(output_times < t_0):
+        raise ValueError('The output times must be ascending and not before t_0')
+    varnr = np.shape(x_0)[0]
+
+    if b is not None and np.any(b != 0):
+        # Augmented system d/dt [x, 1] = [[A, b], [0, 0]] [x, 1]
+        if sparse.issparse(A):
+            A = sparse.bmat([[A, sparse.csr_matrix(np.reshape(b, (-1, 1)))], [None, sparse.csr_matrix((1, 1))]],
+                            format='csr')
+        else:
+            A = np.block([[A, np.reshape(b, (-1, 1))], [np.zeros((1, varnr + 1))]])
+        x = np.concatenate((x_0, np.ones((1,) + np.shape(x_0)[1:])))
+    else:
+        x = np.array(x_0, dtype=float)
+
+    steps = np.diff(np.concatenate(([t_0], output_times)))
+    if probes is None and np.shape(steps)[0] > 1 and np.allclose(steps[1:], steps[1]):
+        # Evenly spaced output times share the work of one call
+        x = expm_multiply(steps[0] * A, x) if steps[0] > 0 else x
+        states = np.moveaxis(expm_multiply(A, x, start=0, stop=output_times[-1] - output_times[0],
+                                           num=np.shape(output_times)[0], endpoint=True), 0, -1)
+    elif probes is not None:
+        states = np.zeros((np.shape(probes)[0],) + np.shape(x)[1:] + np.shape(output_times))
+        for i, step in enumerate(steps):
+            if step > 0:
+                x = expm_multiply(step * A, x)
+            states[..., i] = probes.dot(x[:varnr])
+        return states, output_times
+    else:
+        states = np.zeros(np.shape(x) + np.shape(output_times))
+        for i, step in enumerate(steps):
+            if step > 0:
+                x = expm_multiply(step * A, x)
+            states[..., i] = x
+
+    return states[:varnr], output_times
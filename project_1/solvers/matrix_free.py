@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements matrix free application of the P1 stiffness and mass matrices
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import LinearOperator
+
+from project_1.infrastructure.p1_reference_element import P1ReferenceElement
+from project_1.solvers.matrix_generation import assemble_stiffness_matrix
+
+
+def get_matrix_free_operator(mesh, alpha=1, kappa=0):
+    """
+    Gives alpha*K + kappa*M as linear operator that never assembles a matrix. Each product gathers the nodal values
+    of every triangle, applies the element matrices built from the cached jacobians and scatters the result back.
+    :param mesh: The mesh
+    :param alpha: Factor of the stiffness matrix
+    :param kappa: Factor of the mass matrix
+    :return: The LinearOperator
+    """
+    triangle_array = mesh.triangle_array
+    varnr = np.shape(mesh.vertices)[1]
+    J, det, J_inv = mesh.get_element_geometry()
+
+    # Geometric factors: gradients of the basis functions on the cells and the areas
+    gradients = np.einsum('tba,bi->tai', J_inv, P1ReferenceElement().constant_gradients())
+    area = np.abs(det) / 2
+    nodes = triangle_array.ravel()
+
+    def apply(u):
+        u_local = u[triangle_array]
+        result = np.zeros_like(u_local)
+        if alpha != 0:
+            gradient_u = np.einsum('taj,tj->ta', gradients, u_local)
+            result += (alpha * area)[:, np.newaxis] * np.einsum('tai,ta->ti', gradients, gradient_u)
+        if kappa != 0:
+            # Element mass matrix is area/12 * [[2,1,1],[1,2,1],[1,1,2]]
+            result += (kappa * area / 12)[:, np.newaxis] * (u_local + np.sum(u_local, axis=1)[:, np.newaxis])
+        return np.bincount(nodes, weights=result.ravel(), minlength=varnr)
+
+    def matvec(u):
+        return apply(np.ravel(u))
+
+    def matmat(u):
+        return np.column_stack([apply(u[:, i]) for i in range(np.shape(u)[1])])
+
+    return LinearOperator((varnr, varnr), matvec=matvec, rmatvec=matvec, matmat=matmat, rmatmat=matmat,
+                          dtype=float)
+
+
+def get_stiffness_operator(mesh):
+    """
+    Gives the stiffness matrix K as matrix free linear operator
+    :param mesh: The mesh
+    :return: The LinearOperator
+    """
+    return get_matrix_free_operator(mesh, 1, 0)
+
+
+def get_mass_operator(mesh):
+    """
+    Gives the mass matrix M as matrix free linear operator
+    :param mesh: The mesh
+    :return: The LinearOperator
+    """
+    return get_matrix_free_operator(mesh, 0, 1)
+
+
+def get_lumped_mass(mesh):
+    """
+    Gives the row sums of the mass matrix
+    :param mesh: The mesh
+    :return: Vector of the lumped mass of every node
+    """
+    J, det, J_inv = mesh.get_element_geometry()
+    return np.bincount(mesh.triangle_array.ravel(), weights=np.repeat(np.abs(det) / 6, 3),
+                       minlength=np.shape(mesh.vertices)[1])
+
+
+def get_heat_operator(mesh, alpha=1):
+    """
+    Gives -alpha * M_L^-1 K for explicit time stepping of the heat equation, with M_L the lumped mass matrix
+    :param mesh: The mesh
+    :param alpha: The diffusion coefficient
+    :return: The LinearOperator
+    """
+    K = get_stiffness_operator(mesh)
+    m_lumped = get_lumped_mass(mesh)
+    varnr = np.shape(m_lumped)[0]
+
+    def matvec(u):
+        return -alpha * K.matvec(np.ravel(u)) / m_lumped
+
+    return LinearOperator((varnr, varnr), matvec=matvec, dtype=float)
+
+
+def get_heat_jacobian(mesh, alpha=1):
+    """
+    Assembles -alpha * M_L^-1 K as sparse matrix, the constant jacobian of the heat operator for implicit time stepping
+    :param mesh: The mesh
+    :param alpha: The diffusion coefficient
+    :return: The sparse matrix in CSR format
+    """
+    return (-alpha * sparse.diags(1 / get_lumped_mass(mesh)).dot(assemble_stiffness_matrix(mesh))).tocsr()
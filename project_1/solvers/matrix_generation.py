@@ -2,9 +2,14 @@
 Generates the stiffness and mass matrices
 """
 
+import os
 import numpy as np
 import scipy.integrate as integrate
-from project_1.utils.integration import gauss_legendre_reference
+from concurrent.futures import ProcessPoolExecutor
+from project_1.infrastructure.affine_transformation import AffineTransformation
+from project_1.utils.integration import gauss_legendre_reference, gauss_legendre_reference_points
+from project_1.infrastructure.p1_reference_element import P1ReferenceElement
+from project_1.utils.shared_arrays import create_shared_array, attach_shared_array
 
 def generate_mass_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr, vertices):
     """
@@ -26,14 +31,7 @@ def generate_mass_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, var
         v1_coord = (vertices[0, triangles[n].v1], vertices[1, triangles[n].v1])
         v2_coord = (vertices[0, triangles[n].v2], vertices[1, triangles[n].v2])
         atraf.set_target_cell(v0_coord, v1_coord, v2_coord)
-        for i in range(3):
-            for j in range(3):
-                if quadpack:
-                    ans, err = integrate.dblquad(mass_matrix_integrant, 0, 1, lambda x: 0, lambda x: 1, epsabs=accuracy,
-                                                 epsrel=accuracy, args=(p1_ref, i, j))
-                else:
-                    ans, err = gauss_legendre_reference(mass_matrix_integrant, args=(p1_ref, i, j))
-                M[tr_current.v[i], tr_current.v[j]] += np.abs(atraf.get_determinant()) * ans
+        M[np.ix_(tr_current.v, tr_current.v)] += mass_element_matrix(accuracy, atraf, p1_ref, quadpack)
     return M
 
 
@@ -57,21 +55,75 @@ def generate_stiffness_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles
         v1_coord = (vertices[0, triangles[n].v1], vertices[1, triangles[n].v1])
         v2_coord = (vertices[0, triangles[n].v2], vertices[1, triangles[n].v2])
         atraf.set_target_cell(v0_coord, v1_coord, v2_coord)
-        jinvt = atraf.get_inverse_jacobian().T
-        for i in range(3):
-            for j in range(3):
-                # In order to make calculation feasible
-                co = (0.1, 0.1)
-                result = jinvt.T.dot(p1_ref.gradients(co)[:, i]).T.dot(jinvt.T.dot(p1_ref.gradients(co)[:, j]))
-                if quadpack:
-                    ans, err = integrate.dblquad(stiffness_matrix_integrant_fast, 0, 1, lambda x: 0, lambda x: 1,
-                                                 epsabs=accuracy, epsrel=accuracy, args=(p1_ref, i, j, jinvt, result))
-                else:
-                    ans, err = gauss_legendre_reference(stiffness_matrix_integrant_fast,
-                                                        args=(p1_ref, i, j, jinvt, result))
-                K[tr_current.v[i], tr_current.v[j]] += np.abs(atraf.get_determinant()) * ans
+        K[np.ix_(tr_current.v, tr_current.v)] += stiffness_element_matrix(accuracy, atraf, p1_ref, quadpack)
     return K
 
+
+def mass_element_matrix(accuracy, atraf, p1_ref, quadpack, coefficient=None):
+    """
+    Calculates the mass matrix of the current target cell of the affine transformation
+    :param accuracy: The desired accuracy of the integration if quadpack is used
+    :param atraf: The affine transformation object with the target cell set
+    :param p1_ref: The reference element
+    :param quadpack: should the quadpack integrator be used
+    :param coefficient: The reaction coefficient c(x). None for c=1
+    :return: The 3x3 element matrix
+    """
+    M_e = np.zeros((3, 3))
+    det = atraf.get_determinant()
+    jacobian = atraf.get_jacobian()
+    for i in range(3):
+        for j in range(3):
+            if coefficient is None:
+                integrant = mass_matrix_integrant
+                args = (p1_ref, i, j)
+            else:
+                integrant = mass_matrix_integrant_coefficient
+                args = (p1_ref, i, j, coefficient, jacobian, atraf.v0)
+            if quadpack:
+                ans, err = integrate.dblquad(integrant, 0, 1, lambda x: 0, lambda x: 1, epsabs=accuracy,
+                                             epsrel=accuracy, args=args)
+            else:
+                ans, err = gauss_legendre_reference(integrant, args=args)
+            M_e[i, j] = np.abs(det) * ans
+    return M_e
+
+
+def stiffness_element_matrix(accuracy, atraf, p1_ref, quadpack, coefficient=None):
+    """
+    Calculates the stiffness matrix of the current target cell of the affine transformation
+    :param accuracy: The desired accuracy of the integration if quadpack is used
+    :param atraf: The affine transformation object with the target cell set
+    :param p1_ref: The reference element
+    :param quadpack: should the quadpack integrator be used
+    :param coefficient: The diffusion coefficient kappa(x), scalar or 2x2 valued. None for kappa=1
+    :return: The 3x3 element matrix
+    """
+    K_e = np.zeros((3, 3))
+    det = atraf.get_determinant()
+    jacobian = atraf.get_jacobian()
+    jinvt = atraf.get_inverse_jacobian().T
+    # The gradients are constant on the cell, J^-T * grad(phi_ref)
+    gradients = jinvt.dot(p1_ref.constant_gradients())
+    for i in range(3):
+        for j in range(3):
+            if coefficient is None:
+                # In order to make calculation feasible
+                result = gradients[:, i].dot(gradients[:, j])
+                integrant = stiffness_matrix_integrant_fast
+                args = (p1_ref, i, j, jinvt, result)
+            else:
+                integrant = stiffness_matrix_integrant_coefficient
+                args = (p1_ref, i, j, gradients, coefficient, jacobian, atraf.v0)
+            if quadpack:
+                ans, err = integrate.dblquad(integrant, 0, 1, lambda x: 0, lambda x: 1, epsabs=accuracy,
+                                             epsrel=accuracy, args=args)
+            else:
+                ans, err = gauss_legendre_reference(integrant, args=args)
+            K_e[i, j] = np.abs(det) * ans
+    return K_e
+
+
 def mass_matrix_integrant(y, x, p1_ref, i, j):
     """
     Integrant of the mass matrix
@@ -86,6 +138,48 @@ def mass_matrix_integrant(y, x, p1_ref, i, j):
     return p1_ref.value(co)[i] * p1_ref.value(co)[j]
 
 
+def mass_matrix_integrant_coefficient(y, x, p1_ref, i, j, coefficient, jacobian, v0_coord):
+    """
+    Integrant of the mass matrix with a reaction coefficient
+    :param y: Position in y
+    :param x: Position in x
+    :param p1_ref: P1 reference element
+    :param i: Index of the first basis
+    :param j: Index of the second basis
+    :param coefficient: The coefficient c(x)
+    :param jacobian: Jacobian of the transformation
+    :param v0_coord: Coordinate of v0
+    :return: The value of the integrant
+    """
+    co = (x, y)
+    values = p1_ref.value(co)
+    if values[i] == 0 or values[j] == 0:
+        return 0
+    x_new = jacobian.dot(np.array([x, y])) + np.asarray(v0_coord)
+    return call_coefficient(coefficient, (x_new[0], x_new[1])) * values[i] * values[j]
+
+
+def stiffness_matrix_integrant_coefficient(y, x, p1_ref, i, j, gradients, coefficient, jacobian, v0_coord):
+    """
+    Integrant of the stiffness matrix with a diffusion coefficient
+    :param y: Position in y
+    :param x: Position in x
+    :param p1_ref: P1 reference element
+    :param i: Index of the first basis
+    :param j: Index of the second basis
+    :param gradients: The gradients of the basis functions on the cell
+    :param coefficient: The coefficient kappa(x), scalar or 2x2 valued
+    :param jacobian: Jacobian of the transformation
+    :param v0_coord: Coordinate of v0
+    :return: The value of the integrant
+    """
+    if x + y > 1:
+        return 0
+    x_new = jacobian.dot(np.array([x, y])) + np.asarray(v0_coord)
+    kappa = call_coefficient(coefficient, (x_new[0], x_new[1]))
+    return gradients[:, i].dot(np.dot(kappa, gradients[:, j]))
+
+
 def stiffness_matrix_integrant_fast(y, x, p1_ref, i, j, jinvt, result):
     if (x + y > 1):
         result = 0
@@ -94,4 +188,239 @@ def stiffness_matrix_integrant_fast(y, x, p1_ref, i, j, jinvt, result):
 
 def stiffness_matrix_integrant(y, x, p1_ref, i, j, jinvt):
     co = (x, y)
-    return jinvt.dot(p1_ref.gradients(co)[:, i]).T.dot(jinvt.dot(p1_ref.gradients(co)[:, j]))
\ No newline at end of file
+    return jinvt.dot(p1_ref.gradients(co)[:, i]).T.dot(jinvt.dot(p1_ref.gradients(co)[:, j]))
+
+
+def assemble_mass_matrix(mesh, c=None, supports=7, out=None):
+    """
+    Assembles the mass matrix with the reaction coefficient c(x) for all triangles at once
+    :param mesh: The mesh
+    :param c: The coefficient. None for c=1, a scalar or a function of x. Functions have to accept an array (2,T,Q)
+    of all quadrature points and return an array (T,Q)
+    :param supports: Number of supports of the Gauss-Legendre quadrature
+    :param out: A matrix previously assembled on the same mesh. If given, its values are overwritten in place
+    :return: The sparse mass matrix
+    """
+    return scatter_element_matrices(mesh, mass_element_matrices(mesh, c, supports), out)
+
+
+def assemble_stiffness_matrix(mesh, kappa=None, supports=7, out=None):
+    """
+    Assembles the stiffness matrix with the diffusion coefficient kappa(x) for all triangles at once
+    :param mesh: The mesh
+    :param kappa: The coefficient. None for kappa=1, a scalar, a 2x2 tensor or a function of x. Functions have to
+    accept an array (2,T,Q) of all quadrature points and return an array (T,Q) or, for anisotropic diffusion, (2,2,T,Q)
+    :param supports: Number of supports of the Gauss-Legendre quadrature
+    :param out: A matrix previously assembled on the same mesh. If given, its values are overwritten in place
+    :return: The sparse stiffness matrix
+    """
+    return scatter_element_matrices(mesh, stiffness_element_matrices(mesh, kappa, supports), out)
+
+
+def assemble_load_vector(mesh, f_function, supports=7):
+    """
+    Assembles the load vector of the right hand side f for all triangles at once
+    :param mesh: The mesh
+    :param f_function: The right hand side, a constant or a function accepting an array (2,T,Q) of all quadrature
+    points
+    :param supports: Number of supports of the Gauss-Legendre quadrature
+    :return: The load vector
+    """
+    J, det, J_inv = mesh.get_element_geometry()
+    points, weights = gauss_legendre_reference_points(supports)
+    phi = P1ReferenceElement().batch_value(points)
+
+    f_q = evaluate_coefficient(f_function, mesh, points)
+    f_q = np.broadcast_to(f_q, (np.shape(det)[0], np.shape(weights)[0]))
+
+    element_vectors = np.einsum('tq,q,t,iq->ti', f_q, weights, np.abs(det), phi)
+    return np.bincount(mesh.triangle_array.ravel(), weights=element_vectors.ravel(),
+                       minlength=np.shape(mesh.vertices)[1])
+
+
+def mass_element_matrices(mesh, c=None, supports=7):
+    """
+    Calculates the element mass matrices of all triangles
+    :param mesh: The mesh
+    :param c: The reaction coefficient, see assemble_mass_matrix
+    :param supports: Number of supports of the Gauss-Legendre quadrature
+    :return: Array (T,3,3) of the element matrices
+    """
+    J, det, J_inv = mesh.get_element_geometry()
+    points, weights = gauss_legendre_reference_points(supports)
+    phi = P1ReferenceElement().batch_value(points)
+
+    c_q = evaluate_coefficient(c, mesh, points)
+    c_q = np.broadcast_to(c_q, (np.shape(det)[0], np.shape(weights)[0]))
+
+    return np.einsum('tq,q,t,iq,jq->tij', c_q, weights, np.abs(det), phi, phi)
+
+
+def stiffness_element_matrices(mesh, kappa=None, supports=7):
+    """
+    Calculates the element stiffness matrices of all triangles
+    :param mesh: The mesh
+    :param kappa: The diffusion coefficient, see assemble_stiffness_matrix
+    :param supports: Number of supports of the Gauss-Legendre quadrature
+    :return: Array (T,3,3) of the element matrices
+    """
+    J, det, J_inv = mesh.get_element_geometry()
+    points, weights = gauss_legendre_reference_points(supports)
+    tr_nr = np.shape(det)[0]
+
+    # Gradients of the basis functions on the cells, J^-T * grad(phi_ref)
+    gradients = np.einsum('tba,bi->tai', J_inv, P1ReferenceElement().constant_gradients())
+
+    kappa_q = evaluate_coefficient(kappa, mesh, points)
+    if np.shape(kappa_q)[:2] == (2, 2):
+        # Anisotropic diffusion tensor
+        if np.ndim(kappa_q) == 2:
+            kappa_q = kappa_q[:, :, np.newaxis, np.newaxis]
+        kappa_q = np.broadcast_to(kappa_q, (2, 2, tr_nr, np.shape(weights)[0]))
+        kappa_t = np.einsum('abtq,q,t->tab', kappa_q, weights, np.abs(det))
+        return np.einsum('tai,tab,tbj->tij', gradients, kappa_t, gradients)
+
+    kappa_q = np.broadcast_to(kappa_q, (tr_nr, np.shape(weights)[0]))
+    kappa_t = np.einsum('tq,q,t->t', kappa_q, weights, np.abs(det))
+    return np.einsum('t,tai,taj->tij', kappa_t, gradients, gradients)
+
+
+def evaluate_coefficient(coefficient, mesh, points):
+    """
+    Evaluates a coefficient at the quadrature points of all triangles in one call
+    :param coefficient: None, a constant or a function (callable or object providing .value(x))
+    :param mesh: The mesh
+    :param points: Array (2,Q) of the quadrature points on the reference cell
+    :return: The values of the coefficient
+    """
+    if coefficient is None:
+        return np.ones(1)
+    if not callable(coefficient) and not hasattr(coefficient, 'value'):
+        return np.asarray(coefficient, dtype=float)
+
+    return np.asarray(call_coefficient(coefficient, get_quadrature_coordinates(mesh, points)), dtype=float)
+
+
+def call_coefficient(coefficient, x):
+    """
+    Evaluates a coefficient function
+    :param coefficient: A callable or an object providing .value(x)
+    :param x: The coordinates (x,y), either scalars or arrays
+    :return: The value of the coefficient at x
+    """
+    if hasattr(coefficient, 'value'):
+        return coefficient.value(x)
+    return coefficient(x)
+
+
+def get_quadrature_coordinates(mesh, points):
+    """
+    Maps quadrature points from the reference cell onto all triangles
+    :param mesh: The mesh
+    :param points: Array (2,Q) of points on the reference cell
+    :return: Array (2,T,Q) of the (x,y) coordinates on the triangles
+    """
+    J, det, J_inv = mesh.get_element_geometry()
+    v0 = mesh.vertices[:, mesh.triangle_array[:, 0]]
+    return v0[:, :, np.newaxis] + np.einsum('tab,bq->atq', J, points)
+
+
+def scatter_element_matrices(mesh, element_matrices, out=None):
+    """
+    Sums the element matrices into a global sparse matrix on the cached sparsity pattern of the mesh
+    :param mesh: The mesh
+    :param element_matrices: Array (T,3,3) of the element matrices
+    :param out: A matrix previously assembled on the same mesh. If given, its values are overwritten in place
+    :return: The sparse matrix in CSR format
+    """
+    return mesh.get_sparsity_pattern().assemble(element_matrices, out)
+
+
+def generate_matrix_parallel(matrix, mesh, processes=None, chunks=None, quadpack=False, accuracy=1.49e-05,
+                             coefficient=None):
+    """
+    Generates the mass or stiffness matrix with the element wise integration spread over a process pool. The mesh
+    and the element matrices are exchanged through shared memory, only chunk bounds are pickled.
+    :param matrix: Either 'mass' or 'stiffness'
+    :param mesh: The mesh
+    :param processes: Number of worker processes. None for the number of CPUs
+    :param chunks: Number of chunks the triangles are split into. None for four chunks per process
+    :param quadpack: should the quadpack integrator be used
+    :param accuracy: The desired accuracy of the integration if quadpack is used
+    :param coefficient: The coefficient, see mass_element_matrix and stiffness_element_matrix. Has to be picklable
+    :return: The sparse matrix in CSR format
+    """
+    if matrix not in ('mass', 'stiffness'):
+        raise ValueError('Unknown matrix ' + str(matrix))
+
+    tr_nr = np.shape(mesh.triangle_array)[0]
+    blocks = []
+    try:
+        vertices, block = create_shared_array(mesh.vertices, np.float64)
+        blocks.append(block)
+        triangle_array, block = create_shared_array(mesh.triangle_array, np.int64)
+        blocks.append(block)
+        values, block = create_shared_array(np.zeros((tr_nr, 3, 3)), np.float64)
+        blocks.append(block)
+
+        shared = [(block.name, np.shape(array), array.dtype.str) for block, array in
+                  zip(blocks, (vertices, triangle_array, values))]
+
+        if processes is None:
+            processes = os.cpu_count()
+        if chunks is None:
+            chunks = 4 * processes
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_assembly_worker,
+                                 initargs=(shared, matrix, quadpack, accuracy, coefficient)) as executor:
+            bounds = np.linspace(0, tr_nr, num=min(chunks, max(tr_nr, 1)) + 1).astype(int)
+            list(executor.map(_assemble_chunk, bounds[:-1], bounds[1:]))
+
+        # Summing the COO entries into the cached pattern of the mesh
+        return mesh.get_sparsity_pattern().assemble(values)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+_assembly_worker = {}
+
+
+def _init_assembly_worker(shared, matrix, quadpack, accuracy, coefficient):
+    """
+    Attaches a worker process to the shared memory
+    :param shared: List of (name, shape, dtype) of the vertices, triangles and element matrices
+    :param matrix: Either 'mass' or 'stiffness'
+    :param quadpack: should the quadpack integrator be used
+    :param accuracy: The desired accuracy of the integration if quadpack is used
+    :param coefficient: The coefficient
+    """
+    arrays = []
+    blocks = []
+    for name, shape, dtype in shared:
+        array, block = attach_shared_array(name, shape, dtype)
+        blocks.append(block)
+        arrays.append(array)
+
+    _assembly_worker['blocks'] = blocks
+    _assembly_worker['arrays'] = arrays
+    _assembly_worker['element_matrix'] = mass_element_matrix if matrix == 'mass' else stiffness_element_matrix
+    _assembly_worker['args'] = (accuracy, AffineTransformation(), P1ReferenceElement(), quadpack, coefficient)
+
+
+def _assemble_chunk(start, stop):
+    """
+    Calculates the element matrices of a chunk of triangles and writes them into shared memory
+    :param start: First triangle of the chunk
+    :param stop: End of the chunk
+    :return: Number of processed triangles
+    """
+    vertices, triangle_array, values = _assembly_worker['arrays']
+    element_matrix = _assembly_worker['element_matrix']
+    accuracy, atraf, p1_ref, quadpack, coefficient = _assembly_worker['args']
+    for n in range(start, stop):
+        v = triangle_array[n]
+        atraf.set_target_cell((vertices[0, v[0]], vertices[1, v[0]]), (vertices[0, v[1]], vertices[1, v[1]]),
+                              (vertices[0, v[2]], vertices[1, v[2]]))
+        values[n] = element_matrix(accuracy, atraf, p1_ref, quadpack, coefficient)
+    return stop - start
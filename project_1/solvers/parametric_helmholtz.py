@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements a parametric solver for the 2D Helmholtz problem -alpha*laplace(u) + kappa*u = f
+"""
+import numpy as np
+import scipy.sparse as sparse
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse.linalg import splu
+
+from project_1.infrastructure.p1_reference_element import P1ReferenceElement
+from project_1.infrastructure.affine_transformation import AffineTransformation
+from project_1.solvers.matrix_generation import generate_mass_matrix, generate_stiffness_matrix, \
+    assemble_mass_matrix, assemble_stiffness_matrix
+from project_1.solvers.solver_helmholtz import generate_linear_form, get_dirichlet_nodes
+
+
+class ParametricHelmholtzSolver:
+    """
+    Solves (alpha*K + kappa*M) u = b for many parameter pairs (alpha, kappa).
+
+    K, M and b are assembled once. Both matrices are stored on a common sparsity pattern whose columns are
+    permuted once by a fill reducing ordering, so every solve only has to add two data arrays and run the
+    numerical factorization.
+    """
+
+    def __init__(self, mesh, f_function, quadpack=False, accuracy=1.49e-05, supports=7):
+        """
+        Assembles the system
+        :param mesh: The mesh to operate on
+        :param f_function: The inhomogenous right hand side
+        :param quadpack: Should the Fortran quadpack package be used to integrate numerically
+        :param accuracy: The accuracy for quadpack
+        :param supports: Number of supports for the Gauss-Legendre integration of the linear form
+        """
+        vertices = mesh.vertices
+        triangles = mesh.triangles
+        varnr = np.shape(vertices)[1]
+        atraf = AffineTransformation()
+        p1_ref = P1ReferenceElement()
+
+        if quadpack:
+            print("[Info] Calculating mass matrix")
+            M = sparse.csr_matrix(generate_mass_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles, varnr,
+                                                       vertices))
+
+            print("[Info] Calculating stiffness matrix")
+            K = sparse.csr_matrix(generate_stiffness_matrix(accuracy, atraf, mesh, p1_ref, quadpack, triangles,
+                                                            varnr, vertices))
+        else:
+            # Both matrices share the cached sparsity pattern of the mesh
+            print("[Info] Calculating mass matrix")
+            M = assemble_mass_matrix(mesh)
+
+            print("[Info] Calculating stiffness matrix")
+            K = assemble_stiffness_matrix(mesh)
+
+        print("[Info] Calculating linear form")
+        b = generate_linear_form(accuracy, atraf, f_function, mesh, p1_ref, quadpack, supports, triangles, varnr,
+                                 vertices)
+
+        self.vertices = vertices
+        self.varnr = varnr
+        self.set_system(K, M, b, get_dirichlet_nodes(vertices))
+
+    def set_system(self, K, M, b, dirichlet):
+        """
+        Builds the common sparsity pattern and the column ordering used by all solves
+        :param K: The stiffness matrix
+        :param M: The mass matrix
+        :param b: The linear form
+        :param dirichlet: Indices of the nodes with homogenous Dirichlet BC
+        """
+        K = sparse.csr_matrix(K)
+        M = sparse.csr_matrix(M)
+        varnr = K.shape[0]
+
+        # Union of both patterns, the diagonal is needed for the Dirichlet rows
+        pattern = (abs(K) + abs(M) + sparse.identity(varnr, format='csr')).tocsc()
+
+        # Fill reducing column ordering, computed once on a representative matrix
+        lu = splu(sparse.csc_matrix(K + M), permc_spec='COLAMD')
+        order = np.argsort(lu.perm_c)
+
+        pattern = pattern[:, order].tocsc()
+        pattern.sort_indices()
+        rows = pattern.indices
+        cols = order[np.repeat(np.arange(varnr), np.diff(pattern.indptr))]
+
+        k_data = np.asarray(K[rows, cols]).ravel()
+        m_data = np.asarray(M[rows, cols]).ravel()
+        i_data = np.zeros_like(k_data)
+
+        is_dirichlet = np.zeros(varnr, dtype=bool)
+        is_dirichlet[dirichlet] = True
+        bc_rows = is_dirichlet[rows]
+        k_data[bc_rows] = 0
+        m_data[bc_rows] = 0
+        i_data[np.logical_and(bc_rows, rows == cols)] = 1
+
+        b = np.array(b, dtype=float).reshape(varnr)
+        b[dirichlet] = 0
+
+        self.varnr = varnr
+        self.K = K
+        self.M = M
+        self.b = b
+        self.order = order
+        self.indices = pattern.indices
+        self.indptr = pattern.indptr
+        self.k_data = k_data
+        self.m_data = m_data
+        self.i_data = i_data
+
+    def solve_single(self, alpha, kappa):
+        """
+        Solves the system for a single parameter pair
+        :param alpha: The diffusion scaling
+        :param kappa: The reaction coefficient
+        :return: The solution vector
+        """
+        return _solve_pair(self._state(), alpha, kappa)
+
+    def solve(self, parameters, processes=None):
+        """
+        Solves the system for all parameter pairs
+        :param parameters: Array of shape (n,2) holding the pairs (alpha, kappa)
+        :param processes: Number of worker processes. If None or 1, the sweep is run in this process
+        :return: Array of shape (varnr, n) with the solution of pair i in column i
+        """
+        parameters = np.atleast_2d(np.asarray(parameters, dtype=float))
+        n = np.shape(parameters)[0]
+        u = np.zeros((self.varnr, n))
+
+        if processes is None or processes <= 1:
+            state = self._state()
+            for i in range(n):
+                u[:, i] = _solve_pair(state, parameters[i, 0], parameters[i, 1])
+            return u
+
+        # The state is shipped once per worker, not once per parameter pair
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(self._state(),)) as executor:
+            chunks = np.array_split(np.arange(n), processes)
+            results = executor.map(_solve_chunk, [parameters[chunk] for chunk in chunks])
+            for chunk, u_chunk in zip(chunks, results):
+                u[:, chunk] = u_chunk
+        return u
+
+    def _state(self):
+        """
+        Collects everything a solve needs
+        :return: Tuple with the pattern, the data arrays, the ordering and the right hand side
+        """
+        return (self.indices, self.indptr, self.k_data, self.m_data, self.i_data, self.order, self.b)
+
+
+_worker_state = None
+
+
+def _init_worker(state):
+    """
+    Stores the system in the worker process
+    :param state: The state as given by ParametricHelmholtzSolver._state
+    """
+    global _worker_state
+    _worker_state = state
+
+
+def _solve_chunk(parameters):
+    """
+    Solves a chunk of the sweep inside a worker process
+    :param parameters: Array of shape (n,2) of parameter pairs
+    :return: Array of shape (varnr, n) of solutions
+    """
+    u = np.zeros((np.shape(_worker_state[6])[0], np.shape(parameters)[0]))
+    for i in range(np.shape(parameters)[0]):
+        u[:, i] = _solve_pair(_worker_state, parameters[i, 0], parameters[i, 1])
+    return u
+
+
+def _solve_pair(state, alpha, kappa):
+    """
+    Solves (alpha*K + kappa*M) u = b on the precomputed pattern
+    :param state: The state as given by ParametricHelmholtzSolver._state
+    :param alpha: The diffusion scaling
+    :param kappa: The reaction coefficient
+    :return: The solution vector
+    """
+    indices, indptr, k_data, m_data, i_data, order, b = state
+    varnr = np.shape(b)[0]
+    data = alpha * k_data + kappa * m_data + i_data
+    A = sparse.csc_matrix((data, indices, indptr), shape=(varnr, varnr))
+    y = splu(A, permc_spec='NATURAL').solve(b)
+    u = np.zeros(varnr)
+    u[order] = y
+    return u
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements the parareal algorithm for linear systems M u' = -K u + b. The time interval is split into slices, a cheap
+coarse propagator G, large backward Euler steps, sweeps sequentially over the slices and an accurate fine propagator F
+runs on all slices at once in a process pool. The correction U_n+1 = G(U_n^new) + F(U_n^old) - G(U_n^old) is iterated
+until the values at the slice boundaries stop changing. After k iterations the first k slices are exact.
+"""
+
+import time
+import numpy as np
+import scipy.sparse as sparse
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse.linalg import splu
+
+from project_1.solvers.ensemble import ThetaStepper, THETA_METHODS
+from project_1.solvers.rk_45_fd_solver import solve_dynamic_system, SOLVERS
+
+
+def integrate_parareal(mass, stiffness, x_0, t_0, t_end, n_slices, b=None, fine='crank_nicolson', fine_timestep=0.01,
+                       coarse_steps=4, tolerance=1e-6, max_iterations=None, processes=None, rtol=1e-6, atol=1e-9):
+    """
+    Integrates M u' = -K u + b from t_0 to t_end with parareal
+    :param mass: The sparse mass matrix M
+    :param stiffness: The sparse stiffness matrix K
+    :param x_0: The initial state
+    :param t_0: The initial time
+    :param t_end: The final time
+    :param n_slices: The number of time slices, at most this many fine sweeps run in parallel
+    :param b: The constant load vector, zero if None
+    :param fine: The fine propagator, 'backward_euler' or 'crank_nicolson' with fixed steps or one of the methods of
+    solve_dynamic_system. 'SDIRK' uses the mass matrix form, the others get the dense jacobian -M^-1 K.
+    :param fine_timestep: The step size of the fixed step fine propagators, the maximal one of the adaptive ones
+    :param coarse_steps: The number of backward Euler steps of the coarse propagator per slice
+    :param tolerance: The iteration stops once the largest change at a slice boundary, relative to the largest value,
+    is below this
+    :param max_iterations: The maximal number of iterations, n_slices by default, after which parareal is exact
+    :param processes: Number of worker processes. If None or 1, the fine sweeps run in this process
+    :param rtol: The relative tolerance of the adaptive fine propagators
+    :param atol: The absolute tolerance of the adaptive fine propagators
+    :return: The states (N, number of times) of the last fine sweep, the array of timestamps and a dictionary with the
+    number of iterations, the changes per iteration, the run time, the serial fine time and the speedup
+    """
+    if fine not in THETA_METHODS and fine not in SOLVERS:
+        raise ValueError('Unknown fine propagator ' + str(fine))
+    if max_iterations is None:
+        max_iterations = n_slices
+    start = time.perf_counter()
+
+    slice_times = np.linspace(t_0, t_end, n_slices + 1)
+    slice_length = (t_end - t_0) / n_slices
+    coarse = ThetaStepper(mass, stiffness, slice_length / coarse_steps, 1.0, b)
+
+    def propagate_coarse(x):
+        for step in range(coarse_steps):
+            x = coarse.step(x)
+        return x
+
+    # Initial guess by one coarse sweep
+    U = np.zeros((n_slices + 1, np.shape(x_0)[0]))
+    U[0] = x_0
+    G = np.zeros_like(U)
+    for n in range(n_slices):
+        G[n + 1] = propagate_coarse(U[n])
+        U[n + 1] = G[n + 1]
+
+    state = (sparse.csr_matrix(mass), sparse.csr_matrix(stiffness), b, fine, fine_timestep, slice_length, rtol, atol)
+    parallel = processes is not None and processes > 1
+    executor = None
+    if parallel:
+        executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(state,))
+    else:
+        _init_worker(state)
+
+    changes = []
+    trajectories = [None] * n_slices
+    fine_time = 0
+    try:
+        for k in range(max_iterations):
+            # The first k slices start from exact values and are not swept again
+            tasks = [(U[n], slice_times[n], slice_times[n + 1]) for n in range(k, n_slices)]
+            if parallel:
+                results = list(executor.map(_propagate_fine, tasks))
+            else:
+                results = [_propagate_fine(task) for task in tasks]
+            for n, result in zip(range(k, n_slices), results):
+                trajectories[n] = result[:2]
+                if k == 0:
+                    fine_time += result[2]
+
+            # Sequential correction sweep
+            U_new = np.array(U)
+            for n in range(k, n_slices):
+                G_new = propagate_coarse(U_new[n])
+                U_new[n + 1] = G_new + trajectories[n][1][:, -1] - G[n + 1]
+                G[n + 1] = G_new
+            change = np.max(np.abs(U_new - U)) / max(np.max(np.abs(U_new)), np.finfo(float).tiny)
+            changes.append(change)
+            U = U_new
+            if change < tolerance:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    iterations = len(changes)
+    run_time = time.perf_counter() - start
+    speedup = fine_time / run_time
+    print("[Info] Parareal made " + str(iterations) + " iterations over " + str(n_slices) + " slices, change " +
+          str(changes[-1]) + ", speedup " + str(round(speedup, 2)) + " (at most " +
+          str(round(n_slices / iterations, 2)) + ")")
+
+    # The fine trajectories of the last sweep, the repeated slice boundaries are dropped
+    times = [trajectories[0][0][:1]] + [trajectory[0][1:] for trajectory in trajectories]
+    states = [trajectories[0][1][:, :1]] + [trajectory[1][:, 1:] for trajectory in trajectories]
+    info = {'iterations': iterations, 'changes': changes, 'run_time': run_time, 'fine_time': fine_time,
+            'speedup': speedup}
+    return np.concatenate(states, axis=1), np.concatenate(times), info
+
+
+_worker_state = None
+
+
+def _init_worker(state):
+    """
+    Prepares the fine propagator in the worker process, factorizations are done once per worker
+    :param state: Tuple of mass, stiffness, load, fine method, fine step size, slice length, rtol and atol
+    """
+    global _worker_state
+    mass, stiffness, b, fine, fine_timestep, slice_length, rtol, atol = state
+    if b is None:
+        b = np.zeros(np.shape(mass)[0])
+    if fine in THETA_METHODS:
+        fine_steps = int(np.ceil(slice_length / fine_timestep - 1e-10))
+        propagator = ThetaStepper(mass, stiffness, slice_length / fine_steps, THETA_METHODS[fine], b)
+        _worker_state = (fine, propagator, fine_steps)
+    elif fine == 'SDIRK':
+        # Mass matrix form, M^-1 is never formed
+        _worker_state = (fine, (-stiffness, b), {'jac': -stiffness, 'mass': mass}, fine_timestep, rtol, atol)
+    else:
+        lu = splu(sparse.csc_matrix(mass))
+        A = -lu.solve(stiffness.toarray())
+        _worker_state = (fine, (A, lu.solve(b)), {'jac': A}, fine_timestep, rtol, atol)
+
+
+def _linear_system(t, y, args):
+    """
+    The right hand side J y + b
+    :param t: The time
+    :param y: The state
+    :param args: Tuple of J and b
+    :return: The right hand side
+    """
+    return args[0].dot(y) + args[1]
+
+
+def _propagate_fine(task):
+    """
+    Runs the fine propagator over one slice
+    :param task: Tuple of the initial state, the initial and the final time of the slice
+    :return: The timestamps, the states (N, number of timestamps) and the elapsed time
+    """
+    x, t_start, t_stop = task
+    start = time.perf_counter()
+    if _worker_state[0] in THETA_METHODS:
+        fine, propagator, fine_steps = _worker_state
+        states = np.zeros((np.shape(x)[0], fine_steps + 1))
+        states[:, 0] = x
+        for n in range(fine_steps):
+            states[:, n + 1] = propagator.step(states[:, n])
+        times = np.linspace(t_start, t_stop, fine_steps + 1)
+    else:
+        fine, args, options, fine_timestep, rtol, atol = _worker_state
+        states, times = solve_dynamic_system(_linear_system, args, fine_timestep, t_stop, np.array(x), t_start,
+                                             method=fine, rtol=rtol, atol=atol, **options)
+        times = times[0]
+    return times, states, time.perf_counter() - start
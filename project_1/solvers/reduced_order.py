@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements reduced order models by proper orthogonal decomposition. Snapshots of full solutions are compressed into
+an orthonormal basis V by a thin, or for large snapshot sets randomized, SVD. The systems M u' = -K u + b and
+M u'' = -K u + b are Galerkin projected onto u = u_mean + V a, so online solves only touch small dense matrices and full
+fields are reconstructed on demand. Time dependent Dirichlet BC are lifted as in the solvers, only the free nodes are
+reduced and the prescribed values enter as forcing.
+"""
+
+import numpy as np
+import scipy.linalg as linalg
+
+from project_1.solvers.ensemble import THETA_METHODS
+
+
+def collect_snapshots(interpolators, times):
+    """
+    Collects snapshots from solver trajectories
+    :param interpolators: List of the interpolators returned by solve_dynamic or solve_wave_dynamic
+    :param times: The times at which every trajectory is sampled
+    :return: Array (N, number of trajectories * number of times) with one snapshot per column
+    """
+    return np.concatenate([np.reshape(f(times), (-1, np.shape(times)[0])) for f in interpolators], axis=1)
+
+
+def compute_pod_basis(snapshots, rank=None, energy=0.9999, randomized=None, oversampling=10, power_iterations=2,
+                      seed=0):
+    """
+    Computes the POD basis of the snapshots
+    :param snapshots: Array (N, n) with one snapshot per column
+    :param rank: The number of basis vectors. If None, the smallest number keeping the given fraction of the energy
+    :param energy: The fraction of the squared singular values kept if rank is None
+    :param randomized: Use the randomized SVD, which needs a rank. By default it is used for more than 500 snapshots
+    when a rank is given
+    :param oversampling: Additional random samples of the randomized SVD
+    :param power_iterations: Subspace iterations of the randomized SVD, they sharpen slowly decaying spectra
+    :param seed: The seed of the random samples
+    :return: The basis (N, rank) with orthonormal columns and all computed singular values
+    """
+    snapshots = np.asarray(snapshots, dtype=float)
+    if randomized is None:
+        randomized = rank is not None and np.shape(snapshots)[1] > 500
+    if randomized:
+        if rank is None:
+            raise ValueError('The randomized SVD needs a rank')
+        U, s = randomized_svd(snapshots, rank, oversampling, power_iterations, seed)
+    else:
+        U, s, Vt = linalg.svd(snapshots, full_matrices=False)
+        if rank is None:
+            fractions = np.cumsum(s ** 2) / max(np.sum(s ** 2), np.finfo(float).tiny)
+            rank = int(np.searchsorted(fractions, energy) + 1)
+    rank = min(rank, np.shape(U)[1])
+    print("[Info] POD basis of rank " + str(rank) + " from " + str(np.shape(snapshots)[1]) + " snapshots")
+    return U[:, :rank], s
+
+
+def randomized_svd(snapshots, rank, oversampling=10, power_iterations=2, seed=0):
+    """
+    Approximates the leading singular vectors by sampling the range of the snapshots with random vectors
+    :param snapshots: Array (N, n)
+    :param rank: The number of singular vectors
+    :param oversampling: Additional random samples
+    :param power_iterations: Subspace iterations
+    :param seed: The seed of the random samples
+    :return: The left singular vectors (N, rank) and the singular values
+    """
+    rng = np.random.default_rng(seed)
+    samples = min(rank + oversampling, min(np.shape(snapshots)))
+    Q, R = np.linalg.qr(snapshots.dot(rng.standard_normal((np.shape(snapshots)[1], samples))))
+    for i in range(power_iterations):
+        Q, R = np.linalg.qr(snapshots.T.dot(Q))
+        Q, R = np.linalg.qr(snapshots.dot(Q))
+    U, s, Vt = linalg.svd(Q.T.dot(snapshots), full_matrices=False)
+    return Q.dot(U[:, :rank]), s[:rank]
+
+
+class ReducedOrderModel:
+    """
+    Galerkin projection of M u' = -K u + b, or of M u'' = -K u + b for order 2, onto u = offset + V a. With a
+    DirichletLifting, only the free nodes are reduced, u_F = offset + V a, and the prescribed values g(t) enter as the
+    forcing -K_FD g - M_FD g' for order 1 or -K_FD g - M_FD g'' for order 2.
+    """
+
+    def __init__(self, basis, mass, stiffness, b=None, offset=None, order=1, singular_values=None, lifting=None):
+        """
+        Projects the matrices, this is the only step touching the full dimension
+        :param basis: The basis V (N, r) with orthonormal columns, e.g. from compute_pod_basis, (F, r) on the free
+        nodes with a lifting
+        :param mass: The mass matrix M (N, N), dense or sparse
+        :param stiffness: The stiffness matrix K (N, N), dense or sparse
+        :param b: The constant load vector (N), zero if None
+        :param offset: The offset of the reduced fields, e.g. the snapshot mean. Zero if None
+        :param order: 1 for the heat equation, 2 for the wave equation
+        :param singular_values: All singular values of the snapshots, for the error estimate
+        :param lifting: The DirichletLifting of time dependent Dirichlet BC, None if all nodes are reduced
+        """
+        self.basis = np.asarray(basis, dtype=float)
+        varnr, self.rank = np.shape(self.basis)
+        self.offset = np.zeros(varnr) if offset is None else np.asarray(offset, dtype=float)
+        self.order = order
+        self.singular_values = singular_values
+        self.lifting = lifting
+
+        if lifting is None:
+            M_FF, K_FF = mass, stiffness
+        else:
+            M_FF, M_FD = lifting.split(mass)
+            K_FF, K_FD = lifting.split(stiffness)
+            # Projections of the coupling to the constrained nodes, applied to g(t) during the solve
+            self.mass_coupling = np.asarray(M_FD.T.dot(self.basis)).T
+            self.stiffness_coupling = np.asarray(K_FD.T.dot(self.basis)).T
+        self.mass = np.asarray(self.basis.T.dot(M_FF.dot(self.basis)))
+        self.stiffness = np.asarray(self.basis.T.dot(K_FF.dot(self.basis)))
+        load = -K_FF.dot(self.offset)
+        if b is not None:
+            load = load + self._restrict(np.ravel(b))
+        self.load = self.basis.T.dot(load)
+
+    @classmethod
+    def from_snapshots(cls, snapshots, mass, stiffness, b=None, order=1, rank=None, energy=0.9999, randomized=None,
+                       lifting=None):
+        """
+        Builds a model from snapshots, lifted by their mean
+        :param snapshots: Array (N, n) with one snapshot per column
+        :param mass: The mass matrix M
+        :param stiffness: The stiffness matrix K
+        :param b: The constant load vector, zero if None
+        :param order: 1 for the heat equation, 2 for the wave equation
+        :param rank: The rank of the basis, see compute_pod_basis
+        :param energy: The fraction of the energy kept if rank is None
+        :param randomized: Use the randomized SVD, see compute_pod_basis
+        :param lifting: The DirichletLifting of the solver, the basis is then computed on the free nodes only
+        :return: The ReducedOrderModel
+        """
+        snapshots = np.asarray(snapshots, dtype=float)
+        if lifting is not None:
+            snapshots = snapshots[lifting.free]
+        offset = np.mean(snapshots, axis=1)
+        basis, s = compute_pod_basis(snapshots - offset[:, np.newaxis], rank, energy, randomized)
+        return cls(basis, mass, stiffness, b, offset, order, s, lifting)
+
+    def project(self, u):
+        """
+        Gives the reduced coordinates of full fields by orthogonal projection
+        :param u: The field (N) or fields (N, n)
+        :return: The coordinates (r) or (r, n)
+        """
+        u = self._restrict(np.asarray(u, dtype=float))
+        offset = self.offset if u.ndim == 1 else self.offset[:, np.newaxis]
+        return self.basis.T.dot(u - offset)
+
+    def reconstruct(self, a, rows=None, t=None):
+        """
+        Reconstructs full fields from reduced coordinates
+        :param a: The coordinates (r) or (r, n)
+        :param rows: Optional index of the components to reconstruct, e.g. probe nodes
+        :param t: The time or the times (n) of the fields, needed for the prescribed values of a lifting
+        :return: The fields (N) or (N, n)
+        """
+        a = np.asarray(a)
+        if self.lifting is None:
+            basis = self.basis if rows is None else self.basis[rows]
+            offset = self.offset if rows is None else self.offset[rows]
+            return basis.dot(a) + (offset if a.ndim == 1 else offset[:, np.newaxis])
+
+        if t is None:
+            raise ValueError('The fields of a model with Dirichlet lifting need their time')
+        columns = a.reshape(self.rank, -1)
+        times = np.broadcast_to(np.asarray(t, dtype=float), (np.shape(columns)[1],))
+        u = np.zeros((self.lifting.varnr, np.shape(columns)[1]))
+        u[self.lifting.free] = self.basis.dot(columns) + self.offset[:, np.newaxis]
+        u[self.lifting.nodes] = np.column_stack([self.lifting.get_values(time) for time in times])
+        if rows is not None:
+            u = u[rows]
+        return u[..., 0] if a.ndim == 1 else u
+
+    def get_projection_error(self, u):
+        """
+        Gives the relative error of the best approximation of fields in the reduced space
+        :param u: The field (N) or fields (N, n)
+        :return: ||u - offset - V V^T (u - offset)|| / ||u - offset|| per field, over the free nodes with a lifting
+        """
+        u = self._restrict(np.asarray(u, dtype=float))
+        offset = self.offset if u.ndim == 1 else self.offset[:, np.newaxis]
+        fluctuation = u - offset
+        error = fluctuation - self.basis.dot(self.basis.T.dot(fluctuation))
+        return np.linalg.norm(error, axis=0) / np.maximum(np.linalg.norm(fluctuation, axis=0), np.finfo(float).tiny)
+
+    def get_energy_error(self):
+        """
+        Gives the relative projection error of the snapshots in the Frobenius norm, estimated from the discarded
+        singular values
+        :return: sqrt(sum_i>r s_i^2 / sum_i s_i^2)
+        """
+        if self.singular_values is None:
+            raise ValueError('The singular values of the snapshots are unknown')
+        s = self.singular_values
+        return np.sqrt(np.sum(s[self.rank:] ** 2) / max(np.sum(s ** 2), np.finfo(float).tiny))
+
+    def get_forcing(self, t):
+        """
+        Gives the reduced right hand side without the stiffness term
+        :param t: The time
+        :return: V^T (b_F - K_FF offset - K_FD g(t) - M_FD g^(order)(t)), array (r)
+        """
+        if self.lifting is None:
+            return self.load
+        return (self.load - self.stiffness_coupling.dot(self.lifting.get_values(t)) -
+                self.mass_coupling.dot(self.lifting.get_values(t, self.order)))
+
+    def solve(self, u_0, t_end, timestep, t_0=0, v_0=None, method='expm'):
+        """
+        Integrates in the reduced space with a constant step. Time dependent forcing is interpolated linearly over
+        every step.
+        :param u_0: The initial field (N)
+        :param t_end: The final time
+        :param timestep: The step size
+        :param t_0: The initial time
+        :param v_0: The initial velocity (N) of order 2 models, zero if None
+        :param method: 'expm' for the exact propagator or one of the theta methods, e.g. 'crank_nicolson'
+        :return: The reduced coordinates (r, number of times), of the displacement for order 2, and the timestamps
+        """
+        n_steps = int(np.ceil((t_end - t_0) / timestep - 1e-10))
+        timestep = (t_end - t_0) / n_steps
+        t_arr = t_0 + timestep * np.arange(n_steps + 1)
+        r = self.rank
+
+        # First order form z' = A z + f(t)
+        if self.order == 1:
+            A = -np.linalg.solve(self.mass, self.stiffness)
+            z = self.project(u_0)
+        else:
+            A = np.zeros((2 * r, 2 * r))
+            A[:r, r:] = np.eye(r)
+            A[r:, :r] = -np.linalg.solve(self.mass, self.stiffness)
+            v = np.zeros(r) if v_0 is None else self.basis.T.dot(self._restrict(np.asarray(v_0, dtype=float)))
+            z = np.concatenate((self.project(u_0), v))
+
+        if self.lifting is None:
+            forcing = np.linalg.solve(self.mass, self.load)[:, np.newaxis]
+        else:
+            forcing = np.linalg.solve(self.mass, np.column_stack([self.get_forcing(t) for t in t_arr]))
+        if self.order == 2:
+            forcing = np.concatenate((np.zeros_like(forcing), forcing))
+        forcing = np.broadcast_to(forcing, (np.shape(z)[0], n_steps + 1))
+
+        P, Q_0, Q_1 = get_propagator(A, timestep, method)
+        states = np.zeros((np.shape(z)[0], n_steps + 1))
+        states[:, 0] = z
+        for n in range(n_steps):
+            states[:, n + 1] = P.dot(states[:, n]) + Q_0.dot(forcing[:, n]) + Q_1.dot(forcing[:, n + 1])
+
+        print("[Info] Made " + str(n_steps) + " reduced timesteps of dimension " + str(np.shape(z)[0]))
+        return states[:r], t_arr
+
+    def get_interpolator(self, a, t_arr, rows=None):
+        """
+        Gives a linear interpolator in time reconstructing the full fields only at the evaluated times
+        :param a: The reduced coordinates (r, number of times)
+        :param t_arr: The timestamps
+        :param rows: Optional index of the components to reconstruct
+        :return: The ReducedInterpolator
+        """
+        return ReducedInterpolator(self, a, t_arr, rows)
+
+    def _restrict(self, u):
+        """
+        Gives the values at the reduced nodes
+        :param u: Array (N) or (N, n)
+        :return: The rows of the free nodes with a lifting, else u
+        """
+        return u if self.lifting is None else u[self.lifting.free]
+
+
+class ReducedInterpolator:
+    """
+    Interpolates reduced coordinates linearly in time and reconstructs the fields, like the solver interpolators
+    """
+
+    def __init__(self, model, a, t_arr, rows=None):
+        """
+        :param model: The ReducedOrderModel
+        :param a: The reduced coordinates (r, number of times)
+        :param t_arr: The timestamps
+        :param rows: Optional index of the components to reconstruct
+        """
+        self.model = model
+        self.a = a
+        self.x = np.asarray(t_arr)
+        self.rows = rows
+
+    def __call__(self, t):
+        """
+        Evaluates the fields
+        :param t: A time or an array of times
+        :return: The field (N) or the fields (N, number of times)
+        """
+        t = np.asarray(t, dtype=float)
+        if np.any(t < self.x[0]) or np.any(t > self.x[-1]):
+            raise ValueError('A time is outside of the interval [' + str(self.x[0]) + ', ' + str(self.x[-1]) + ']')
+        a = np.array([np.interp(t, self.x, row) for row in self.a])
+        return self.model.reconstruct(a, self.rows, t)
+
+
+def get_propagator(A, timestep, method='expm'):
+    """
+    Gives the one step map z_n+1 = P z_n + Q_0 f_n + Q_1 f_n+1 of z' = A z + f(t), with f linear over the step
+    :param A: The dense matrix
+    :param timestep: The step size
+    :param method: 'expm' for the exact map or one of the theta methods
+    :return: P, Q_0 and Q_1
+    """
+    n = np.shape(A)[0]
+    if method == 'expm':
+        # exp(h [[A, I, 0], [0, 0, I], [0, 0, 0]]) holds the integrals of exp((h - s) A) against 1 and s in its first
+        # block row
+        augmented = np.zeros((3 * n, 3 * n))
+        augmented[:n, :n] = A
+        augmented[:n, n:2 * n] = np.eye(n)
+        augmented[n:2 * n, 2 * n:] = np.eye(n)
+        exponential = linalg.expm(timestep * augmented)
+        P = exponential[:n, :n]
+        Q_1 = exponential[:n, 2 * n:] / timestep
+        return P, exponential[:n, n:2 * n] - Q_1, Q_1
+    if method not in THETA_METHODS:
+        raise ValueError('Unknown reduced integration method ' + str(method))
+    theta = THETA_METHODS[method]
+    implicit = np.eye(n) - theta * timestep * A
+    P = np.linalg.solve(implicit, np.eye(n) + (1 - theta) * timestep * A)
+    Q = np.linalg.inv(implicit) * timestep
+    return P, (1 - theta) * Q, theta * Q
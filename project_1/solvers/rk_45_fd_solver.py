@@ -2,44 +2,154 @@
 # -*- coding: utf-8 -*-
 
 """
-Solves time dependant problems by integration using the RK45 solver
+Solves time dependant problems by integration using adaptive explicit (RK45 by default) or stiff implicit solvers
 """
 
+import os
 import numpy as np
+import scipy.sparse as sparse
 
-from scipy.integrate import RK45
+from scipy.integrate import RK23, RK45, DOP853, Radau, BDF, LSODA
+from project_1.solvers.sdirk import SDIRK
+from project_1.utils.checkpoint import save_checkpoint, load_checkpoint, open_trajectory, append_trajectory
 
+SOLVERS = {'RK23': RK23, 'RK45': RK45, 'DOP853': DOP853, 'Radau': Radau, 'BDF': BDF, 'LSODA': LSODA, 'SDIRK': SDIRK}
+IMPLICIT_METHODS = ['Radau', 'BDF', 'LSODA', 'SDIRK']
 
-def solve_dynamic_system(system, args, max_step, t_bound, x_0, t_0=0,bc_imposer = None, bc_args = None):
+
+def solve_dynamic_system(system, args, max_step, t_bound, x_0, t_0=0, method='RK45', rtol=1e-3, atol=1e-6, jac=None,
+                         mass=None, checkpoint=None, checkpoint_interval=100, restart=False, store=None, probes=None,
+                         expand=None):
     """
-    Solves a dynamical system using Dormand–Prince with 4th order error control and 5th order stepping "RK45".
+    Solves a dynamical system, by default using Dormand–Prince with 4th order error control and 5th order stepping
+    "RK45". Stiff systems should use one of the implicit methods with the known jacobian, so it is never approximated by
+    finite differences.
     :param system: A callable dynamic system taking (t,x,J)
     :param args: Arguments to be passed to the system
     :param max_step: The maximum allowed length of a step
     :param t_bound: The time at which to stop integration
     :param x_0: The initial state
     :param t_0: The initial time
-    :param bc_imposer: Callable that can be used to modify x every timestep in order to impose bc.
-    :param bc_args: Args for the bc_imposer
-    :return: An array of states and an array of timestamps
+    :param method: 'RK23', 'RK45', 'DOP853' (explicit), 'Radau', 'BDF', 'LSODA' (implicit, from scipy) or 'SDIRK'
+    (implicit, supports a mass matrix)
+    :param rtol: The relative tolerance
+    :param atol: The absolute tolerance
+    :param jac: The jacobian of the system for the implicit methods, a dense or sparse matrix or a callable (t,x)
+    :param mass: The mass matrix M of the system M x' = system(t,x), only supported by 'SDIRK'
+    :param checkpoint: Path of a .npz checkpoint file. If given, the integrator state is saved periodically and every
+    step is appended to a trajectory file next to it
+    :param checkpoint_interval: Number of steps between two checkpoints
+    :param restart: Resume from the checkpoint if it exists instead of starting at t_0. The trajectory computed before
+    the checkpoint is kept and extended.
+    :param store: A TrajectoryStore opened for appending. If given, the states are written to it step by step instead
+    of being kept in memory, and it serves as trajectory storage for the checkpoints
+    :param probes: Sparse sampling matrix (n_probes, N), e.g. from get_sampling_matrix. If given, only the sampled
+    values are recorded at every step instead of the full states
+    :param expand: Callable (t, x) giving the full state from the integrated one, e.g. from the free nodes of a
+    DirichletLifting. The recorded states and probes then refer to the full state, the checkpoints keep the integrated
+    one.
+    :return: An array of states, or of probe values, or the store if one is given, and an array of timestamps
     """
-    x = x_0
-    t_arr = np.zeros((1, 1))
-    x = np.expand_dims(x, axis=1)
-
-    ivp = RK45(fun=lambda t, y: system(t, y, args), t0=t_0, y0=x_0, t_bound=t_bound, max_step=max_step, rtol=0.001,
-               atol=1e-06,
-               vectorized=False)
-
-    while True:
-        if (ivp.t >= t_bound):
-            break
-        ivp.step()
-        if bc_imposer is not None:
-            ivp.y = bc_imposer(ivp.y,ivp.t,bc_args)
-        x = np.append(x, np.expand_dims(ivp.y, axis=1), axis=1)
-        t_arr = np.append(t_arr, np.ones((1, 1)) * ivp.t, axis=1)
-
-    print("[Info] Made " + str(t_arr.shape[1]) + " timesetps")
+    if method not in SOLVERS:
+        raise ValueError('Unknown integration method ' + str(method))
+    options = {}
+    if method in IMPLICIT_METHODS and jac is not None:
+        if method == 'LSODA' and not callable(jac):
+            # LSODA only accepts a callable giving a dense jacobian
+            dense_jac = jac.toarray() if sparse.issparse(jac) else np.asarray(jac)
+            jac = lambda t, y: dense_jac
+        options['jac'] = jac
+    if mass is not None:
+        if method != 'SDIRK':
+            raise ValueError('Only SDIRK supports a mass matrix')
+        options['mass'] = mass
+
+    config = {'method': method, 'rtol': rtol, 'atol': atol, 'max_step': max_step, 'varnr': int(np.shape(x_0)[0])}
+    first_step = None
+    trajectory = None
+
+    # The recorded values, the full state or the probe values
+    def record(t, y):
+        if expand is not None:
+            y = expand(t, y)
+        if probes is not None:
+            return probes.dot(y)
+        return np.array(y)
+    record_size = np.shape(record(t_0, x_0))[0]
+    config['recorded'] = int(record_size)
+    rows = np.zeros((0, record_size + 1))
+    if checkpoint is not None and restart and os.path.exists(checkpoint):
+        state = load_checkpoint(checkpoint)
+        # Checkpoints written before probes existed recorded the full state
+        defaults = {'recorded': state['config'].get('varnr')}
+        for key in ['method', 'varnr', 'recorded']:
+            value = state['config'].get(key, defaults.get(key))
+            if value is None:
+                raise ValueError('The checkpoint ' + str(checkpoint) + ' does not record the ' + key)
+            if value != config[key]:
+                raise ValueError('The checkpoint was written with ' + key + ' ' + str(value))
+        t_0 = state['t']
+        x_0 = state['y']
+        if state['step_size'] > 0 and t_0 < t_bound:
+            first_step = min(state['step_size'], t_bound - t_0)
+        if store is None:
+            rows, trajectory = open_trajectory(checkpoint, record_size, state['steps'])
+        else:
+            store.truncate(state['steps'])
+        print("[Info] Restarting from checkpoint at t=" + str(t_0))
+    else:
+        if checkpoint is not None and store is None:
+            rows, trajectory = open_trajectory(checkpoint, record_size)
+            append_trajectory(trajectory, t_0, record(t_0, x_0))
+        if store is not None:
+            store.truncate(0)
+            store.append(t_0, record(t_0, x_0))
+        rows = np.concatenate(([t_0], record(t_0, x_0)))[np.newaxis]
+
+    # Without a store the trajectory is kept in memory
+    states = list(rows[:, 1:])
+    times = list(rows[:, 0])
+    steps = len(store) if store is not None else len(times)
+
+    ivp = SOLVERS[method](fun=lambda t, y: system(t, y, args), t0=t_0, y0=x_0, t_bound=max(t_bound, t_0),
+                          max_step=max_step, rtol=rtol, atol=atol, vectorized=False, first_step=first_step, **options)
+
+    try:
+        while True:
+            if (ivp.t >= t_bound):
+                break
+            message = ivp.step()
+            if ivp.status == 'failed':
+                raise RuntimeError('Integration with ' + method + ' failed at t=' + str(ivp.t) + ': ' + str(message))
+            steps += 1
+            values = record(ivp.t, ivp.y)
+            if store is not None:
+                store.append(ivp.t, values)
+            else:
+                states.append(values)
+                times.append(ivp.t)
+
+            if checkpoint is not None:
+                if trajectory is not None:
+                    append_trajectory(trajectory, ivp.t, values)
+                if steps % checkpoint_interval == 0 or ivp.t >= t_bound:
+                    if trajectory is not None:
+                        trajectory.flush()
+                        os.fsync(trajectory.fileno())
+                    else:
+                        store.flush()
+                    save_checkpoint(checkpoint, ivp.t, ivp.y, ivp.step_size, steps, config)
+    finally:
+        if trajectory is not None:
+            trajectory.close()
+        if store is not None:
+            store.flush()
+
+    print("[Info] Made " + str(steps) + " timesetps")
+
+    if store is not None:
+        return store, store.times[np.newaxis]
+    x = np.array(states).T
+    t_arr = np.array(times)[np.newaxis]
 
     return x, t_arr
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements an overlapping additive Schwarz preconditioner. The local problems of the subdomains are factorized once
+in worker processes, the residual and the local corrections are exchanged through shared memory and the workers are
+triggered through pipes. An optional Nicolaides coarse space limits the growth of the iteration count with the number
+of subdomains.
+"""
+
+import os
+import numpy as np
+import scipy.sparse as sparse
+import scipy.linalg as linalg
+from multiprocessing import Pipe, Process
+from scipy.sparse.linalg import splu, LinearOperator
+
+from project_1.solvers.matrix_generation import assemble_mass_matrix, assemble_stiffness_matrix, assemble_load_vector
+from project_1.solvers.solver_helmholtz import get_dirichlet_nodes
+from project_1.utils.iterative_solvers import conjugate_gradient
+from project_1.utils.shared_arrays import create_shared_array, attach_shared_array
+
+
+class AdditiveSchwarzPreconditioner:
+    """
+    Two level additive Schwarz preconditioner sum_i R_i^T A_i^-1 R_i + Z A_0^-1 Z^T for a symmetric positive definite
+    matrix A, with R_i the restriction onto the nodes of the overlapping subdomain i and Z the Nicolaides coarse space
+    built from the owned nodes of every subdomain
+    """
+
+    def __init__(self, A, subdomains, coarse=True, processes=None, dirichlet=None):
+        """
+        Factorizes the local and the coarse problems
+        :param A: The sparse system matrix
+        :param subdomains: List of subdomains, e.g. from Mesh.partition
+        :param coarse: Should the coarse space correction be used
+        :param processes: Number of worker processes. None for one per subdomain up to the number of CPUs, 0 to
+        factorize and solve all local problems in this process
+        :param dirichlet: Indices of the Dirichlet nodes, they are left out of the coarse space
+        """
+        A = sparse.csr_matrix(A)
+        varnr = np.shape(A)[0]
+        self.varnr = varnr
+        self.nodes = [subdomain.nodes for subdomain in subdomains]
+        self.offsets = np.concatenate(([0], np.cumsum([np.shape(nodes)[0] for nodes in self.nodes])))
+        local_matrices = [A[nodes][:, nodes].tocsc() for nodes in self.nodes]
+
+        if coarse:
+            self.Z = get_nicolaides_space(subdomains, varnr, dirichlet)
+            # The coarse matrix Z^T A Z is small, dense and symmetric positive definite
+            self.coarse_factor = linalg.cho_factor(self.Z.T.dot(A.dot(self.Z)).toarray())
+        else:
+            self.Z = None
+
+        if processes is None:
+            processes = min(len(subdomains), os.cpu_count())
+        self.processes = processes
+        self.workers = []
+        self.blocks = []
+
+        if processes == 0:
+            self.local_lu = [splu(matrix) for matrix in local_matrices]
+            return
+
+        # Residual and local corrections live in shared memory, the pipes only carry the trigger
+        self.residual, block = create_shared_array(np.zeros(varnr))
+        self.blocks.append(block)
+        self.corrections, block = create_shared_array(np.zeros(self.offsets[-1]))
+        self.blocks.append(block)
+        shared = (self.blocks[0].name, varnr, self.blocks[1].name, self.offsets[-1])
+
+        try:
+            for worker in range(processes):
+                ids = list(range(worker, len(subdomains), processes))
+                problems = [(self.nodes[i], self.offsets[i], local_matrices[i]) for i in ids]
+                parent, child = Pipe()
+                process = Process(target=_schwarz_worker, args=(child, shared, problems), daemon=True)
+                process.start()
+                child.close()
+                self.workers.append((process, parent))
+
+            # Wait until all factorizations are done
+            for process, connection in self.workers:
+                connection.recv()
+        except BaseException:
+            self.close()
+            raise
+
+    def apply(self, r):
+        """
+        Applies the preconditioner
+        :param r: The residual
+        :return: The preconditioned residual
+        """
+        r = np.ravel(r)
+        z = np.zeros(self.varnr)
+        if self.processes == 0:
+            for nodes, lu in zip(self.nodes, self.local_lu):
+                z[nodes] += lu.solve(r[nodes])
+        else:
+            self.residual[:] = r
+            for process, connection in self.workers:
+                connection.send(True)
+            for process, connection in self.workers:
+                connection.recv()
+            for i, nodes in enumerate(self.nodes):
+                z[nodes] += self.corrections[self.offsets[i]:self.offsets[i + 1]]
+
+        if self.Z is not None:
+            z += self.Z.dot(linalg.cho_solve(self.coarse_factor, self.Z.T.dot(r)))
+        return z
+
+    def get_operator(self):
+        """
+        Gives the preconditioner as linear operator
+        :return: The LinearOperator
+        """
+        return LinearOperator((self.varnr, self.varnr), matvec=self.apply, dtype=float)
+
+    def close(self):
+        """
+        Stops the worker processes and releases the shared memory
+        """
+        for process, connection in self.workers:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join()
+            connection.close()
+        self.workers = []
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_nicolaides_space(subdomains, varnr, dirichlet=None):
+    """
+    Builds the Nicolaides coarse space, one column per subdomain that is one on its owned nodes
+    :param subdomains: List of subdomains
+    :param varnr: The number of nodes
+    :param dirichlet: Indices of nodes that are zero in all columns
+    :return: Sparse matrix (N, number of subdomains)
+    """
+    rows = np.concatenate([subdomain.owned_nodes for subdomain in subdomains])
+    cols = np.concatenate([np.full(np.shape(subdomain.owned_nodes)[0], i) for i, subdomain in enumerate(subdomains)])
+    data = np.ones(np.shape(rows)[0])
+    if dirichlet is not None:
+        data[np.isin(rows, dirichlet)] = 0
+    Z = sparse.csr_matrix((data, (rows, cols)), shape=(varnr, len(subdomains)))
+    Z.eliminate_zeros()
+    return Z
+
+
+def apply_dirichlet_symmetric(A, b, dirichlet, values=None):
+    """
+    Imposes Dirichlet BC while keeping the matrix symmetric: the Dirichlet rows and columns are replaced by the
+    identity and the known values are moved to the right hand side
+    :param A: The sparse system matrix
+    :param b: The right hand side
+    :param dirichlet: Indices of the Dirichlet nodes
+    :param values: The Dirichlet values, zero by default
+    :return: The modified matrix in CSR format and right hand side
+    """
+    varnr = np.shape(A)[0]
+    g = np.zeros(varnr)
+    if values is not None:
+        g[dirichlet] = values
+    b = np.ravel(b) - A.dot(g)
+
+    free = np.ones(varnr)
+    free[dirichlet] = 0
+    D = sparse.diags(free)
+    A = (D.dot(A).dot(D) + sparse.diags(1 - free)).tocsr()
+    b[dirichlet] = g[dirichlet]
+    return A, b
+
+
+def solve_schwarz(A, b, subdomains, dirichlet=None, coarse=True, processes=None, tol=1e-10):
+    """
+    Solves A u = b with CG preconditioned by additive Schwarz
+    :param A: The sparse symmetric positive definite system matrix
+    :param b: The right hand side
+    :param subdomains: List of subdomains, e.g. from Mesh.partition with overlap
+    :param dirichlet: Indices of nodes with homogenous Dirichlet BC
+    :param coarse: Should the coarse space correction be used
+    :param processes: Number of worker processes, see AdditiveSchwarzPreconditioner
+    :param tol: The relative tolerance of CG
+    :return: The solution and the number of CG iterations
+    """
+    if dirichlet is not None:
+        A, b = apply_dirichlet_symmetric(A, b, dirichlet)
+
+    with AdditiveSchwarzPreconditioner(A, subdomains, coarse, processes, dirichlet) as preconditioner:
+        return conjugate_gradient(A, b, tol=tol, preconditioner=preconditioner.apply)
+
+
+def solve_helmholtz_schwarz(mesh, f_function, parts=4, overlap=1, method='rcb', coarse=True, processes=None,
+                            tol=1e-10):
+    """
+    Solves the Helmholtz problem under fixed BC with additive Schwarz preconditioned CG
+    :param mesh: The mesh to operate on
+    :param f_function: The inhomogenous right hand side
+    :param parts: Number of subdomains
+    :param overlap: Number of layers of triangles added around every subdomain
+    :param method: The partitioning method, see Mesh.partition
+    :param coarse: Should the coarse space correction be used
+    :param processes: Number of worker processes, see AdditiveSchwarzPreconditioner
+    :param tol: The relative tolerance of CG
+    :return: The solution and the number of CG iterations
+    """
+    print("[Info] Assembling system")
+    A = assemble_stiffness_matrix(mesh) + assemble_mass_matrix(mesh)
+    b = assemble_load_vector(mesh, f_function)
+
+    print("[Info] Partitioning mesh into " + str(parts) + " subdomains")
+    subdomains = mesh.partition(parts, method, overlap)
+
+    print("[Info] Solving system")
+    return solve_schwarz(A, b, subdomains, get_dirichlet_nodes(mesh.vertices), coarse, processes, tol)
+
+
+def _schwarz_worker(connection, shared, problems):
+    """
+    Worker process holding the factorizations of some subdomains. Every message triggers the local solves on the
+    current residual in shared memory, None stops the worker.
+    :param connection: The pipe to the main process
+    :param shared: Names and sizes of the shared residual and correction arrays
+    :param problems: List of (global node ids, offset in the corrections, local matrix)
+    """
+    residual_name, varnr, corrections_name, corrections_size = shared
+    residual, residual_block = attach_shared_array(residual_name, varnr)
+    corrections, corrections_block = attach_shared_array(corrections_name, corrections_size)
+
+    factors = [(nodes, offset, splu(matrix)) for nodes, offset, matrix in problems]
+    connection.send(True)
+
+    try:
+        while connection.recv() is not None:
+            for nodes, offset, lu in factors:
+                corrections[offset:offset + np.shape(nodes)[0]] = lu.solve(residual[nodes])
+            connection.send(True)
+    except EOFError:
+        pass
+    finally:
+        del residual, corrections
+        residual_block.close()
+        corrections_block.close()
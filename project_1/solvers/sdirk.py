@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implements an adaptive L-stable singly diagonally implicit Runge-Kutta method for stiff systems in mass matrix form
+M x' = f(t, x) with a known constant jacobian, e.g. the FE semi-discretization M u' = -K u + b.
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import splu
+from scipy.integrate import OdeSolver, DenseOutput
+
+# Alexander's two stage, second order, L-stable SDIRK scheme
+GAMMA = 1 - 1 / np.sqrt(2)
+
+
+class SDIRK(OdeSolver):
+    """
+    Two stage SDIRK method with an embedded first order error estimate. Both stages solve with the same matrix
+    M - h gamma J, which is factorized only when the step size changes. The stages are linearly implicit, so the
+    scheme is exact in the stage equations for systems that are affine in x, like FE semi-discretizations.
+    """
+
+    def __init__(self, fun, t0, y0, t_bound, jac=None, mass=None, max_step=np.inf, rtol=1e-3, atol=1e-6,
+                 first_step=None, vectorized=False, **extraneous):
+        """
+        Sets up the solver
+        :param fun: The right hand side f(t, x)
+        :param t0: The initial time
+        :param y0: The initial state
+        :param t_bound: The time at which to stop integration
+        :param jac: The constant jacobian of f, dense or sparse
+        :param mass: The constant mass matrix M, dense or sparse. The identity if None
+        :param max_step: The maximum allowed length of a step
+        :param rtol: The relative tolerance
+        :param atol: The absolute tolerance
+        :param first_step: The initial step size, a hundredth of the interval by default
+        :param vectorized: Unused, for compatibility with the scipy solvers
+        """
+        super().__init__(fun, t0, y0, t_bound, vectorized)
+        if jac is None:
+            raise ValueError('SDIRK needs the constant jacobian jac')
+        self.jac = jac
+        self.mass = sparse.identity(self.n, format='csc') if mass is None else mass
+        self.max_step = max_step
+        self.rtol = rtol
+        self.atol = atol
+        if first_step is None:
+            first_step = np.abs(t_bound - t0) / 100
+        self.h = min(first_step, max_step)
+        self.h_factorized = None
+        self.solve = None
+        self.factorizations = 0
+
+    def _factorize(self, h):
+        """
+        Factorizes the stage matrix M - h gamma J if the step size changed
+        :param h: The step size
+        """
+        if h == self.h_factorized:
+            return
+        matrix = self.mass - h * GAMMA * self.jac
+        if sparse.issparse(matrix):
+            lu = splu(sparse.csc_matrix(matrix))
+            self.solve = lu.solve
+        else:
+            lu = lu_factor(np.asarray(matrix))
+            self.solve = lambda rhs: lu_solve(lu, rhs)
+        self.h_factorized = h
+        self.factorizations += 1
+
+    def _step_impl(self):
+        """
+        Takes one step, shrinking the step size until the error estimate meets the tolerances
+        :return: Success and a message
+        """
+        t = self.t
+        y = self.y
+        while True:
+            h = min(self.h, self.max_step, np.abs(self.t_bound - t))
+            if h < 10 * np.abs(np.nextafter(t, self.direction * np.inf) - t):
+                return False, 'Step size became too small'
+            self._factorize(h)
+            step = self.direction * h
+
+            k1 = self.solve(self.fun(t + GAMMA * step, y))
+            k2 = self.solve(self.fun(t + step, y + step * (1 - GAMMA) * k1))
+            y_new = y + step * ((1 - GAMMA) * k1 + GAMMA * k2)
+
+            # Difference to the first order solution y + h k1, filtered for stiff components
+            error = self.solve(self.mass.dot(step * GAMMA * (k2 - k1)))
+            scale = self.atol + self.rtol * np.maximum(np.abs(y), np.abs(y_new))
+            error_norm = np.sqrt(np.mean((error / scale) ** 2))
+            factor = 0.9 / np.sqrt(error_norm) if error_norm > 0 else 5
+
+            if error_norm <= 1:
+                break
+            self.h = h * max(0.2, factor)
+
+        # Keep the factorization unless the step size can grow substantially
+        if factor >= 1.5:
+            self.h = h * min(5, factor)
+        else:
+            self.h = h
+        self.y_old = y
+        self.t = t + step
+        self.y = y_new
+        return True, None
+
+    def _dense_output_impl(self):
+        return LinearDenseOutput(self.t_old, self.t, self.y_old, self.y)
+
+
+class LinearDenseOutput(DenseOutput):
+    """
+    Linear interpolation between the states of a step
+    """
+
+    def __init__(self, t_old, t, y_old, y):
+        super().__init__(t_old, t)
+        self.y_old = y_old
+        self.y = y
+
+    def _call_impl(self, t):
+        weight = (np.asarray(t) - self.t_old) / (self.t - self.t_old)
+        return np.multiply.outer(self.y_old, 1 - weight) + np.multiply.outer(self.y, weight)
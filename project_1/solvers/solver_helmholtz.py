@@ -13,18 +13,23 @@ from project_1.utils.integration import gauss_legendre_reference
 from project_1.solvers.matrix_generation import generate_mass_matrix, generate_stiffness_matrix
 
 
-def solve_helmholtz(mesh, f_function, quadpack=False, accuracy=1.49e-05):
+def solve_helmholtz(mesh, f_function, quadpack=False, accuracy=1.49e-05, check_quality=False):
     """
     Solves the Helmholtz problem under fixed BC.
     :param mesh: The mesh to operate on
     :param f_function: The inhomogenous right hand side
     :param quadpack: Should the Fortran quadpack package be used to integrate numerically
     :param accuracy: The accuracy for quadpack
+    :param check_quality: If True, a ValueError listing the degenerate and inverted triangles is raised before
+    assembly, see Mesh.check_quality
     """
 
+    if check_quality:
+        mesh.check_quality()
+
     vertices = mesh.vertices
     triangles = mesh.triangles
-    varnr = mesh.supportsy * mesh.supportsx
+    varnr = np.shape(vertices)[1]
     atraf = AffineTransformation()
     p1_ref = P1ReferenceElement()
     supports = 7
@@ -45,17 +50,25 @@ def solve_helmholtz(mesh, f_function, quadpack=False, accuracy=1.49e-05):
 
     # BC Dirichlet
     nr = np.shape(vertices)[1]
-    for i in range(nr):
-        if vertices[1, i] == 0 or vertices[1, i] == 1:
-            A[i, :] = np.zeros((1, nr))
-            A[i, i] = 1
-            b[i] = 0
+    for i in get_dirichlet_nodes(vertices):
+        A[i, :] = np.zeros((1, nr))
+        A[i, i] = 1
+        b[i] = 0
 
     # Solve system
     u = np.linalg.inv(A).dot(b)
     return vertices, u
 
 
+def get_dirichlet_nodes(vertices):
+    """
+    Gives the nodes on which the homogenous Dirichlet BC of the Helmholtz problem is imposed
+    :param vertices: The vertices array
+    :return: Array of the indices of the nodes at y=0 and y=1
+    """
+    return np.where(np.logical_or(vertices[1, :] == 0, vertices[1, :] == 1))[0]
+
+
 def generate_linear_form(accuracy, atraf, f_function, mesh, p1_ref, quadpack, supports, triangles, varnr, vertices):
     """
     Generates the linear form of the Helmholtz problem
@@ -113,7 +126,7 @@ def b_integrant(y, x, p1_ref, i, f_function, jinvt, v0_coord):
     """
     co = (x, y)
     xp = np.array([x - v0_coord[0], y - v0_coord[1]])
-    x_tr = (jinvt.dot(xp)[0], jinvt.dot(xp)[1])
+    x_tr = (jinvt.T.dot(xp)[0], jinvt.T.dot(xp)[1])
     val = p1_ref.value(x_tr)[i]
     return val * f_function.value(co)
 
@@ -135,4 +148,4 @@ def b_integrant_reference(y, x, p1_ref, i, f_function, j, v0_coord, det):
     xc = np.array([[x], [y]])
     x0 = np.array([[v0_coord[0]], [v0_coord[1]]])
     x_new = j.dot(xc) + x0
-    return np.asscalar(p1_ref.value(co)[i] * f_function.value((x_new[0], x_new[1]))) * np.abs(det)
+    return (p1_ref.value(co)[i] * f_function.value((x_new[0], x_new[1]))).item() * np.abs(det)
@@ -3,13 +3,42 @@
 
 """Unit tests for the code"""
 
+import os
+import tempfile
 import unittest
 import numpy as np
+import scipy.sparse as sparse
+from scipy.interpolate import interp1d
 
 from project_1.functions.f_function import FFunction
 from project_1.functions.u_tilde_function import UTildeFunction
 from project_1.infrastructure.p1_reference_element import P1ReferenceElement
 from project_1.infrastructure.affine_transformation import AffineTransformation
+from project_1.infrastructure.mesh import Mesh
+from project_1.solvers.solver_helmholtz import solve_helmholtz
+from project_1.solvers.parametric_helmholtz import ParametricHelmholtzSolver
+from project_1.solvers.matrix_generation import generate_mass_matrix, generate_stiffness_matrix, \
+    assemble_mass_matrix, assemble_stiffness_matrix, generate_matrix_parallel, assemble_load_vector
+from project_1.solvers.matrix_free import get_matrix_free_operator, get_lumped_mass
+from project_1.infrastructure.mesh_io import read_gmsh, read_triangle, read_mesh, save_mesh, load_mesh
+from project_1.infrastructure.mesh_generation import generate_polygon_mesh
+from project_1.infrastructure.mesh_hierarchy import MeshHierarchy
+from project_1.infrastructure.partitioning import partition_mesh
+from project_1.infrastructure.mesh_quality import get_element_quality, get_quality_summary
+from project_1.solvers.schwarz import solve_helmholtz_schwarz
+from project_1.solvers.dynamic_solver import solve_dynamic
+from project_1.solvers.exponential_integrator import integrate_exponential
+from project_1.solvers.solver_helmholtz import get_dirichlet_nodes
+from project_1.solvers.dynamic_wave_solver import solve_wave_dynamic, get_wave_lifting, WAVE_SPEED
+from project_1.solvers.rk_45_fd_solver import solve_dynamic_system
+from project_1.utils.trajectory_store import TrajectoryStore
+from project_1.utils.checkpoint import save_checkpoint, load_checkpoint
+from project_1.infrastructure.probes import get_sampling_matrix
+from project_1.solvers.parareal import integrate_parareal
+from project_1.solvers.ensemble import integrate_theta
+from project_1.solvers.reduced_order import collect_snapshots, compute_pod_basis, ReducedOrderModel
+from project_1.solvers.dirichlet import DirichletLifting
+from project_1.solvers.adaptive_helmholtz import solve_helmholtz_adaptive, solve_helmholtz_sparse, bisect
 
 
 class TestCode(unittest.TestCase):
@@ -76,8 +105,8 @@ class TestCode(unittest.TestCase):
         # Neumann
         n = np.array([[-1, 0]]).T
         for i in    np.nditer(bd):
-            self.assertAlmostEqual(np.asscalar(u_tilde_test_instance.gradient((0,i)).T.dot(n)), 0)
-            self.assertAlmostEqual(np.asscalar(u_tilde_test_instance.gradient((1, i)).T.dot(n)), 0)
+            self.assertAlmostEqual(u_tilde_test_instance.gradient((0,i)).T.dot(n).item(), 0)
+            self.assertAlmostEqual(u_tilde_test_instance.gradient((1, i)).T.dot(n).item(), 0)
 
     def test_p1_reference_element(self):
         """
@@ -157,6 +186,804 @@ class TestCode(unittest.TestCase):
         x_new = j_inv.dot(x-v0)
         np.testing.assert_array_almost_equal(x_new,np.array([[0, 1]]).T)
 
+    def test_parametric_helmholtz(self):
+        """
+        Tests the parameter sweep of the Helmholtz solver against the direct solver
+        :return:
+        """
+        mesh = Mesh(6, 6)
+        f_function = FFunction()
+        solver = ParametricHelmholtzSolver(mesh, f_function)
+
+        # alpha = kappa = 1 is the original Helmholtz problem
+        vertices, u = solve_helmholtz(mesh, f_function)
+        np.testing.assert_array_almost_equal(solver.solve_single(1, 1), u[:, 0])
+
+        # Sweep against a dense reference
+        parameters = np.array([[1, 1], [2, 0.5], [0.3, 4]])
+        u_sweep = solver.solve(parameters)
+        K = solver.K.toarray()
+        M = solver.M.toarray()
+        for i in range(np.shape(parameters)[0]):
+            A = parameters[i, 0] * K + parameters[i, 1] * M
+            for j in range(np.shape(vertices)[1]):
+                if vertices[1, j] == 0 or vertices[1, j] == 1:
+                    A[j, :] = 0
+                    A[j, j] = 1
+            np.testing.assert_array_almost_equal(u_sweep[:, i], np.linalg.solve(A, solver.b))
+
+        # Process pool gives the same result
+        np.testing.assert_array_almost_equal(solver.solve(parameters, processes=2), u_sweep)
+
+    def test_variable_coefficient_assembly(self):
+        """
+        Tests the vectorized assembly with constant and spatially varying coefficients
+        :return:
+        """
+        mesh = Mesh(7, 5)
+        varnr = np.shape(mesh.vertices)[1]
+        x = mesh.vertices[0, :]
+        y = mesh.vertices[1, :]
+
+        # Unit coefficients reproduce the element-wise assembly
+        M = generate_mass_matrix(1.49e-05, AffineTransformation(), mesh, P1ReferenceElement(), False, mesh.triangles,
+                                 varnr, mesh.vertices)
+        K = generate_stiffness_matrix(1.49e-05, AffineTransformation(), mesh, P1ReferenceElement(), False,
+                                      mesh.triangles, varnr, mesh.vertices)
+        np.testing.assert_array_almost_equal(assemble_mass_matrix(mesh).toarray(), M)
+        np.testing.assert_array_almost_equal(assemble_stiffness_matrix(mesh).toarray(), K)
+
+        # Bilinear forms of linear functions are integrated exactly
+        self.assertAlmostEqual(np.sum(assemble_mass_matrix(mesh, lambda co: 1 + co[0])), 1.5)
+        self.assertAlmostEqual(x.dot(assemble_stiffness_matrix(mesh, lambda co: 1 + co[0]).dot(x)), 1.5)
+        self.assertAlmostEqual(y.dot(assemble_stiffness_matrix(mesh, np.array([[2, 0.3], [0.3, 1]])).dot(x)), 0.3)
+
+        def tensor(co):
+            return np.array([[1 + co[0], co[1]], [co[1], 1 + co[1]]])
+
+        self.assertAlmostEqual(y.dot(assemble_stiffness_matrix(mesh, tensor).dot(x)), 0.5)
+
+    def test_sparsity_pattern_reassembly(self):
+        """
+        Tests that reassembly on the cached pattern overwrites the values in place
+        :return:
+        """
+        mesh = Mesh(6, 8)
+        K = assemble_stiffness_matrix(mesh)
+        pattern = mesh.get_sparsity_pattern()
+        self.assertIs(pattern, mesh.get_sparsity_pattern())
+        self.assertEqual(K.nnz, pattern.nnz)
+
+        data = K.data
+        K_new = assemble_stiffness_matrix(mesh, lambda co: 1 + co[0] * co[1], out=K)
+        self.assertIs(K_new, K)
+        self.assertIs(K.data, data)
+        np.testing.assert_array_almost_equal(K.toarray(),
+                                             assemble_stiffness_matrix(mesh, lambda co: 1 + co[0] * co[1]).toarray())
+        np.testing.assert_array_almost_equal(K.toarray(), K.toarray().T)
+
+    def test_matrix_free_operator(self):
+        """
+        Tests the matrix free operator against the assembled matrices
+        :return:
+        """
+        mesh = Mesh(9, 7)
+        varnr = np.shape(mesh.vertices)[1]
+        K = assemble_stiffness_matrix(mesh)
+        M = assemble_mass_matrix(mesh)
+        u = np.random.RandomState(0).rand(varnr, 3)
+
+        A = get_matrix_free_operator(mesh, 2, 3)
+        np.testing.assert_array_almost_equal(A.matvec(u[:, 0]), (2 * K + 3 * M).dot(u[:, 0]))
+        np.testing.assert_array_almost_equal(A.matmat(u), (2 * K + 3 * M).dot(u))
+        np.testing.assert_array_almost_equal(get_lumped_mass(mesh), np.asarray(M.sum(axis=1)).ravel())
+
+    def test_parallel_assembly(self):
+        """
+        Tests the element wise assembly in a process pool against the vectorized assembly
+        :return:
+        """
+        mesh = Mesh(8, 6, 1, 2)
+        f_function = FFunction()
+        np.testing.assert_array_almost_equal(generate_matrix_parallel('mass', mesh, processes=2).toarray(),
+                                             assemble_mass_matrix(mesh).toarray())
+        np.testing.assert_array_almost_equal(
+            generate_matrix_parallel('mass', mesh, processes=2, chunks=5, coefficient=f_function).toarray(),
+            assemble_mass_matrix(mesh, f_function).toarray())
+        np.testing.assert_array_almost_equal(
+            generate_matrix_parallel('stiffness', mesh, processes=2, coefficient=f_function).toarray(),
+            assemble_stiffness_matrix(mesh, f_function).toarray())
+
+    def test_mesh_renumbering(self):
+        """
+        Tests that renumbering permutes the mesh consistently and solutions can be mapped back
+        :return:
+        """
+        f_function = FFunction()
+        vertices, u = solve_helmholtz(Mesh(8, 8), f_function)
+
+        for method in ['rcm', 'hilbert', 'morton']:
+            mesh = Mesh(8, 8)
+            node_order = mesh.renumber(method, triangle_method='hilbert')
+            np.testing.assert_array_equal(mesh.vertices, vertices[:, node_order])
+            np.testing.assert_array_equal(mesh.to_original_numbering(mesh.vertices.T), vertices.T)
+            np.testing.assert_array_equal(mesh.from_original_numbering(vertices.T), mesh.vertices.T)
+
+            # Orientation and boundary tags are preserved
+            self.assertTrue(np.all(mesh.get_element_geometry()[1] > 0))
+            np.testing.assert_array_equal(mesh.vertices[1, mesh.boundary_facets[mesh.boundary_facet_tags == 3]], 1)
+
+            vertices_renumbered, u_renumbered = solve_helmholtz(mesh, f_function)
+            np.testing.assert_array_almost_equal(mesh.to_original_numbering(u_renumbered), u)
+
+    def test_mesh_io(self):
+        """
+        Tests reading Gmsh and Triangle files of the unit square and the binary mesh cache
+        :return:
+        """
+        gmsh_2 = """$MeshFormat
+2.2 0 8
+$EndMeshFormat
+$Nodes
+5
+10 0 0 0
+20 1 0 0
+30 1 1 0
+40 0 1 0
+50 0.5 0.5 0
+$EndNodes
+$Elements
+6
+1 1 2 1 1 10 20
+2 1 2 3 3 30 40
+3 2 2 0 1 10 20 50
+4 2 2 0 1 20 30 50
+5 2 2 0 1 30 40 50
+6 2 2 0 1 50 10 40
+$EndElements
+"""
+        gmsh_4 = """$MeshFormat
+4.1 0 8
+$EndMeshFormat
+$Entities
+0 2 1 0
+1 0 0 0 1 0 0 1 1 2 0
+3 0 1 0 1 1 0 1 3 2 0
+1 0 0 0 1 1 0 0 0
+$EndEntities
+$Nodes
+2 5 10 50
+2 1 0 4
+10
+20
+30
+40
+0 0 0
+1 0 0
+1 1 0
+0 1 0
+2 1 0 1
+50
+0.5 0.5 0
+$EndNodes
+$Elements
+3 6 1 6
+1 1 1 1
+1 10 20
+1 3 1 1
+2 30 40
+2 1 2 4
+3 10 20 50
+4 20 30 50
+5 30 40 50
+6 50 10 40
+$EndElements
+"""
+        node = "5 2 0 1\n1 0 0 1\n2 1 0 1\n3 1 1 3\n4 0 1 3\n5 0.5 0.5 0\n"
+        ele = "4 3 0\n1 1 2 5\n2 2 3 5\n3 3 4 5\n4 5 1 4\n"
+        edge = "4 1\n1 1 2 1\n2 2 3 2\n3 3 4 3\n4 4 1 4\n"
+
+        with tempfile.TemporaryDirectory() as directory:
+            meshes = []
+            for name, content in [('v2.msh', gmsh_2), ('v4.msh', gmsh_4)]:
+                with open(os.path.join(directory, name), 'w') as file:
+                    file.write(content)
+                meshes.append(read_gmsh(os.path.join(directory, name)))
+            for name, content in [('square.node', node), ('square.ele', ele), ('square.edge', edge)]:
+                with open(os.path.join(directory, name), 'w') as file:
+                    file.write(content)
+            meshes.append(read_triangle(os.path.join(directory, 'square')))
+
+            for mesh in meshes:
+                np.testing.assert_array_equal(mesh.vertices[:, 4], [0.5, 0.5])
+                self.assertTrue(np.all(mesh.get_element_geometry()[1] > 0))
+                self.assertAlmostEqual(np.sum(mesh.get_element_geometry()[1]) / 2, 1)
+                # Bottom edge tagged 1, top edge tagged 3
+                for tag, y in [(1, 0), (3, 1)]:
+                    np.testing.assert_array_equal(mesh.vertices[1, mesh.boundary_facets[mesh.boundary_facet_tags == tag]],
+                                                  y)
+            np.testing.assert_array_equal(meshes[0].triangle_array, meshes[1].triangle_array)
+
+            # Binary round trip, memory mapped and as archive
+            for path in [os.path.join(directory, 'cache'), os.path.join(directory, 'cache.npz')]:
+                save_mesh(meshes[0], path)
+                loaded = load_mesh(path)
+                for name in ['vertices', 'triangle_array', 'boundary_facets', 'boundary_facet_tags']:
+                    np.testing.assert_array_equal(getattr(loaded, name), getattr(meshes[0], name))
+                np.testing.assert_array_almost_equal(loaded.get_element_geometry()[1],
+                                                     meshes[0].get_element_geometry()[1])
+
+            read_mesh(os.path.join(directory, 'v2.msh'))
+            self.assertTrue(os.path.isdir(os.path.join(directory, 'v2.mesh_cache')))
+            cached = read_mesh(os.path.join(directory, 'v2.msh'))
+            np.testing.assert_array_equal(cached.triangle_array, meshes[0].triangle_array)
+
+            # CRLF line endings with trailing whitespace
+            with open(os.path.join(directory, 'crlf.msh'), 'w', newline='') as file:
+                file.write(gmsh_4.replace('\n', ' \r\n'))
+            np.testing.assert_array_equal(read_gmsh(os.path.join(directory, 'crlf.msh')).triangle_array,
+                                          meshes[1].triangle_array)
+
+            # Format 4.0 and parametric node blocks are rejected
+            for name, content in [('v40.msh', gmsh_4.replace('4.1 0 8', '4 0 8')),
+                                  ('parametric.msh', gmsh_4.replace('2 1 0 1\n50', '2 1 1 1\n50'))]:
+                with open(os.path.join(directory, name), 'w') as file:
+                    file.write(content)
+                with self.assertRaises(ValueError):
+                    read_gmsh(os.path.join(directory, name))
+
+            # Triangle basenames may contain dots
+            for name, content in [('square.1.node', node), ('square.1.ele', ele)]:
+                with open(os.path.join(directory, name), 'w') as file:
+                    file.write(content)
+            for path in ['square.1', 'square.1.ele']:
+                mesh = read_mesh(os.path.join(directory, path))
+                np.testing.assert_array_equal(mesh.triangle_array, meshes[2].triangle_array)
+            self.assertTrue(os.path.isdir(os.path.join(directory, 'square.1.mesh_cache')))
+
+    def test_polygon_mesh_generation(self):
+        """
+        Tests meshing an L-shape and a square with a hole
+        :return:
+        """
+        l_shape = np.array([[0.5, 0], [1, 0], [1, 1], [0, 1], [0, 0.5], [0.5, 0.5]])
+        square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+        hole = np.array([[0.3, 0.3], [0.3, 0.6], [0.6, 0.6], [0.6, 0.3]])
+
+        def h(x):
+            return 0.04 + 0.1 * np.abs(x[0] - 0.3)
+
+        for mesh, area, tags in [(generate_polygon_mesh(l_shape, h=0.1), 0.75, [1]),
+                                 (generate_polygon_mesh(square, [hole], h=h), 0.91, [1, 2])]:
+            J, det, J_inv = mesh.get_element_geometry()
+            self.assertTrue(np.all(det > 0))
+            self.assertAlmostEqual(np.sum(det) / 2, area)
+            np.testing.assert_array_equal(np.unique(mesh.boundary_facet_tags), tags)
+
+            # Smallest angle and largest edge
+            corners = mesh.vertices[:, mesh.triangle_array]
+            edges = np.stack([corners[:, :, (k + 1) % 3] - corners[:, :, k] for k in range(3)])
+            lengths = np.linalg.norm(edges, axis=1)
+            cosines = -np.sum(edges * np.roll(edges, 1, axis=0), axis=1) / (lengths * np.roll(lengths, 1, axis=0))
+            self.assertGreater(np.degrees(np.min(np.arccos(cosines))), 20)
+            self.assertLess(np.max(lengths), 0.2)
+
+            # Boundary facets are mesh edges lying on the polygons
+            self.assertTrue(np.all(np.isin(mesh.boundary_facets, mesh.triangle_array)))
+
+    def test_adaptive_helmholtz(self):
+        """
+        Tests the adaptive loop and that newest vertex bisection keeps the mesh conforming
+        :return:
+        """
+        f_function = FFunction()
+        mesh = Mesh(6, 6)
+        vertices, u = solve_helmholtz(mesh, f_function)
+        np.testing.assert_array_almost_equal(solve_helmholtz_sparse(mesh, f_function)[0], u[:, 0])
+
+        # Prolongation interpolates linear functions exactly
+        new_vertices, triangle_array, facets, tags, P = bisect(mesh.vertices, mesh.triangle_array, [0, 5, 17],
+                                                                mesh.boundary_facets, mesh.boundary_facet_tags)
+        linear = 2 * mesh.vertices[0] - mesh.vertices[1]
+        np.testing.assert_array_almost_equal(P.dot(linear), 2 * new_vertices[0] - new_vertices[1])
+
+        def f_peak(x):
+            return 100 * np.exp(-200 * ((x[0] - 0.3) ** 2 + (x[1] - 0.6) ** 2))
+
+        mesh, u, history = solve_helmholtz_adaptive(Mesh(4, 4), f_peak, max_levels=8)
+        estimates = [entry['estimate'] for entry in history]
+        self.assertTrue(np.all(np.diff(estimates) < 0))
+
+        # Conforming: every edge has two triangles except the tagged boundary facets
+        self.assertEqual(np.sum(mesh.get_edge_triangles()[:, 1] < 0), np.shape(mesh.boundary_facets)[0])
+        J, det, J_inv = mesh.get_element_geometry()
+        self.assertTrue(np.all(det > 0))
+        self.assertAlmostEqual(np.sum(det) / 2, 1)
+
+        # Refinement concentrates around the peak
+        centroids = np.mean(mesh.vertices[:, mesh.triangle_array], axis=2)
+        near = np.hypot(centroids[0] - 0.3, centroids[1] - 0.6) < 0.15
+        self.assertLess(np.mean(np.abs(det[near])), np.mean(np.abs(det[~near])))
+
+    def test_mesh_topology(self):
+        """
+        Tests the edge, neighbor and vertex to triangle tables against brute force searches
+        :return:
+        """
+        mesh = Mesh(5, 4)
+        triangle_array = mesh.triangle_array
+        varnr = np.shape(mesh.vertices)[1]
+        edges = mesh.get_edges()
+        triangle_edges = mesh.get_triangle_edges()
+        edge_triangles = mesh.get_edge_triangles()
+        neighbors = mesh.get_neighbors()
+
+        # Euler characteristic of a disk
+        self.assertEqual(varnr - np.shape(edges)[0] + np.shape(triangle_array)[0], 1)
+        for t in range(np.shape(triangle_array)[0]):
+            for k in range(3):
+                np.testing.assert_array_equal(edges[triangle_edges[t, k]],
+                                              np.sort(triangle_array[t, [(k + 1) % 3, (k + 2) % 3]]))
+                self.assertIn(t, edge_triangles[triangle_edges[t, k]])
+                shared = [s for s in range(np.shape(triangle_array)[0]) if s != t and
+                          np.sum(np.isin(triangle_array[s], edges[triangle_edges[t, k]])) == 2]
+                self.assertEqual(neighbors[t, k], shared[0] if shared else -1)
+
+        indptr, indices = mesh.get_vertex_triangles()
+        for i in range(varnr):
+            np.testing.assert_array_equal(np.sort(indices[indptr[i]:indptr[i + 1]]),
+                                          np.where(np.any(triangle_array == i, axis=1))[0])
+
+        # Boundary edges are the boundary facets, with the same orientation
+        boundary_edges = mesh.get_boundary_edges()
+        self.assertEqual(set(map(tuple, boundary_edges)), set(map(tuple, mesh.boundary_facets)))
+
+    def test_uniform_refinement(self):
+        """
+        Tests red refinement, the prolongation operators and the mesh hierarchy
+        :return:
+        """
+        mesh = Mesh(4, 3, 1, 2)
+        hierarchy = MeshHierarchy(mesh, 3)
+        for coarse, fine in zip(hierarchy.meshes[:-1], hierarchy.meshes[1:]):
+            self.assertEqual(np.shape(fine.triangle_array)[0], 4 * np.shape(coarse.triangle_array)[0])
+            self.assertEqual(np.shape(fine.vertices)[1], np.shape(coarse.vertices)[1] + np.shape(coarse.get_edges())[0])
+            np.testing.assert_array_equal(fine.vertices[:, :np.shape(coarse.vertices)[1]], coarse.vertices)
+            J, det, J_inv = fine.get_element_geometry()
+            self.assertTrue(np.all(det > 0))
+            self.assertAlmostEqual(np.sum(det) / 2, 2)
+
+            # Facets stay on their side and cover the whole boundary
+            self.assertEqual(set(map(tuple, fine.get_boundary_edges())), set(map(tuple, fine.boundary_facets)))
+            np.testing.assert_array_equal(fine.vertices[1, fine.boundary_facets[fine.boundary_facet_tags == 3]], 1)
+
+        # Linear functions are interpolated exactly, also over several levels
+        def linear(vertices):
+            return 1 + 3 * vertices[0] - 2 * vertices[1]
+
+        np.testing.assert_array_almost_equal(hierarchy.prolong(linear(mesh.vertices), 0),
+                                             linear(hierarchy.finest.vertices))
+        np.testing.assert_array_almost_equal(hierarchy.get_prolongation(1).dot(linear(hierarchy[1].vertices)),
+                                             linear(hierarchy.finest.vertices))
+        np.testing.assert_array_equal(hierarchy.inject(linear(hierarchy.finest.vertices), 3), linear(mesh.vertices))
+
+        # Galerkin property of the mass matrix, P^T M_fine P = M_coarse
+        P = hierarchy.prolongations[0]
+        np.testing.assert_array_almost_equal(P.T.dot(assemble_mass_matrix(hierarchy[1]).dot(P)).toarray(),
+                                             assemble_mass_matrix(mesh).toarray())
+
+    def test_mesh_partitioning(self):
+        """
+        Tests the partitioners and the subdomains with overlap
+        :return:
+        """
+        mesh = Mesh(12, 9, 1, 2)
+        tr_nr = np.shape(mesh.triangle_array)[0]
+        varnr = np.shape(mesh.vertices)[1]
+        for method in ['rcb', 'inertial', 'spectral', 'greedy']:
+            part = partition_mesh(mesh, 5, method)
+            counts = np.bincount(part, minlength=5)
+            self.assertEqual(np.sum(counts), tr_nr)
+            self.assertLessEqual(np.max(counts) - np.min(counts), 1)
+
+        subdomains = mesh.partition(3, 'rcb', overlap=1)
+        np.testing.assert_array_equal(np.sort(np.concatenate([s.core_elements for s in subdomains])), np.arange(tr_nr))
+        np.testing.assert_array_equal(np.sort(np.concatenate([s.owned_nodes for s in subdomains])), np.arange(varnr))
+        for subdomain in subdomains:
+            self.assertTrue(np.all(np.isin(subdomain.core_elements, subdomain.elements)))
+            self.assertTrue(np.all(np.isin(subdomain.owned_nodes, subdomain.nodes)))
+
+            # Interface nodes are the nodes shared with the core of another subdomain
+            others = np.concatenate([s.core_elements for s in subdomains if s is not subdomain])
+            core_nodes = np.unique(mesh.triangle_array[subdomain.core_elements])
+            np.testing.assert_array_equal(subdomain.interface_nodes,
+                                          np.intersect1d(core_nodes, mesh.triangle_array[others]))
+
+            # The local mesh maps back to the global one
+            local = subdomain.get_local_mesh()
+            np.testing.assert_array_equal(subdomain.local_to_global[local.triangle_array],
+                                          mesh.triangle_array[subdomain.elements])
+            np.testing.assert_array_equal(subdomain.global_to_local(subdomain.nodes), np.arange(len(subdomain.nodes)))
+
+    def test_schwarz_solver(self):
+        """
+        Tests the additive Schwarz preconditioned CG in this process and in worker processes
+        :return:
+        """
+        mesh = Mesh(16, 16)
+        f_function = FFunction()
+        u_ref, iterations_jacobi = solve_helmholtz_sparse(mesh, f_function)
+        for coarse, processes in [(False, 0), (True, 0), (True, 2)]:
+            u, iterations = solve_helmholtz_schwarz(mesh, f_function, parts=4, overlap=1, coarse=coarse,
+                                                    processes=processes)
+            np.testing.assert_array_almost_equal(u, u_ref)
+            self.assertLess(iterations, iterations_jacobi)
+
+    def test_mesh_quality(self):
+        """
+        Tests the quality metrics on known triangles and the detection of degenerate and inverted cells
+        :return:
+        """
+        vertices = np.array([[0, 1, 0.5, 0, 1, 2], [0, 0, np.sqrt(3) / 2, 1, 1, 0]])
+        triangle_array = np.array([[0, 1, 2], [0, 1, 3], [0, 3, 1], [0, 1, 5]])
+        quality = get_element_quality(vertices, triangle_array)
+
+        np.testing.assert_array_almost_equal(quality['area'], [np.sqrt(3) / 4, 0.5, -0.5, 0])
+        np.testing.assert_array_almost_equal(quality['aspect_ratio'][:3], [1, (1 + np.sqrt(2)) / 2,
+                                                                           (1 + np.sqrt(2)) / 2])
+        np.testing.assert_array_almost_equal(quality['min_angle'], [60, 45, 45, 0])
+        np.testing.assert_array_almost_equal(quality['max_angle'], [60, 90, 90, 180])
+        self.assertAlmostEqual(quality['condition'][1], 1)
+        self.assertTrue(np.isinf(quality['condition'][3]))
+        np.testing.assert_array_equal(quality['orientation'], [1, 1, -1, 0])
+
+        summary = get_quality_summary(quality)
+        self.assertEqual(summary['inverted'], 1)
+        self.assertEqual(summary['degenerate'], 1)
+
+        mesh = Mesh(5, 5)
+        self.assertEqual(np.shape(mesh.find_bad_elements(min_angle=40))[0], 0)
+        self.assertEqual(np.shape(mesh.find_bad_elements(min_angle=50))[0], np.shape(mesh.triangle_array)[0])
+        mesh.check_quality(max_aspect_ratio=2)
+        mesh.vertices[:, 6] = mesh.vertices[:, 0]
+        mesh._reset_cache()
+        with self.assertRaises(ValueError):
+            mesh.check_quality()
+        with self.assertRaises(ValueError):
+            solve_dynamic(mesh, None, 0.1, check_quality=True)
+
+    def test_stiff_integrators(self):
+        """
+        Tests the implicit integrators with the analytic jacobian against RK45 on the heat equation
+        :return:
+        """
+        mesh = Mesh(12, 12)
+        for matrix_free in [True, False]:
+            reference = solve_dynamic(mesh, None, 0.3, timestep=0.3, matrix_free=matrix_free, rtol=1e-6, atol=1e-8)
+            for method in ['BDF', 'Radau', 'LSODA', 'SDIRK']:
+                f = solve_dynamic(mesh, None, 0.3, timestep=0.3, matrix_free=matrix_free, method=method, rtol=1e-5,
+                                  atol=1e-7)
+                np.testing.assert_allclose(f(0.3), reference(0.3), atol=1e-4)
+                np.testing.assert_allclose(f(0.1), reference(0.1), atol=1e-3)
+                if method in ['BDF', 'Radau']:
+                    self.assertLess(np.shape(f.x)[0], np.shape(reference.x)[0])
+
+    def test_exponential_integrator(self):
+        """
+        Tests the exponential integrator on a scalar problem with known solution and on the heat equation
+        :return:
+        """
+        times = np.array([0.1, 0.3, 2.0])
+        for A in [np.array([[-2.0]]), sparse.csr_matrix([[-2.0]])]:
+            x, t_arr = integrate_exponential(A, np.array([3.0]), times, b=np.array([1.0]))
+            np.testing.assert_array_almost_equal(x[0], 0.5 + 2.5 * np.exp(-2 * times))
+
+        mesh = Mesh(10, 10)
+        for matrix_free in [True, False]:
+            reference = solve_dynamic(mesh, None, 1, timestep=1, matrix_free=matrix_free, method='Radau', rtol=1e-9,
+                                      atol=1e-11)
+            f = solve_dynamic(mesh, None, 1, matrix_free=matrix_free, method='expm', output_times=[0.05, 0.2, 1])
+            # The reference is interpolated linearly between its steps
+            np.testing.assert_allclose(f(1), reference(1), atol=1e-8)
+            np.testing.assert_allclose(f(0.05), reference(0.05), atol=1e-4)
+            np.testing.assert_allclose(f(0.2), reference(0.2), atol=1e-4)
+
+    def test_ensemble_integration(self):
+        """
+        Tests that an ensemble of initial states and boundary values gives the same trajectories as single runs
+        :return:
+        """
+        mesh = Mesh(8, 8)
+        n_ens = 5
+        rng = np.random.default_rng(0)
+        u0 = rng.uniform(0, 1, (np.shape(mesh.vertices)[1], n_ens))
+        top = mesh.vertices[1, get_dirichlet_nodes(mesh.vertices)] == 1
+        dirichlet_values = np.outer(top, rng.uniform(0.5, 2, n_ens))
+
+        for matrix_free in [True, False]:
+            f = solve_dynamic(mesh, None, 0.5, timestep=0.01, method='crank_nicolson', matrix_free=matrix_free, u0=u0,
+                              dirichlet_values=dirichlet_values)
+            self.assertEqual(np.shape(f(0.5)), np.shape(u0))
+            exact = solve_dynamic(mesh, None, 0.5, method='expm', matrix_free=matrix_free, u0=u0,
+                                  dirichlet_values=dirichlet_values, output_times=[0.25, 0.5])
+            np.testing.assert_allclose(f(0.5), exact(0.5), atol=1e-3)
+            for k in [0, n_ens - 1]:
+                single = solve_dynamic(mesh, None, 0.5, timestep=0.01, method='crank_nicolson',
+                                       matrix_free=matrix_free, u0=u0[:, k], dirichlet_values=dirichlet_values[:, k])
+                np.testing.assert_array_almost_equal(single(0.3), f(0.3)[:, k])
+
+        with self.assertRaises(ValueError):
+            solve_dynamic(mesh, None, 0.5, u0=u0)
+
+    def test_checkpoint_restart(self):
+        """
+        Tests resuming an interrupted integration from its last checkpoint
+        :return:
+        """
+        A = np.array([[-1.0, 0.3], [0.0, -2.0]])
+
+        def system(t, y, args):
+            return args[0].dot(y)
+
+        def crash(t, y, args):
+            if t > 1.3:
+                raise KeyboardInterrupt
+            return system(t, y, args)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for method in ['RK45', 'BDF', 'SDIRK']:
+                checkpoint = os.path.join(directory, method + '.npz')
+                x_ref, t_ref = solve_dynamic_system(system, (A,), 0.05, 2, np.ones(2), method=method, jac=A)
+                with self.assertRaises(KeyboardInterrupt):
+                    solve_dynamic_system(crash, (A,), 0.05, 2, np.ones(2), method=method, jac=A, checkpoint=checkpoint,
+                                         checkpoint_interval=5)
+                x, t_arr = solve_dynamic_system(system, (A,), 0.05, 2, np.zeros(2), method=method, jac=A,
+                                                checkpoint=checkpoint, restart=True)
+                self.assertEqual(t_arr[0, 0], 0)
+                self.assertTrue(np.all(np.diff(t_arr[0]) > 0))
+                np.testing.assert_allclose(x[:, -1], x_ref[:, -1], atol=1e-4)
+
+            # Mismatching and incomplete checkpoints are refused, older ones without recorded are still read
+            with self.assertRaises(ValueError):
+                solve_dynamic_system(system, (A,), 0.05, 2, np.ones(2), checkpoint=checkpoint, restart=True)
+            state = load_checkpoint(checkpoint)
+            del state['config']['recorded']
+            save_checkpoint(checkpoint, state['t'], state['y'], state['step_size'], state['steps'], state['config'])
+            solve_dynamic_system(system, (A,), 0.05, 2, np.ones(2), method='SDIRK', jac=A, checkpoint=checkpoint,
+                                 restart=True)
+            del state['config']['method']
+            save_checkpoint(checkpoint, state['t'], state['y'], state['step_size'], state['steps'], state['config'])
+            with self.assertRaises(ValueError):
+                solve_dynamic_system(system, (A,), 0.05, 2, np.ones(2), method='SDIRK', jac=A, checkpoint=checkpoint,
+                                     restart=True)
+
+            checkpoint = os.path.join(directory, 'wave.npz')
+            mesh = Mesh(6, 6)
+            reference = solve_wave_dynamic(mesh, 0.6)
+            solve_wave_dynamic(mesh, 0.3, checkpoint=checkpoint)
+            f = solve_wave_dynamic(mesh, 0.6, checkpoint=checkpoint, restart=True)
+            np.testing.assert_allclose(f(0.6), reference(0.6), atol=1e-3)
+
+    def test_trajectory_store(self):
+        """
+        Tests the chunked trajectory store and the solvers writing to it
+        :return:
+        """
+        rng = np.random.default_rng(0)
+        states = rng.uniform(size=(10, 5))
+        times = np.cumsum(rng.uniform(0.1, 1, 10))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'store')
+            with TrajectoryStore.create(path, 5, chunk_size=4, metadata={'name': 'test'}) as store:
+                for t, y in zip(times, states):
+                    store.append(t, y)
+                # The times of the open chunk are buffered
+                np.testing.assert_array_equal(store.times, times)
+            self.assertEqual(len([name for name in os.listdir(path) if name.startswith('chunk_')]), 3)
+
+            store = TrajectoryStore(path)
+            self.assertEqual(len(store), 10)
+            self.assertEqual(store.metadata['name'], 'test')
+            np.testing.assert_array_equal(store.times, times)
+            np.testing.assert_array_equal(store.get_slice(2, 9), states[2:9].T)
+            np.testing.assert_array_equal(store.get_slice(3, 6, rows=[0, 4]), states[3:6][:, [0, 4]].T)
+            np.testing.assert_array_equal(store.get_state(-1), states[-1])
+            np.testing.assert_array_equal(store.get_steps([9, 0, 5], rows=[1]), states[[9, 0, 5]][:, [1]].T)
+            t_eval = np.array([times[0], (times[4] + times[5]) / 2, times[-1]])
+            np.testing.assert_array_almost_equal(store.get_interpolator()(t_eval),
+                                                 interp1d(times, states.T)(t_eval))
+            with self.assertRaises(ValueError):
+                store.append(0, states[0])
+
+            store = TrajectoryStore(path, 'a')
+            store.truncate(6)
+            store.append(times[6], states[0])
+            store.close()
+            np.testing.assert_array_equal(TrajectoryStore(path).get_state(6), states[0])
+
+            mesh = Mesh(6, 6)
+            reference = solve_dynamic(mesh, None, 0.2, timestep=0.01)
+            f = solve_dynamic(mesh, None, 0.2, timestep=0.01, store=path)
+            np.testing.assert_array_almost_equal(f(f.x), reference(reference.x))
+
+            checkpoint = os.path.join(directory, 'wave.npz')
+            reference = solve_wave_dynamic(mesh, 0.6)
+            solve_wave_dynamic(mesh, 0.3, checkpoint=checkpoint, store=path)
+            f = solve_wave_dynamic(mesh, 0.6, checkpoint=checkpoint, restart=True, store=path)
+            self.assertEqual(f.x[0], 0)
+            np.testing.assert_allclose(f(0.6), reference(0.6), atol=1e-3)
+
+    def test_compressed_trajectory_store(self):
+        """
+        Tests downcasting, quantization with an error bound and truncation of compressed trajectory stores
+        :return:
+        """
+        times = np.linspace(0, 1, 50)
+        states = np.sin(np.outer(times, np.arange(1, 31)))
+        with tempfile.TemporaryDirectory() as directory:
+            for dtype, error_bound, tolerance in [(np.float64, None, 0), (np.float16, None, 1e-3),
+                                                  (np.float64, 1e-4, 1e-4)]:
+                path = os.path.join(directory, str(np.dtype(dtype)) + str(error_bound))
+                store = TrajectoryStore.create(path, 30, chunk_size=16, dtype=dtype, compression='zlib',
+                                               error_bound=error_bound)
+                for t, y in zip(times[:40], states[:40]):
+                    store.append(t, y)
+                store.close()
+
+                # Continue after dropping some steps
+                store = TrajectoryStore(path, 'a')
+                store.truncate(35)
+                for t, y in zip(times[35:], states[35:]):
+                    store.append(t, y)
+                store.close()
+
+                store = TrajectoryStore(path)
+                self.assertEqual(len(store), 50)
+                self.assertLessEqual(np.max(np.abs(store.get_slice() - states.T)), tolerance * (1 + 1e-9))
+                np.testing.assert_allclose(store.get_state(20), states[20], atol=tolerance * (1 + 1e-9))
+
+            raw_size = np.size(states) * 8
+            compressed_size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            self.assertLess(compressed_size, raw_size / 2)
+
+    def test_probes(self):
+        """
+        Tests the sampling matrix and the solvers recording only probe values
+        :return:
+        """
+        mesh = Mesh(8, 8)
+        points = np.array([[0.13, 0.5, 1.0, 0.77], [0.41, 0.5, 0.3, 0.0]])
+        sampling = get_sampling_matrix(mesh, points)
+        self.assertEqual(np.shape(sampling), (4, np.shape(mesh.vertices)[1]))
+        linear = 2 * mesh.vertices[0] - 3 * mesh.vertices[1] + 1
+        np.testing.assert_array_almost_equal(sampling.dot(linear), 2 * points[0] - 3 * points[1] + 1)
+        with self.assertRaises(ValueError):
+            get_sampling_matrix(mesh, np.array([[0.5], [1.5]]))
+
+        reference = solve_dynamic(mesh, None, 0.2, timestep=0.01)
+        f = solve_dynamic(mesh, None, 0.2, timestep=0.01, probes=points)
+        np.testing.assert_array_almost_equal(f(f.x), sampling.dot(reference(reference.x)))
+
+        reference = solve_dynamic(mesh, None, 0.2, timestep=0.01, method='backward_euler')
+        f = solve_dynamic(mesh, None, 0.2, timestep=0.01, method='backward_euler', probes=points)
+        np.testing.assert_array_almost_equal(f(0.2), sampling.dot(reference(0.2)))
+        reference = solve_dynamic(mesh, None, 0.2, timestep=0.01, method='expm')
+        f = solve_dynamic(mesh, None, 0.2, timestep=0.01, method='expm', probes=points)
+        np.testing.assert_array_almost_equal(f(f.x), sampling.dot(reference(reference.x)))
+        with self.assertRaises(ValueError):
+            solve_dynamic(mesh, None, 0.2, method='parareal', probes=points)
+
+        with tempfile.TemporaryDirectory() as directory:
+            reference = solve_wave_dynamic(mesh, 0.3)
+            f = solve_wave_dynamic(mesh, 0.3, probes=points, store=os.path.join(directory, 'store'))
+            self.assertEqual(TrajectoryStore(os.path.join(directory, 'store')).varnr, 4)
+            np.testing.assert_array_almost_equal(f(0.3), sampling.dot(reference(0.3)))
+
+    def test_parareal(self):
+        """
+        Tests parareal against the serial fine propagator
+        :return:
+        """
+        mesh = Mesh(10, 10)
+        varnr = np.shape(mesh.vertices)[1]
+        M = assemble_mass_matrix(mesh) + 0.1 * sparse.identity(varnr)
+        K = assemble_stiffness_matrix(mesh)
+        x_0 = np.sin(np.pi * mesh.vertices[0]) * mesh.vertices[1]
+        reference, t_ref = integrate_theta(M, K, x_0, 0.005, 200, 0.5)
+
+        x, t_arr, info = integrate_parareal(M, K, x_0, 0, 1.0, 4, fine_timestep=0.005, tolerance=0)
+        self.assertEqual(info['iterations'], 4)
+        np.testing.assert_array_almost_equal(t_arr, t_ref)
+        np.testing.assert_allclose(x, reference, atol=1e-12)
+
+        x, t_arr, info = integrate_parareal(M, K, x_0, 0, 1.0, 8, fine_timestep=0.005, tolerance=1e-8, processes=2)
+        self.assertLess(info['iterations'], 8)
+        self.assertLess(info['changes'][-1], 1e-8)
+        np.testing.assert_allclose(x[:, -1], reference[:, -1], atol=1e-6)
+
+        reference = solve_dynamic(mesh, None, 0.5, timestep=0.005, method='crank_nicolson')
+        f = solve_dynamic(mesh, None, 0.5, timestep=0.005, method='parareal', slices=5, fine='SDIRK', rtol=1e-7,
+                          atol=1e-9)
+        self.assertLessEqual(f.info['iterations'], 5)
+        self.assertEqual(len(f.info['changes']), f.info['iterations'])
+        np.testing.assert_allclose(f(0.5), reference(0.5), atol=1e-4)
+
+    def test_reduced_order_model(self):
+        """
+        Tests the POD bases and the reduced heat and wave models against full solutions
+        :return:
+        """
+        rng = np.random.default_rng(1)
+        snapshots = rng.standard_normal((300, 6)).dot(rng.standard_normal((6, 800)))
+        basis, s = compute_pod_basis(snapshots, rank=6)
+        exact, s_exact = compute_pod_basis(snapshots, rank=6, randomized=False)
+        np.testing.assert_allclose(s, s_exact[:6], rtol=1e-8)
+        np.testing.assert_allclose(np.abs(basis.T.dot(exact)), np.eye(6), atol=1e-8)
+
+        mesh = Mesh(12, 12)
+        varnr = np.shape(mesh.vertices)[1]
+        M = assemble_mass_matrix(mesh)
+        K = assemble_stiffness_matrix(mesh)
+        times = np.linspace(0, 0.5, 26)
+        trajectories = [solve_dynamic(mesh, None, 0.5, method='expm', u0=np.full(varnr, value), output_times=times)
+                        for value in [0.3, 0.9]]
+        model = ReducedOrderModel.from_snapshots(collect_snapshots(trajectories, times), M, K, rank=12)
+        self.assertLess(model.get_energy_error(), 1e-6)
+
+        # An initial value between the sampled ones
+        reference = solve_dynamic(mesh, None, 0.5, method='expm', u0=np.full(varnr, 0.6), output_times=times)
+        a, t_arr = model.solve(reference(0), 0.5, 0.02)
+        f = model.get_interpolator(a, t_arr)
+        self.assertLess(np.max(model.get_projection_error(reference(times[1:]))), 1e-5)
+        np.testing.assert_allclose(f(times[2:]), reference(times[2:]), atol=1e-4)
+        np.testing.assert_allclose(f(0.5)[:5], model.get_interpolator(a, t_arr, np.arange(5))(0.5))
+
+        # Wave equation with the driven boundary of the wave solver, reduced on the free nodes
+        mesh = Mesh(24, 24)
+        lifting = get_wave_lifting(mesh)
+        M = assemble_mass_matrix(mesh)
+        K = WAVE_SPEED ** 2 * assemble_stiffness_matrix(mesh)
+        wave = solve_wave_dynamic(mesh, 1.0, rtol=1e-8, atol=1e-10)
+        times = np.linspace(0, 1, 101)
+        snapshots = collect_snapshots([wave], times)
+        model = ReducedOrderModel.from_snapshots(snapshots, M, K, order=2, rank=20, lifting=lifting)
+        self.assertEqual(np.shape(model.basis), (np.shape(lifting.free)[0], 20))
+        self.assertRaises(ValueError, model.reconstruct, model.project(snapshots[:, 0]))
+        a, t_arr = model.solve(np.zeros(np.shape(mesh.vertices)[1]), 1.0, 0.005)
+        f = model.get_interpolator(a, t_arr)
+        np.testing.assert_allclose(f(times), snapshots, atol=2e-4)
+        drive = np.column_stack([lifting.get_values(t) for t in times])
+        np.testing.assert_allclose(f(times)[lifting.nodes], drive, atol=1e-14)
+
+    def test_dirichlet_lifting(self):
+        """
+        Tests the lifting of time dependent Dirichlet BC and the wave solver integrating only the free nodes
+        :return:
+        """
+        lifting = DirichletLifting(5, [3, 1], lambda t: np.array([np.sin(t), t ** 3]))
+        np.testing.assert_array_equal(lifting.free, [0, 2, 4])
+        np.testing.assert_allclose(lifting.get_values(0.5, 1), [np.cos(0.5), 0.75], rtol=1e-7)
+        np.testing.assert_allclose(lifting.get_values(0.5, 2), [-np.sin(0.5), 3], rtol=1e-5)
+        u = lifting.extend(np.array([1.0, 2.0, 3.0]), 0.5)
+        np.testing.assert_allclose(u, [1, np.sin(0.5), 2, 0.125, 3])
+        np.testing.assert_array_equal(lifting.restrict(u), [1, 2, 3])
+        A_FF, A_FD = lifting.split(np.arange(25).reshape(5, 5))
+        np.testing.assert_array_equal(A_FD, [[1, 3], [11, 13], [21, 23]])
+        constant = DirichletLifting(5, [0], 2.0)
+        np.testing.assert_array_equal(constant.extend(np.zeros(4), 1.0, 1), np.zeros(5))
+
+        # The boundary drive is exact at every step and the methods agree
+        mesh = Mesh(8, 8)
+        top = np.logical_and(mesh.vertices[1] == 1, np.logical_and(mesh.vertices[0] > 0, mesh.vertices[0] < 1))
+        f = solve_wave_dynamic(mesh, 0.5, rtol=1e-7, atol=1e-9)
+        drive = np.where(f.x < 1 / 3, 0.2 * np.sin(3 * np.pi * f.x), 0)
+        np.testing.assert_allclose(f(f.x)[top], np.tile(drive, (np.sum(top), 1)), atol=1e-14)
+        self.assertLess(len(f.x), 200)
+        reference = solve_wave_dynamic(mesh, 0.5, method='Radau', rtol=1e-7, atol=1e-9)
+        np.testing.assert_allclose(f(0.5), reference(0.5), atol=1e-6)
+        reference = solve_wave_dynamic(mesh, 0.5, method='SDIRK', rtol=1e-5, atol=1e-7)
+        np.testing.assert_allclose(f(0.5), reference(0.5), atol=1e-3)
+
 
 if __name__ == '__main__':
     print("Starting unittest...")
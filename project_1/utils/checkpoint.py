@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Implements checkpoints of time integrations. The integrator state is written atomically to a binary .npz file, the
+trajectory is appended row by row to a raw float64 file next to it, so a killed run can resume from the last
+checkpoint without recomputing from the initial time.
+"""
+
+import os
+import json
+import numpy as np
+
+
+def save_checkpoint(path, t, y, step_size, steps, config):
+    """
+    Writes the integrator state atomically, a crash during writing leaves the previous checkpoint intact
+    :param path: The checkpoint file, ending in .npz
+    :param t: The current time
+    :param y: The current state
+    :param step_size: The size of the last step, used as first step after a restart
+    :param steps: The number of trajectory rows written so far
+    :param config: Dictionary of the solver configuration, must be JSON serializable
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    temporary = os.path.join(directory, '.' + os.path.basename(path) + '.tmp')
+    with open(temporary, 'wb') as file:
+        np.savez(file, t=np.float64(t), y=np.asarray(y, dtype=np.float64), step_size=np.float64(step_size),
+                 steps=np.int64(steps), config=np.array(json.dumps(config, sort_keys=True)))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint
+    :param path: The checkpoint file
+    :return: Dictionary with t, y, step_size, steps and config
+    """
+    with np.load(path) as data:
+        return {'t': float(data['t']), 'y': data['y'], 'step_size': float(data['step_size']),
+                'steps': int(data['steps']), 'config': json.loads(str(data['config']))}
+
+
+def get_trajectory_path(path):
+    """
+    Gives the trajectory file belonging to a checkpoint
+    :param path: The checkpoint file
+    :return: The path of the trajectory file
+    """
+    return os.path.splitext(path)[0] + '.trajectory'
+
+
+def open_trajectory(path, varnr, steps=0):
+    """
+    Opens the trajectory file of a checkpoint for appending. Rows written after the checkpoint are dropped, they are
+    recomputed after the restart.
+    :param path: The checkpoint file
+    :param varnr: The size of the state
+    :param steps: The number of rows to keep
+    :return: The rows kept as array (steps, varnr + 1) of time and state, and the file opened for appending
+    """
+    trajectory_path = get_trajectory_path(path)
+    row_bytes = (varnr + 1) * 8
+    if steps > 0:
+        rows = np.fromfile(trajectory_path, dtype=np.float64, count=steps * (varnr + 1))
+        if np.shape(rows)[0] < steps * (varnr + 1):
+            raise ValueError('The trajectory file ' + trajectory_path + ' is shorter than the checkpoint')
+        rows = rows.reshape(steps, varnr + 1)
+        file = open(trajectory_path, 'r+b')
+        file.truncate(steps * row_bytes)
+        file.seek(0, os.SEEK_END)
+    else:
+        rows = np.zeros((0, varnr + 1))
+        file = open(trajectory_path, 'wb')
+    return rows, file
+
+
+def append_trajectory(file, t, y):
+    """
+    Appends one row of time and state to a trajectory file
+    :param file: The file opened for appending
+    :param t: The time
+    :param y: The state
+    """
+    np.concatenate(([t], y)).astype(np.float64).tofile(file)
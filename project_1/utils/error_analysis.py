@@ -10,8 +10,9 @@ import scipy.integrate as integrate
 
 from project_1.infrastructure.affine_transformation import AffineTransformation
 from project_1.infrastructure.p1_reference_element import P1ReferenceElement
-from project_1.utils.integration import gauss_legendre_reference
+from project_1.utils.integration import gauss_legendre_reference, gauss_legendre_reference_points
 from project_1.infrastructure.mesh import Mesh
+from project_1.solvers.matrix_generation import evaluate_coefficient
 from matplotlib.tri import Triangulation, LinearTriInterpolator
 
 
@@ -46,7 +47,7 @@ def calc_l2_error_simplex_based(mesh, u_tilde_function, u):
         x0 = np.array([[v0_coord[0]], [v0_coord[1]]])
         x_new = j.dot(xc) + x0
         trival =  fz(x_new[0],x_new[1])
-        return np.asscalar(trival - u_function.value((x_new[0], x_new[1]))) ** 2
+        return (trival - u_function.value((x_new[0], x_new[1]))).item() ** 2
 
 
 
@@ -81,3 +82,36 @@ def calc_l2_error_simplex_based(mesh, u_tilde_function, u):
                                             args=(p1_ref, u_tilde_function, j, v0_coord, det, fz))
         error += ans*np.abs(det)
     return np.sqrt(error)
+
+
+def calc_l2_error_quadrature(mesh, u_tilde_function, u, supports=7):
+    """
+    Calculates the L2 error of the solution with a Gauss-Legendre quadrature on all triangles of its own mesh at once
+    :param mesh: The mesh of the solution
+    :param u_tilde_function: The analytical solution
+    :param u: The solution array
+    :param supports: Number of supports of the quadrature
+    :return: The L2 error
+    """
+    J, det, J_inv = mesh.get_element_geometry()
+    points, weights = gauss_legendre_reference_points(supports)
+    phi = P1ReferenceElement().batch_value(points)
+
+    u_h = np.einsum('ti,iq->tq', np.ravel(u)[mesh.triangle_array], phi)
+    u_q = evaluate_coefficient(u_tilde_function, mesh, points)
+    return np.sqrt(np.einsum('tq,q,t->', (u_q - u_h) ** 2, weights, np.abs(det)))
+
+
+def calc_l2_error_history(mesh, u_tilde_function, solution, times, supports=7):
+    """
+    Calculates the L2 error of a time dependent solution at some times, e.g. from a TrajectoryInterpolator that reads
+    only the stored steps around these times
+    :param mesh: The mesh of the solution
+    :param u_tilde_function: The analytical solution providing .value(x, t)
+    :param solution: Callable giving the solution array at a time
+    :param times: The times at which the error is calculated
+    :param supports: Number of supports of the quadrature
+    :return: Array of the L2 errors
+    """
+    return np.array([calc_l2_error_quadrature(mesh, lambda x: u_tilde_function.value(x, t), solution(t), supports)
+                     for t in times])
@@ -80,6 +80,37 @@ def gauss_legendre_reference(integrand, args,supports = 7):
         
 
 
+def gauss_legendre_reference_points(supports=7):
+    """
+    Gives the points and weights of the Gauss-Legendre quadrature on the simplex reference cell in 2D, so that
+    integrands can be evaluated at all points at once
+    :param supports: Number of supports, 1, 3, 4 or 7
+    :return: Array (2,Q) of the (x,y) coordinates of the supports and array (Q) of the weights
+    """
+    if supports == 7:
+        a = (6 - np.sqrt(15)) / 21
+        b = (6 + np.sqrt(15)) / 21
+        barycentric = np.array([[1 / 3, 1 / 3, 1 / 3],
+                                [a, a, 1 - 2 * a], [a, 1 - 2 * a, a], [1 - 2 * a, a, a],
+                                [b, b, 1 - 2 * b], [b, 1 - 2 * b, b], [1 - 2 * b, b, b]])
+        weights = np.array([9 / 80] + [(155 - np.sqrt(15)) / 2400] * 3 + [(155 + np.sqrt(15)) / 2400] * 3)
+    elif supports == 4:
+        barycentric = np.array([[1 / 3, 1 / 3, 1 / 3], [3 / 5, 1 / 5, 1 / 5], [1 / 5, 3 / 5, 1 / 5],
+                                [1 / 5, 1 / 5, 3 / 5]])
+        weights = np.array([-27 / 96, 25 / 96, 25 / 96, 25 / 96])
+    elif supports == 3:
+        barycentric = np.array([[1 / 2, 1 / 2, 0], [1 / 2, 0, 1 / 2], [0, 1 / 2, 1 / 2]])
+        weights = np.array([1 / 6, 1 / 6, 1 / 6])
+    elif supports == 1:
+        barycentric = np.array([[1 / 3, 1 / 3, 1 / 3]])
+        weights = np.array([1 / 2])
+    else:
+        raise ValueError('No quadrature rule with ' + str(supports) + ' supports available.')
+
+    points = barycentric[:, 1:].T
+    return points, weights
+
+
 def barycentric_to_cartesian_reference(l1, l2, l3):
     """
     Converts barycentric coordinates to cartesian coordinates on the reference simplex
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Implements iterative solvers for sparse linear systems
+"""
+
+import numpy as np
+
+
+def conjugate_gradient(A, b, x0=None, tol=1e-10, max_iterations=None, preconditioner=None):
+    """
+    Solves A x = b for a symmetric positive definite A with the preconditioned conjugate gradient method
+    :param A: The matrix or linear operator, anything providing .dot
+    :param b: The right hand side
+    :param x0: The initial guess, e.g. a solution from a coarser mesh
+    :param tol: Stop once the residual is reduced by this factor relative to b
+    :param max_iterations: Maximal number of iterations, by default ten times the size of the system, since rounding
+    errors can keep CG from converging within N iterations
+    :param preconditioner: Function applying the inverse of the preconditioner to a residual
+    :return: The solution and the number of iterations used
+    """
+    b = np.ravel(b)
+    x = np.zeros_like(b, dtype=float) if x0 is None else np.array(x0, dtype=float).ravel()
+    if max_iterations is None:
+        max_iterations = 10 * np.shape(b)[0]
+
+    r = b - A.dot(x)
+    z = r if preconditioner is None else preconditioner(r)
+    p = z.copy()
+    rz = r.dot(z)
+    norm_b = np.linalg.norm(b)
+    if norm_b == 0:
+        norm_b = 1
+
+    for iteration in range(max_iterations):
+        if np.linalg.norm(r) <= tol * norm_b:
+            return x, iteration
+        Ap = A.dot(p)
+        alpha = rz / p.dot(Ap)
+        x += alpha * p
+        r -= alpha * Ap
+        z = r if preconditioner is None else preconditioner(r)
+        rz_new = r.dot(z)
+        p = z + rz_new / rz * p
+        rz = rz_new
+    return x, max_iterations
+
+
+def get_jacobi_preconditioner(A):
+    """
+    Gives the diagonal (Jacobi) preconditioner of a sparse matrix
+    :param A: The sparse matrix
+    :return: Function applying the inverse of the diagonal
+    """
+    diagonal = A.diagonal()
+
+    def apply(r):
+        return r / diagonal
+
+    return apply
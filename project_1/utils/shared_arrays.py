@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Implements numpy arrays in shared memory blocks, so worker processes exchange large arrays without pickling them.
+The creating process owns the block and has to close and unlink it, the workers attach by name and only close it.
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+
+
+def create_shared_array(array, dtype=np.float64):
+    """
+    Copies an array into a new shared memory block
+    :param array: The array
+    :param dtype: The data type in shared memory
+    :return: The array in shared memory and the shared memory block
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(np.asarray(array, dtype=dtype).nbytes, 1))
+    shared = np.ndarray(np.shape(array), dtype=dtype, buffer=block.buf)
+    shared[...] = array
+    return shared, block
+
+
+def attach_shared_array(name, shape, dtype=np.float64):
+    """
+    Attaches to an array created by create_shared_array, e.g. in a worker process
+    :param name: The name of the shared memory block
+    :param shape: The shape of the array
+    :param dtype: The data type in shared memory
+    :return: The array in shared memory and the shared memory block
+    """
+    block = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf), block
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Implements an on-disk store for trajectories of time integrations. The states are written incrementally into
+memory-mapped chunk files of a fixed number of time steps, the times go to a raw file and a small JSON header holds the
+sizes, the mesh id and metadata. Readers map only the chunks holding the time slices they touch.
+
+Stores used for visualization or archiving can be compressed: the chunks are then downcast to the store dtype, or
+quantized to a given error bound and delta encoded in time, and written with np.savez_compressed. Reading decompresses
+them transparently, one chunk at a time.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+HEADER_FILE = 'header.json'
+TIMES_FILE = 'times.f64'
+
+
+def get_mesh_id(mesh):
+    """
+    Gives an id of a mesh, the SHA-1 of its vertices and triangles
+    :param mesh: The mesh
+    :return: The hex digest
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(mesh.vertices, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(mesh.triangle_array, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def open_trajectory_store(path, varnr, mesh=None, restart=False, chunk_size=256, metadata=None, dtype=np.float64,
+                          compression=None, error_bound=None):
+    """
+    Opens a store for appending, reusing an existing one when restarting
+    :param path: The directory of the store
+    :param varnr: The size of every state
+    :param mesh: The mesh the states live on, its id is stored in the header
+    :param restart: Should an existing store be continued instead of replaced
+    :param chunk_size: Number of time steps per chunk file of a new store
+    :param metadata: Dictionary of JSON serializable metadata of a new store
+    :param dtype: The data type of the states of a new store, e.g. np.float32 or np.float16 to save space
+    :param compression: None for memory-mapped raw chunks or 'zlib' for compressed chunks
+    :param error_bound: Maximal absolute error of the compressed states, None for no quantization
+    :return: The TrajectoryStore
+    """
+    mesh_id = None if mesh is None else get_mesh_id(mesh)
+    if restart and os.path.exists(os.path.join(path, HEADER_FILE)):
+        store = TrajectoryStore(path, 'a')
+        if store.varnr != varnr or (mesh_id is not None and store.mesh_id not in [None, mesh_id]):
+            raise ValueError('The trajectory store ' + path + ' belongs to another problem')
+        return store
+    return TrajectoryStore.create(path, varnr, chunk_size, dtype, mesh_id, metadata, compression, error_bound)
+
+
+class TrajectoryStore:
+    """
+    A trajectory of states (N) over time steps, stored on disk in chunks of chunk_size time steps
+    """
+
+    def __init__(self, path, mode='r'):
+        """
+        Opens an existing store, use TrajectoryStore.create for a new one
+        :param path: The directory of the store
+        :param mode: 'r' to read, 'a' to append
+        """
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, HEADER_FILE), 'r') as file:
+            header = json.load(file)
+        self.varnr = header['varnr']
+        self.chunk_size = header['chunk_size']
+        self.dtype = np.dtype(header['dtype'])
+        self.mesh_id = header['mesh_id']
+        self.metadata = header['metadata']
+        self.count = header['count']
+        self.compression = header.get('compression')
+        self.error_bound = header.get('error_bound')
+        self._chunk = None
+        self._cache = (None, None)
+        self._chunk_index = None
+        self._times = None
+        self._pending_times = []
+
+    @classmethod
+    def create(cls, path, varnr, chunk_size=256, dtype=np.float64, mesh_id=None, metadata=None, compression=None,
+               error_bound=None):
+        """
+        Creates an empty store, an existing store in the directory is replaced
+        :param path: The directory of the store
+        :param varnr: The size of every state
+        :param chunk_size: Number of time steps per chunk file
+        :param dtype: The data type of the states
+        :param mesh_id: Id of the mesh the states live on, e.g. from get_mesh_id
+        :param metadata: Dictionary of JSON serializable metadata
+        :param compression: None for memory-mapped raw chunks or 'zlib' for compressed chunks
+        :param error_bound: Maximal absolute error of the compressed states, None for no quantization
+        :return: The store opened for appending
+        """
+        if compression not in [None, 'zlib']:
+            raise ValueError('Unknown compression ' + str(compression))
+        if error_bound is not None and compression is None:
+            raise ValueError('An error bound needs compression')
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith('chunk_') or name in [HEADER_FILE, TIMES_FILE]:
+                os.remove(os.path.join(path, name))
+        open(os.path.join(path, TIMES_FILE), 'wb').close()
+        header = {'varnr': int(varnr), 'chunk_size': int(chunk_size), 'dtype': np.dtype(dtype).str, 'mesh_id': mesh_id,
+                  'metadata': metadata or {}, 'count': 0, 'compression': compression, 'error_bound': error_bound}
+        _write_header(path, header)
+        return cls(path, 'a')
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def times(self):
+        """
+        The times of all stored steps
+        :return: Array of the times
+        """
+        if self._times is None or np.shape(self._times)[0] != self.count:
+            written = np.fromfile(os.path.join(self.path, TIMES_FILE), dtype=np.float64,
+                                  count=self.count - len(self._pending_times))
+            self._times = np.concatenate((written, self._pending_times))
+        return self._times
+
+    def append(self, t, y):
+        """
+        Appends the state of one time step
+        :param t: The time
+        :param y: The state (N)
+        """
+        if self.mode != 'a':
+            raise ValueError('The trajectory store is opened read only')
+        index, row = divmod(self.count, self.chunk_size)
+        if index != self._chunk_index:
+            self._flush_chunk()
+            self._chunk = self._open_chunk(index)
+            self._chunk_index = index
+        self._chunk[row] = y
+        # The times are written together with their chunk
+        self._pending_times.append(t)
+        self.count += 1
+        self._times = None
+
+    def flush(self):
+        """
+        Writes the current chunk, its times and the header to disk
+        """
+        self._flush_chunk()
+        if self.mode == 'a':
+            self._write_header()
+
+    def close(self):
+        """
+        Flushes and releases the current chunk
+        """
+        self.flush()
+        self._chunk = None
+        self._chunk_index = None
+
+    def truncate(self, count):
+        """
+        Drops all steps from count on, e.g. the steps computed after the checkpoint a run is restarted from
+        :param count: The number of steps to keep
+        """
+        if count > self.count:
+            raise ValueError('The store holds only ' + str(self.count) + ' steps')
+        self.close()
+        with open(os.path.join(self.path, TIMES_FILE), 'r+b') as file:
+            file.truncate(count * 8)
+        self.count = count
+        self._times = None
+        self._cache = (None, None)
+        if self.compression is not None and count % self.chunk_size > 0:
+            # Rewrite the last compressed chunk without the dropped steps
+            index = count // self.chunk_size
+            self._chunk = self._open_chunk(index)
+            self._chunk_index = index
+            self.close()
+        self._write_header()
+
+    def get_state(self, i):
+        """
+        Reads the state of one step
+        :param i: The index of the step
+        :return: Array (N)
+        """
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('Step ' + str(i) + ' is not in the store')
+        index, row = divmod(i, self.chunk_size)
+        return np.array(self._get_chunk(index)[row], dtype=float)
+
+    def get_slice(self, start=0, stop=None, rows=None):
+        """
+        Reads the states of consecutive steps, mapping only the chunks holding them
+        :param start: The first step
+        :param stop: The step after the last one, the end by default
+        :param rows: Optional index of the state components to read
+        :return: Array (N, stop - start) or (len(rows), stop - start)
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        parts = []
+        for index in range(start // self.chunk_size, (stop - 1) // self.chunk_size + 1 if stop > start else 0):
+            first = max(start - index * self.chunk_size, 0)
+            last = min(stop - index * self.chunk_size, self.chunk_size)
+            block = self._get_chunk(index)[first:last]
+            parts.append(np.array(block if rows is None else block[:, rows], dtype=float))
+        if not parts:
+            return np.zeros((self.varnr if rows is None else np.shape(np.arange(self.varnr)[rows])[0], 0))
+        return np.concatenate(parts).T
+
+    def get_steps(self, steps, rows=None):
+        """
+        Reads the states of arbitrary steps, every chunk holding some of them is read once
+        :param steps: Array of step indices
+        :param rows: Optional index of the state components to read
+        :return: Array (N, len(steps)) or (len(rows), len(steps))
+        """
+        steps = np.asarray(steps, dtype=int)
+        if np.any(steps < 0) or np.any(steps >= self.count):
+            raise IndexError('A step is not in the store')
+        states = np.zeros((self.varnr if rows is None else np.shape(np.arange(self.varnr)[rows])[0],
+                           np.shape(steps)[0]))
+        chunks = steps // self.chunk_size
+        for index in np.unique(chunks):
+            in_chunk = chunks == index
+            block = self._get_chunk(index)[steps[in_chunk] - index * self.chunk_size]
+            states[:, in_chunk] = (block if rows is None else block[:, rows]).T
+        return states
+
+    def get_interpolator(self, rows=None):
+        """
+        Gives a linear interpolator in time reading only the two steps around every evaluated time
+        :param rows: Optional index of the state components to interpolate
+        :return: The TrajectoryInterpolator
+        """
+        return TrajectoryInterpolator(self, rows)
+
+    def _get_chunk(self, index):
+        if index == self._chunk_index:
+            return self._chunk
+        if self.compression is None:
+            return self._map_chunk(index, 'r')
+        # Compressed chunks are decoded once and kept until another chunk is read
+        if self._cache[0] != index:
+            self._cache = (index, self._read_compressed_chunk(index))
+        return self._cache[1]
+
+    def _open_chunk(self, index):
+        """
+        Opens a chunk for writing, a compressed chunk is decoded into a buffer that is encoded again on flush
+        """
+        exists = os.path.exists(self._get_chunk_path(index))
+        if self.compression is None:
+            return self._map_chunk(index, 'r+' if exists else 'w+')
+        buffer = np.zeros((self.chunk_size, self.varnr))
+        if exists:
+            data = self._read_compressed_chunk(index)
+            rows = min(np.shape(data)[0], self.count - index * self.chunk_size)
+            buffer[:rows] = data[:rows]
+        return buffer
+
+    def _map_chunk(self, index, mode):
+        return np.memmap(self._get_chunk_path(index), dtype=self.dtype, mode=mode,
+                         shape=(self.chunk_size, self.varnr))
+
+    def _read_compressed_chunk(self, index):
+        with np.load(self._get_chunk_path(index)) as data:
+            return decode_chunk(data['data'], self.dtype, self.error_bound)
+
+    def _get_chunk_path(self, index):
+        if self.compression is None:
+            return os.path.join(self.path, 'chunk_%06d.bin' % index)
+        return os.path.join(self.path, 'chunk_%06d.npz' % index)
+
+    def _flush_chunk(self):
+        if self._pending_times:
+            with open(os.path.join(self.path, TIMES_FILE), 'r+b') as file:
+                file.seek((self.count - len(self._pending_times)) * 8)
+                np.array(self._pending_times, dtype=np.float64).tofile(file)
+            self._pending_times = []
+        if self._chunk is None:
+            return
+        if self.compression is None:
+            self._chunk.flush()
+            return
+        rows = min(self.count - self._chunk_index * self.chunk_size, self.chunk_size)
+        if rows > 0:
+            # Write to a temporary file first, the previous version of the chunk stays valid until the replace
+            path = self._get_chunk_path(self._chunk_index)
+            temporary = path + '.tmp'
+            with open(temporary, 'wb') as file:
+                np.savez_compressed(file, data=encode_chunk(self._chunk[:rows], self.dtype, self.error_bound))
+            os.replace(temporary, path)
+            if self._cache[0] == self._chunk_index:
+                self._cache = (None, None)
+
+    def _write_header(self):
+        _write_header(self.path, {'varnr': self.varnr, 'chunk_size': self.chunk_size, 'dtype': self.dtype.str,
+                                  'mesh_id': self.mesh_id, 'metadata': self.metadata, 'count': self.count,
+                                  'compression': self.compression, 'error_bound': self.error_bound})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TrajectoryInterpolator:
+    """
+    Linear interpolation of a stored trajectory in time, a drop in replacement for interp1d over the states
+    """
+
+    def __init__(self, store, rows=None):
+        """
+        :param store: The TrajectoryStore
+        :param rows: Optional index of the state components to interpolate
+        """
+        self.store = store
+        self.rows = rows
+        self.x = store.times
+
+    def __call__(self, t):
+        """
+        Evaluates the trajectory
+        :param t: A time or an array of times within the stored times
+        :return: The state (N) at a scalar time, else an array (N, len(t))
+        """
+        t_eval = np.atleast_1d(np.asarray(t, dtype=float))
+        times = self.x
+        if np.any(t_eval < times[0]) or np.any(t_eval > times[-1]):
+            raise ValueError('A value in t is outside the stored time range')
+        upper = np.clip(np.searchsorted(times, t_eval, side='right'), 1, np.shape(times)[0] - 1)
+        lower = upper - 1
+        span = times[upper] - times[lower]
+        weight = np.where(span > 0, (t_eval - times[lower]) / np.where(span > 0, span, 1), 0)
+
+        # One read per chunk for all evaluated times
+        steps, positions = np.unique(np.concatenate((lower, upper)), return_inverse=True)
+        states = self.store.get_steps(steps, self.rows)
+        n = np.shape(t_eval)[0]
+        values = states[:, positions[:n]] * (1 - weight) + states[:, positions[n:]] * weight
+        return values[:, 0] if np.ndim(t) == 0 else values
+
+
+def encode_chunk(data, dtype=np.float64, error_bound=None):
+    """
+    Encodes a chunk of states for compression. With an error bound, the states are quantized to multiples of twice the
+    bound and the integers are delta encoded in time, so slowly varying states give small integers that compress well.
+    Otherwise the states are downcast to dtype and their bytes are shuffled, grouping the exponent bytes together.
+    :param data: Array (steps, N) of the states
+    :param dtype: The floating point type the states are downcast to without an error bound
+    :param error_bound: Maximal absolute error of the decoded states
+    :return: The encoded array
+    """
+    if error_bound is not None:
+        quantized = np.round(np.asarray(data, dtype=float) / (2 * error_bound)).astype(np.int64)
+        deltas = np.diff(quantized, axis=0, prepend=0)
+        for integer_type in [np.int8, np.int16, np.int32]:
+            info = np.iinfo(integer_type)
+            if np.size(deltas) == 0 or (np.min(deltas) >= info.min and np.max(deltas) <= info.max):
+                return deltas.astype(integer_type)
+        return deltas
+    values = np.ascontiguousarray(data, dtype=dtype)
+    return values.view(np.uint8).reshape(np.shape(values) + (values.itemsize,)).transpose(2, 0, 1).copy()
+
+
+def decode_chunk(encoded, dtype=np.float64, error_bound=None):
+    """
+    Decodes a chunk encoded by encode_chunk
+    :param encoded: The encoded array
+    :param dtype: The floating point type the states were downcast to
+    :param error_bound: The error bound the states were quantized with
+    :return: Array (steps, N) of the states
+    """
+    if error_bound is not None:
+        return np.cumsum(encoded.astype(np.int64), axis=0) * (2 * error_bound)
+    return np.ascontiguousarray(encoded.transpose(1, 2, 0)).view(dtype)[:, :, 0]
+
+
+def _write_header(path, header):
+    """
+    Writes the header atomically
+    :param path: The directory of the store
+    :param header: The header dictionary
+    """
+    temporary = os.path.join(path, HEADER_FILE + '.tmp')
+    with open(temporary, 'w') as file:
+        json.dump(header, file)
+    os.replace(temporary, os.path.join(path, HEADER_FILE))
@@ -512,7 +512,7 @@ def visualize_Gauss_Legendre_2d():
         xc = np.array([[x], [y]])
         x0 = np.array([[v0_coord[0]], [v0_coord[1]]])
         x_new = j.dot(xc) + x0
-        return np.asscalar(np.log(x_new[0]+x_new[1])) * np.abs(det)
+        return np.log(x_new[0]+x_new[1]).item() * np.abs(det)
     
     p1_ref = P1ReferenceElement()
     atraf = AffineTransformation()